@@ -6,27 +6,14 @@ import random
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'config.settings')
 django.setup()
 
-from core.models import Listing
-
-# Sample amenities to choose from
-AMENITIES_POOL = [
-    "WiFi",
-    "Parking",
-    "Swimming Pool",
-    "Gym",
-    "Air Conditioning",
-    "24/7 Security",
-    "Power Backup",
-    "Balcony",
-    "Furnished",
-    "Kitchen",
-    "TV",
-    "Washing Machine"
-]
+from core.benchmarking import AMENITY_NAMES as AMENITIES_POOL
+from core.models import Amenity, Listing
 
 print("--- Populating Amenities for Listings ---")
 
-listings = Listing.objects.all()
+amenities = [Amenity.objects.get_or_create(name=name)[0] for name in AMENITIES_POOL]
+
+listings = Listing.objects.prefetch_related('amenities')
 count = listings.count()
 print(f"Found {count} listings.")
 
@@ -35,15 +22,15 @@ if count == 0:
 else:
     for listing in listings:
         # Check if amenities are already set
-        if not listing.amenities:
+        current = [amenity.name for amenity in listing.amenities.all()]
+        if not current:
             # Pick 3-6 random amenities
             num_amenities = random.randint(3, 6)
-            selected_amenities = random.sample(AMENITIES_POOL, num_amenities)
+            selected_amenities = random.sample(amenities, num_amenities)
             
-            listing.amenities = selected_amenities
-            listing.save()
-            print(f"Added amenities to '{listing.lodge_name}': {selected_amenities}")
+            listing.amenities.set(selected_amenities)
+            print(f"Added amenities to '{listing.lodge_name}': {[a.name for a in selected_amenities]}")
         else:
-            print(f"Listing '{listing.lodge_name}' already has amenities: {listing.amenities}")
+            print(f"Listing '{listing.lodge_name}' already has amenities: {current}")
 
 print("--- Done ---")
@@ -0,0 +1,59 @@
+"""
+gunicorn profile for the WSGI deployment:
+
+    gunicorn config.wsgi:application -c config/gunicorn.py
+
+Each worker warms itself (core.warmup) after loading the application and
+before accepting connections, so requests only reach warm workers. Point
+the load balancer's health check at /readyz/.
+"""
+import os
+import shutil
+
+# Imported up front: child_exit runs in the master's SIGCHLD handler
+from core.metrics import archive_worker
+
+bind = f"0.0.0.0:{os.environ.get('PORT', '8000')}"
+workers = int(os.environ.get('WEB_CONCURRENCY', 2))
+worker_class = 'gthread'
+threads = int(os.environ.get('GUNICORN_THREADS', 4))
+
+timeout = 30
+graceful_timeout = 30
+keepalive = 5
+
+# Recycle workers now and then to cap memory growth
+max_requests = 2000
+max_requests_jitter = 200
+
+accesslog = '-'
+
+# Where workers share their request metrics (core.metrics, /metrics)
+METRICS_DIR = os.environ.setdefault('METRICS_DIR', '/tmp/bookit-metrics')
+
+# Set WARMUP_ON_START=False to skip the warm-up (e.g. in development)
+WARMUP_ON_START = os.environ.get('WARMUP_ON_START', 'True') == 'True'
+
+
+def post_worker_init(worker):
+    if WARMUP_ON_START:
+        from core.warmup import warm_up
+
+        state = warm_up(worker.wsgi)
+        worker.log.info('Worker %s warm: %s', worker.pid, state['steps'])
+
+
+def on_starting(server):
+    # Per-worker metrics files from a previous run would be counted again
+    shutil.rmtree(METRICS_DIR, ignore_errors=True)
+
+
+def worker_exit(server, worker):
+    # Workers leave through os._exit, skipping the registry's atexit flush
+    from core.metrics import get_registry
+
+    get_registry().flush()
+
+
+def child_exit(server, worker):
+    archive_worker(METRICS_DIR, worker.pid)
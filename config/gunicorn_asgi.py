@@ -0,0 +1,71 @@
+"""
+gunicorn profile for the ASGI deployment (uvicorn workers):
+
+    gunicorn config.asgi:application -c config/gunicorn_asgi.py
+
+or, without gunicorn supervising the workers:
+
+    ASYNC_LISTING_READS=True DB_CONN_MAX_AGE=0 uvicorn config.asgi:application --workers 2
+
+Listing reads are served by the async views in core.async_views; everything
+else runs in each worker's thread pool exactly as under WSGI. Workers warm
+up before accepting connections, as in config/gunicorn.py. uvicorn speaks
+WebSocket (the /api/listings/stream/ feed) only with the websockets package
+installed, which requirements.txt pins.
+"""
+import os
+import shutil
+
+# Imported up front: child_exit runs in the master's SIGCHLD handler
+from core.metrics import archive_worker
+
+# Read in the workers when they import the settings
+os.environ.setdefault('ASYNC_LISTING_READS', 'True')
+# Persistent connections are tied to a thread and leak under ASGI; without
+# the psycopg pool (DB_POOL) every request opens its own connection.
+os.environ.setdefault('DB_CONN_MAX_AGE', '0')
+
+bind = f"0.0.0.0:{os.environ.get('PORT', '8000')}"
+workers = int(os.environ.get('WEB_CONCURRENCY', 2))
+worker_class = 'uvicorn_worker.UvicornWorker'
+
+timeout = 30
+graceful_timeout = 30
+keepalive = 5
+
+# Recycle workers now and then to cap memory growth
+max_requests = 2000
+max_requests_jitter = 200
+
+accesslog = '-'
+
+# Where workers share their request metrics (core.metrics, /metrics)
+METRICS_DIR = os.environ.setdefault('METRICS_DIR', '/tmp/bookit-metrics')
+
+# Set WARMUP_ON_START=False to skip the warm-up (e.g. in development)
+WARMUP_ON_START = os.environ.get('WARMUP_ON_START', 'True') == 'True'
+
+
+def post_worker_init(worker):
+    if WARMUP_ON_START:
+        from core.warmup import warm_up
+
+        # worker.wsgi is the ASGI app here; warm through a WSGI handler
+        state = warm_up()
+        worker.log.info('Worker %s warm: %s', worker.pid, state['steps'])
+
+
+def on_starting(server):
+    # Per-worker metrics files from a previous run would be counted again
+    shutil.rmtree(METRICS_DIR, ignore_errors=True)
+
+
+def worker_exit(server, worker):
+    # Workers leave through os._exit, skipping the registry's atexit flush
+    from core.metrics import get_registry
+
+    get_registry().flush()
+
+
+def child_exit(server, worker):
+    archive_worker(METRICS_DIR, worker.pid)
@@ -13,8 +13,6 @@ https://docs.djangoproject.com/en/5.2/ref/settings/
 import os
 from pathlib import Path
 import environ
-import dj_database_url
-import cloudinary
 import datetime
 
 BASE_DIR = Path(__file__).resolve().parent.parent
@@ -71,9 +69,12 @@ SITE_ID = 1
 AUTH_USER_MODEL = 'core.User'
 
 MIDDLEWARE = [
+    'core.middleware.MetricsMiddleware',
+    'core.middleware.ProfilingMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'whitenoise.middleware.WhiteNoiseMiddleware',
     'corsheaders.middleware.CorsMiddleware',
+    'core.middleware.LoadSheddingMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
@@ -83,8 +84,139 @@ MIDDLEWARE = [
     'allauth.account.middleware.AccountMiddleware',
 ]
 
+# Stateless JWT API routes skip sessions, CSRF, messages, allauth and
+# X-Frame-Options (see core.handlers). Auth and schema UI routes still need
+# the full chain for allauth/session state and templates.
+LEAN_MIDDLEWARE_ENABLED = env.bool('LEAN_MIDDLEWARE_ENABLED', default=True)
+LEAN_MIDDLEWARE_PATHS = ['/api/', '/healthz/', '/readyz/', '/metrics']
+LEAN_MIDDLEWARE_EXCLUDE = [
+    '/api/auth/',
+    '/api/schema/swagger-ui/',
+    '/api/schema/redoc/',
+]
+LEAN_MIDDLEWARE = [
+    'core.middleware.MetricsMiddleware',
+    'core.middleware.ProfilingMiddleware',
+    'django.middleware.security.SecurityMiddleware',
+    'whitenoise.middleware.WhiteNoiseMiddleware',
+    'corsheaders.middleware.CorsMiddleware',
+    'core.middleware.LoadSheddingMiddleware',
+    'django.middleware.common.CommonMiddleware',
+]
+
+# Shed load with 503 + Retry-After before a worker's queue grows unbounded.
+# MAX_IN_FLIGHT applies to threaded/ASGI workers; MAX_QUEUE_SECONDS needs the
+# proxy to send a request-start header (X-Request-Start: t=<epoch>).
+LOAD_SHEDDING = {
+    'MAX_IN_FLIGHT': env.int('LOAD_SHEDDING_MAX_IN_FLIGHT', default=None),
+    'MAX_QUEUE_SECONDS': env.float('LOAD_SHEDDING_MAX_QUEUE_SECONDS', default=None),
+    'QUEUE_HEADER': 'HTTP_X_REQUEST_START',
+    'RETRY_AFTER': 5,
+    # Probes must keep answering while the worker sheds traffic
+    'EXEMPT_PATHS': ['/healthz/', '/readyz/', '/metrics'],
+}
+
+# Request timings: Server-Timing header plus per-route Prometheus metrics at
+# /metrics (see core.metrics). Workers flush to DIRECTORY so any of them can
+# report for the whole host; without one each process reports only itself.
+METRICS = {
+    'SERVER_TIMING': env.bool('METRICS_SERVER_TIMING', default=True),
+    'DIRECTORY': env('METRICS_DIR', default=None if DEBUG else '/tmp/bookit-metrics'),
+    'FLUSH_SECONDS': 5,
+    # When set, /metrics requires "Authorization: Bearer <token>"; when not,
+    # it answers only DEBUG servers and direct requests from private addresses
+    'TOKEN': env('METRICS_TOKEN', default=None),
+}
+
+# Opt-in request profiling (core.profiling): cProfile on 1 in SAMPLE_EVERY
+# requests under PATHS, and a stack sampler keeping any that take longer
+# than SLOW_MS. The newest KEEP captures stay in DIRECTORY; staff browse them
+# at /api/profiles/ or with manage.py profiles.
+PROFILING = {
+    'ENABLED': env.bool('PROFILING_ENABLED', default=False),
+    'PATHS': ['/api/listings/'],
+    'SAMPLE_EVERY': env.int('PROFILING_SAMPLE_EVERY', default=100),
+    'SLOW_MS': env.int('PROFILING_SLOW_MS', default=1000),
+    'SAMPLE_INTERVAL_MS': 5,
+    'TRACEMALLOC': True,
+    'DIRECTORY': env('PROFILING_DIR', default=str(BASE_DIR / 'profiles') if DEBUG else '/tmp/bookit-profiles'),
+    'KEEP': env.int('PROFILING_KEEP', default=200),
+}
+
 ROOT_URLCONF = 'config.urls'
 
+# Serve listing reads from async views (core.async_views). Only turn this on
+# under ASGI (config/gunicorn_asgi.py sets it); under WSGI every async view
+# call spins up an event loop and is slower than the sync view.
+ASYNC_LISTING_READS = env.bool('ASYNC_LISTING_READS', default=False)
+
+# Answer listing list queries from an index held by each worker (see
+# core.listingindex) instead of the database. It loads at warm-up and
+# catches up with listing_search every REFRESH_SECONDS; OVERLAP_SECONDS
+# re-reads recent changes in case a slow transaction committed late, and
+# FULL_RELOAD_SECONDS bounds any drift. Keep ListingDeletion entries longer
+# than that (manage.py listing_search prune --days).
+LISTING_INDEX = {
+    'ENABLED': env.bool('LISTING_INDEX', default=False),
+    'REFRESH_SECONDS': env.float('LISTING_INDEX_REFRESH_SECONDS', default=2),
+    'OVERLAP_SECONDS': 30,
+    'FULL_RELOAD_SECONDS': 3600,
+}
+
+# Delta sync at /api/listings/changes/ (see core.changes). Changes are held
+# back SETTLE_SECONDS so transactions still committing are not skipped.
+# Deletion tombstones are kept RETENTION_DAYS (manage.py listing_search
+# prune); clients with an older sync token must download everything again.
+LISTING_CHANGES = {
+    'PAGE_SIZE': 100,
+    'MAX_PAGE_SIZE': 500,
+    'SETTLE_SECONDS': env.float('LISTING_CHANGES_SETTLE_SECONDS', default=5),
+    'RETENTION_DAYS': env.int('LISTING_DELETION_RETENTION_DAYS', default=7),
+}
+
+# Opt-in pages for GET /api/listings/ (?page=, ?page_size=; see
+# core.pagination). COUNT is how totals are found unless ?count= says
+# otherwise: auto counts exactly up to EXACT_COUNT_LIMIT rows, then uses the
+# cached count for the same filters or the planner's estimate.
+LISTING_PAGINATION = {
+    'PAGE_SIZE': 20,
+    'MAX_PAGE_SIZE': 100,
+    'COUNT': env('LISTING_COUNT', default='auto'),
+    'EXACT_COUNT_LIMIT': env.int('LISTING_EXACT_COUNT_LIMIT', default=1000),
+    'COUNT_CACHE_SECONDS': 300,
+}
+
+# Most listings one /api/listings/batch/ request may ask for
+LISTING_BATCH_MAX_IDS = env.int('LISTING_BATCH_MAX_IDS', default=100)
+
+# Push feed at /api/listings/stream/ (SSE or WebSocket, ASGI only; see
+# core.feed). TRANSPORT finds out what changed: DatabaseTransport polls every
+# POLL_SECONDS; RedisTransport (needs the redis package and REDIS_URL) gets
+# the ids writers publish; LocalTransport only sees its own process.
+LISTING_FEED = {
+    'TRANSPORT': env('LISTING_FEED_TRANSPORT', default='core.feed.DatabaseTransport'),
+    'POLL_SECONDS': env.float('LISTING_FEED_POLL_SECONDS', default=1),
+    'OVERLAP_SECONDS': 30,
+    'REDIS_URL': env('REDIS_URL', default=None),
+    # Events a subscriber may fall behind by before it is told to resync
+    'QUEUE_SIZE': 100,
+    'KEEPALIVE_SECONDS': 20,
+    # Per worker
+    'MAX_SUBSCRIBERS': env.int('LISTING_FEED_MAX_SUBSCRIBERS', default=10000),
+}
+
+# Transactional outbox of listing changes (core.outbox), written in the same
+# transaction as each change and read by offset with outbox.Consumer.
+# Consumers only see events SETTLE_SECONDS old, so ids still committing are
+# not skipped. ``manage.py outbox compact`` drops superseded events, and
+# deletion events after RETENTION_DAYS.
+LISTING_OUTBOX = {
+    'ENABLED': env.bool('LISTING_OUTBOX', default=True),
+    'BATCH_SIZE': 500,
+    'SETTLE_SECONDS': env.float('LISTING_OUTBOX_SETTLE_SECONDS', default=5),
+    'RETENTION_DAYS': env.int('LISTING_OUTBOX_RETENTION_DAYS', default=30),
+}
+
 TEMPLATES = [
     {
         'BACKEND': 'django.template.backends.django.DjangoTemplates',
@@ -116,29 +248,169 @@ if DEBUG:
         }
     }
 else:
+    import dj_database_url
+
     DATABASES = {
-        'default': dj_database_url.config(default=env('DATABASE_URL'))
+        'default': dj_database_url.config(
+            default=env('DATABASE_URL'),
+            conn_max_age=env.int('DB_CONN_MAX_AGE', default=600),
+            conn_health_checks=True,
+        )
     }
 
+    # Bounded connection pool per worker (psycopg 3 only). The Postgres
+    # connection cap, minus connections reserved for admin/migrations, is
+    # split evenly across gunicorn workers; threads in a worker share its pool.
+    if env.bool('DB_POOL', default=True) and DATABASES['default']['ENGINE'].endswith('postgresql'):
+        from importlib.util import find_spec
+
+        if find_spec('psycopg_pool'):
+            from psycopg_pool import ConnectionPool
+
+            db_max_connections = env.int('DB_MAX_CONNECTIONS', default=20)
+            db_reserved_connections = env.int('DB_RESERVED_CONNECTIONS', default=3)
+            web_concurrency = env.int('WEB_CONCURRENCY', default=2)
+            db_pool_max_size = env.int(
+                'DB_POOL_MAX_SIZE',
+                default=max(1, (db_max_connections - db_reserved_connections) // web_concurrency),
+            )
+            DATABASES['default']['OPTIONS'] = {
+                **DATABASES['default'].get('OPTIONS', {}),
+                'pool': {
+                    'min_size': min(env.int('DB_POOL_MIN_SIZE', default=1), db_pool_max_size),
+                    'max_size': db_pool_max_size,
+                    'timeout': env.float('DB_POOL_TIMEOUT', default=10),
+                    'max_idle': env.float('DB_POOL_MAX_IDLE', default=300),
+                    # Validate connections when they are handed out
+                    'check': ConnectionPool.check_connection,
+                },
+            }
+            # Pooled connections are returned to the pool after each request
+            DATABASES['default']['CONN_MAX_AGE'] = 0
+
+# Read replicas for the listing read path (see core.routers). Works with any
+# backend, e.g. DATABASE_REPLICA_URLS=sqlite:////tmp/replica.sqlite3 locally.
+DATABASE_REPLICAS = []
+for index, replica_url in enumerate(env.list('DATABASE_REPLICA_URLS', default=[])):
+    import dj_database_url
+
+    alias = f'replica_{index + 1}'
+    DATABASES[alias] = dj_database_url.parse(
+        replica_url,
+        conn_max_age=env.int('DB_CONN_MAX_AGE', default=600),
+        conn_health_checks=True,
+    )
+    # Tests run against the primary only
+    DATABASES[alias]['TEST'] = {'MIRROR': 'default'}
+    DATABASE_REPLICAS.append(alias)
+
+# SQLite profile: WAL, synchronous=NORMAL, mmap/cache/temp_store pragmas and
+# BEGIN IMMEDIATE writes (see core.sqlite). Applies to DEBUG and to single-box
+# deployments with DATABASE_URL=sqlite:///...
+if env.bool('SQLITE_TUNED', default=True):
+    from core.sqlite import sqlite_options
+
+    for database in DATABASES.values():
+        if database['ENGINE'] == 'django.db.backends.sqlite3':
+            database['OPTIONS'] = {
+                **database.get('OPTIONS', {}),
+                **sqlite_options(timeout=database.get('OPTIONS', {}).get('timeout', 20)),
+            }
+
+DATABASE_ROUTERS = ['core.routers.ReplicaRouter']
+REPLICA_MAX_LAG_SECONDS = env.float('REPLICA_MAX_LAG_SECONDS', default=5)
+REPLICA_LAG_CHECK_INTERVAL = env.float('REPLICA_LAG_CHECK_INTERVAL', default=5)
+# Must exceed the tolerated lag so a writer never reads a stale replica
+REPLICA_PIN_SECONDS = env.float('REPLICA_PIN_SECONDS', default=REPLICA_MAX_LAG_SECONDS + 5)
+
+# Cache
+# Shared tier behind core.cache.TieredCache. File-based by default so every
+# gunicorn worker on the box shares it; set CACHE_BACKEND=redis and REDIS_URL
+# (requires the redis package) for multi-host deployments. Local memory in
+# DEBUG so tests run without external services.
+CACHE_BACKEND = env('CACHE_BACKEND', default='locmem' if DEBUG else 'file')
+if CACHE_BACKEND == 'redis':
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': env('REDIS_URL'),
+        }
+    }
+elif CACHE_BACKEND == 'file':
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+            'LOCATION': env('CACHE_DIR', default=str(BASE_DIR / '.cache')),
+            'OPTIONS': {'MAX_ENTRIES': 10000},
+        }
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        }
+    }
+
+# Per-process LRU tier (see core.cache)
+TIERED_CACHE = {
+    'CACHE_ALIAS': 'default',
+    'LOCAL_SIZE': env.int('TIERED_CACHE_LOCAL_SIZE', default=2048),
+    'LOCAL_TTL': 30,
+    'TAG_TTL': 5,
+    'TIMEOUT': 300,
+    'NEGATIVE_TIMEOUT': 30,
+}
+
 # REST Framework
 REST_FRAMEWORK = {
     'DEFAULT_SCHEMA_CLASS': 'drf_spectacular.openapi.AutoSchema',
     'DEFAULT_AUTHENTICATION_CLASSES': [
-        'rest_framework_simplejwt.authentication.JWTAuthentication',
+        'core.authentication.StatelessJWTAuthentication',
         'rest_framework.authentication.SessionAuthentication',  # Added for dj-rest-auth
         'rest_framework.authentication.TokenAuthentication',    # Added for compatibility
     ],
     'DEFAULT_PERMISSION_CLASSES': [
         'rest_framework.permissions.IsAuthenticatedOrReadOnly',
     ],
+    'DEFAULT_THROTTLE_CLASSES': [
+        'core.throttling.UserWriteThrottle',
+    ],
+    'DEFAULT_THROTTLE_RATES': {
+        'listing_read_anon': env('THROTTLE_LISTING_READ_ANON', default='120/min'),
+        'user_write': env('THROTTLE_USER_WRITE', default='30/min'),
+        'login': env('THROTTLE_LOGIN', default='5/min'),
+    },
+    # Proxies in front of the app (Render's load balancer is one). Throttles
+    # key on the client address that many hops back in X-Forwarded-For; the
+    # client can write anything further left. 0 when clients connect directly.
+    'NUM_PROXIES': env.int('NUM_PROXIES', default=1),
+}
+
+# Where token buckets live: 'local' (per process), 'shared' (memory-mapped
+# file shared by all workers on the host) or 'cache' (Django cache alias).
+THROTTLE_BUCKET_STORE = {
+    'BACKEND': env('THROTTLE_BUCKET_BACKEND', default='local'),
+    'PATH': env('THROTTLE_BUCKET_PATH', default='/tmp/bookit-throttle.buckets'),
+    'SLOTS': 65536,
+    'CACHE_ALIAS': 'default',
 }
 
 SIMPLE_JWT = {
     'ACCESS_TOKEN_LIFETIME': datetime.timedelta(minutes=15),
     'REFRESH_TOKEN_LIFETIME': datetime.timedelta(days=1),
     'AUTH_HEADER_TYPES': ('Bearer',),
+    # Tokens embed is_agent/is_staff/agency_name/token_version claims
+    'TOKEN_OBTAIN_SERIALIZER': 'core.serializers.ClaimsTokenObtainPairSerializer',
+    'TOKEN_USER_CLASS': 'core.authentication.ClaimsUser',
 }
 
+# Seconds a resolved user / token version may be served from cache. A
+# revocation (token_version bump) is written through to CACHES['default'], so
+# with the shared file or Redis cache every worker sees it on its next
+# request. With CACHE_BACKEND=locmem each worker has its own copy, and other
+# workers keep accepting a revoked token for up to this long.
+JWT_USER_CACHE_TTL = env.int('JWT_USER_CACHE_TTL', default=60)
+
 # Spectacular settings
 SPECTACULAR_SETTINGS = {
     'TITLE': 'BookIt API',
@@ -147,6 +419,10 @@ SPECTACULAR_SETTINGS = {
     'SERVE_INCLUDE_SCHEMA': False,
 }
 
+# Written by `manage.py generate_schema` at deploy and served from memory at
+# /api/schema/ (see core.schema); regenerated when the code changes.
+OPENAPI_SCHEMA_FILE = env('OPENAPI_SCHEMA_FILE', default=str(BASE_DIR / 'openapi-schema.json'))
+
 # ==================== ALLAUTH & DJ-REST-AUTH CONFIGURATION ====================
 
 # Authentication backends
@@ -221,6 +497,7 @@ LOGOUT_REDIRECT_URL = f'{FRONTEND_URL}/'
 # ==================== DJ-REST-AUTH SETTINGS ====================
 REST_AUTH = {
     'USE_JWT': True,
+    'JWT_TOKEN_CLAIMS_SERIALIZER': 'core.serializers.ClaimsTokenObtainPairSerializer',
     'JWT_AUTH_HTTPONLY': False,
     'JWT_AUTH_RETURN_EXPIRATION': True,
     'REGISTER_SERIALIZER': 'core.serializers.UserRegistrationSerializer',
@@ -303,6 +580,11 @@ else:
     STATICFILES_STORAGE = 'whitenoise.storage.CompressedManifestStaticFilesStorage'
     DEFAULT_FILE_STORAGE = 'cloudinary_storage.storage.MediaCloudinaryStorage'
 
+# Swap Cloudinary uploads for a local stand-in (core.fake_uploads), e.g. for
+# load tests; FAKE_MEDIA_UPLOAD_MS simulates the upload's round trip.
+FAKE_MEDIA_UPLOADS = env.bool('FAKE_MEDIA_UPLOADS', default=False)
+FAKE_MEDIA_UPLOAD_MS = env.float('FAKE_MEDIA_UPLOAD_MS', default=0)
+
 # CORS settings
 CORS_ALLOW_ALL_ORIGINS = True  
 CORS_ALLOW_CREDENTIALS = True
@@ -382,7 +664,17 @@ SOCIALACCOUNT_PROVIDERS = {
             'access_type': 'online',
         },
         'OAUTH_PKCE_ENABLED': True,
+        # Overridable so logins can be exercised against a local fake server
+        'AUTHORIZE_URL': env('GOOGLE_AUTHORIZE_URL', default='https://accounts.google.com/o/oauth2/v2/auth'),
+        'ACCESS_TOKEN_URL': env('GOOGLE_ACCESS_TOKEN_URL', default='https://oauth2.googleapis.com/token'),
+        'IDENTITY_URL': env('GOOGLE_IDENTITY_URL', default='https://www.googleapis.com/oauth2/v2/userinfo'),
+        'CERTS_URL': env('GOOGLE_CERTS_URL', default='https://www.googleapis.com/oauth2/v1/certs'),
+        'ID_TOKEN_ISSUER': env('GOOGLE_ID_TOKEN_ISSUER', default='https://accounts.google.com'),
     }
 }
+
+# Seconds SocialApp rows and Google signing certificates stay cached
+# (refreshed in the background after 80% of this)
+OAUTH_CACHE_TTL = env.int('OAUTH_CACHE_TTL', default=3600)
 SOCIALACCOUNT_ADAPTER = 'core.adapters.CustomSocialAccountAdapter'
 SOCIALACCOUNT_CALLBACK_URL = env('FRONTEND_URL', default='http://localhost:5500')
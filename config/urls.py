@@ -16,25 +16,36 @@ Including another URLconf
 """
 from django.contrib import admin
 from django.urls import path, include, re_path  
-from drf_spectacular.views import SpectacularAPIView, SpectacularRedocView, SpectacularSwaggerView
 from core.views import CustomRegisterView
 from rest_framework_simplejwt.views import TokenObtainPairView, TokenRefreshView
 from dj_rest_auth.registration.views import ResendEmailVerificationView, VerifyEmailView
 from django.views.generic import TemplateView
 from core.views import GoogleLogin
+from core.lazy import lazy_view
+from core.schema import schema_view
+from core.warmup import healthz, readyz
+from core.metrics import metrics_view
+from core.throttling import LoginThrottle
+from dj_rest_auth.views import LoginView
 
 urlpatterns = [
     # Admin
     path('admin/', admin.site.urls),
+
+    # Liveness and readiness probes
+    path('healthz/', healthz, name='healthz'),
+    path('readyz/', readyz, name='readyz'),
+    path('metrics', metrics_view, name='metrics'),
     
     # Core app URLs
     path('api/', include('core.urls')),
     
     # JWT Authentication
-    path('api/token/', TokenObtainPairView.as_view(), name='token_obtain_pair'),
+    path('api/token/', TokenObtainPairView.as_view(throttle_classes=[LoginThrottle]), name='token_obtain_pair'),
     path('api/token/refresh/', TokenRefreshView.as_view(), name='token_refresh'),
     
-    # dj-rest-auth endpoints
+    # dj-rest-auth endpoints (login first so it picks up the strict throttle)
+    path('api/auth/login/', LoginView.as_view(throttle_classes=[LoginThrottle]), name='rest_login'),
     path('api/auth/', include('dj_rest_auth.urls')),
 
     re_path(
@@ -56,8 +67,9 @@ urlpatterns = [
     path('api/auth/registration/verify-email/', VerifyEmailView.as_view(), name='rest_verify_email'),
     path('api/auth/registration/resend-email/', ResendEmailVerificationView.as_view(), name='rest_resend_email'),
     
-    # API Documentation
-    path('api/schema/', SpectacularAPIView.as_view(), name='schema'),
-    path('api/schema/swagger-ui/', SpectacularSwaggerView.as_view(url_name='schema'), name='swagger-ui'),
-    path('api/schema/redoc/', SpectacularRedocView.as_view(url_name='schema'), name='redoc'),
+    # API Documentation (precomputed schema; drf-spectacular's UI views load
+    # on the first docs request)
+    path('api/schema/', schema_view, name='schema'),
+    path('api/schema/swagger-ui/', lazy_view('drf_spectacular.views.SpectacularSwaggerView', url_name='schema'), name='swagger-ui'),
+    path('api/schema/redoc/', lazy_view('drf_spectacular.views.SpectacularRedocView', url_name='schema'), name='redoc'),
 ]
\ No newline at end of file
@@ -8,23 +8,51 @@ from allauth.account.utils import perform_login
 from allauth.exceptions import ImmediateHttpResponse
 from django.http import HttpResponseRedirect
 from django.urls import reverse
+from django.contrib.sites.shortcuts import get_current_site
+from django.db.models import Q
+from allauth.socialaccount.providers.google.views import CERTS_URL
+from .oauth import CachingSession, social_apps
 
 class CustomSocialAccountAdapter(DefaultSocialAccountAdapter):
     def pre_social_login(self, request, sociallogin):
         # Auto connect social account to existing user with same email
         user = sociallogin.user
-        if user.id:
+        if user.id or not user.email:
             return
         
-        try:
-            # Check if user with same email exists
-            from django.contrib.auth import get_user_model
-            User = get_user_model()
-            existing_user = User.objects.get(email=user.email)
+        # One query matching either the account email or any address the
+        # user has verified; an unverified address proves nothing about who
+        # owns it, so it must not hand over the account
+        from django.contrib.auth import get_user_model
+        User = get_user_model()
+        existing_user = (
+            User.objects
+            .filter(
+                Q(email__iexact=user.email)
+                | Q(emailaddress__email__iexact=user.email, emailaddress__verified=True)
+            )
+            .order_by('pk')
+            .first()
+        )
+        if existing_user:
             # Connect social account to existing user
             sociallogin.connect(request, existing_user)
-        except User.DoesNotExist:
-            pass
+
+    def list_apps(self, request, provider=None, client_id=None):
+        """
+        Cache SocialApp lookups per site/provider/client; rows are refreshed in
+        the background and dropped when a SocialApp is saved or deleted.
+        """
+        site_id = get_current_site(request).pk if request else None
+        key = (site_id, provider, client_id)
+        apps = social_apps.get(
+            key, lambda: super(CustomSocialAccountAdapter, self).list_apps(request, provider, client_id)
+        )
+        return list(apps)
+
+    def get_requests_session(self):
+        # Google's signing certificates are served from cache
+        return CachingSession(super().get_requests_session(), [CERTS_URL])
 
 class CustomAccountAdapter(DefaultAccountAdapter):
     """
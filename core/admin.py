@@ -1,5 +1,6 @@
 # account/admin.py
 from django.contrib import admin
+from django.db.models import Count
 from django.contrib.auth.admin import UserAdmin as BaseUserAdmin
 from django.utils.html import format_html
 from .models import User, Listing, ListingImage, Amenity
@@ -51,6 +52,9 @@ class AmenityAdmin(admin.ModelAdmin):
         }),
     )
     readonly_fields = ['listing_count']
+
+    def get_queryset(self, request):
+        return super().get_queryset(request).annotate(listings_total=Count('listings'))
     
     def icon_preview(self, obj):
         if obj.icon:
@@ -70,7 +74,7 @@ class AmenityAdmin(admin.ModelAdmin):
     description_preview.short_description = "Description"
     
     def listing_count(self, obj):
-        return obj.listings.count()
+        return obj.listings_total
     listing_count.short_description = "Used in Listings"
 
 @admin.register(Listing)
@@ -193,6 +197,7 @@ class ListingImageAdmin(admin.ModelAdmin):
     readonly_fields = ['uploaded_at', 'image_preview_large']
     list_editable = ['is_primary']
     raw_id_fields = ['listing']
+    list_select_related = ['listing']
     
     def listing_display(self, obj):
         return f"{obj.listing.lodge_name} - {obj.listing.room_number or 'No number'}"
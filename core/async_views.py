@@ -0,0 +1,122 @@
+# core/async_views.py
+"""
+Async read path for the listing endpoints, wired in by core/urls.py when
+ASYNC_LISTING_READS is on (only worth it under ASGI, see config/gunicorn_asgi.py).
+
+GET/HEAD run the sync view's authentication, permission, throttle and filter
+logic in one short thread hop (none of it waits on the network), then load
+the rows with the async ORM and render JSON on the event loop. While a
+request waits on the database the worker keeps serving others.
+
+Every other method is handed to the sync DRF view in a worker thread, so
+writes, and the blocking Cloudinary uploads and SendGrid mail that come with
+them, never run on the event loop.
+"""
+from asgiref.sync import sync_to_async
+from django.http import Http404
+from django.views.decorators.csrf import csrf_exempt
+from rest_framework.renderers import JSONRenderer
+from rest_framework.response import Response
+
+from .cache import get_amenity_catalogue
+from .metrics import timed
+from .models import Listing
+from .routers import replica_reads
+from .views import ListingDetailView, ListingListCreateView
+
+READ_METHODS = ('GET', 'HEAD')
+
+# Rows fetched per round trip; prefetches run once per chunk
+LIST_CHUNK_SIZE = 200
+
+
+def _prepare(view, request):
+    """
+    DRF's checks for the request, then the filtered queryset (not evaluated),
+    or the rows themselves when the view's in-memory index has them.
+    """
+    view.initial(request, *view.args, **view.kwargs)
+    indexed_rows = getattr(view, 'indexed_rows', None)
+    if indexed_rows is not None and (rows := indexed_rows()) is not None:
+        return rows
+    return view.filter_queryset(view.get_queryset())
+
+
+def _prepare_list(view, request):
+    # Cards show amenities from the catalogue, which may take a query
+    view.amenity_catalogue = get_amenity_catalogue()
+    return _prepare(view, request)
+
+
+def _serializer(view, rows):
+    """The view's list serializer, run on the event loop: no queries."""
+    context = view.get_serializer_context()
+    context['amenity_catalogue'] = view.amenity_catalogue
+    return view.get_serializer(rows, many=True, context=context)
+
+
+async def _list(view, queryset):
+    if view.paginator is not None and view.paginator.get_page_size(view.request):
+        # A page and its count are a few bounded queries: one thread hop
+        page = await sync_to_async(view.paginate_queryset)(queryset)
+        return view.get_paginated_response(_serializer(view, page).data).data
+    if isinstance(queryset, list):
+        listings = queryset
+    else:
+        listings = [listing async for listing in queryset.aiterator(chunk_size=LIST_CHUNK_SIZE)]
+    return _serializer(view, listings).data
+
+
+async def _retrieve(view, queryset):
+    lookup = view.lookup_url_kwarg or view.lookup_field
+    try:
+        listing = await queryset.aget(**{view.lookup_field: view.kwargs[lookup]})
+    except Listing.DoesNotExist:
+        raise Http404('No Listing matches the given query.')
+    view.check_object_permissions(view.request, listing)
+    return view.get_serializer(listing).data
+
+
+def async_read_view(view_class, read, prepare=_prepare):
+    """
+    Build an async view serving reads with ``read(view, queryset)``, the
+    queryset coming from ``prepare(view, request)`` in a worker thread, and
+    delegating other methods to ``view_class``.
+    """
+    sync_view = sync_to_async(view_class.as_view())
+
+    async def view(request, *args, **kwargs):
+        if request.method not in READ_METHODS:
+            return await sync_view(request, *args, **kwargs)
+
+        # Same steps as APIView.dispatch, JSON only: the browsable API
+        # renders forms, which query the database synchronously.
+        instance = view_class(renderer_classes=[JSONRenderer])
+        instance.setup(request, *args, **kwargs)
+        request = instance.initialize_request(request, *args, **kwargs)
+        instance.request = request
+        instance.headers = instance.default_response_headers
+
+        token = replica_reads.set(False)
+        try:
+            try:
+                # Context variables set in the thread (replica_reads) carry
+                # over to the async queries below.
+                queryset = await sync_to_async(prepare)(instance, request)
+                response = Response(await read(instance, queryset))
+            except Exception as exc:
+                response = instance.handle_exception(exc)
+            response = instance.finalize_response(request, response, *args, **kwargs)
+            with timed('render'):
+                return response.render()
+        finally:
+            replica_reads.reset(token)
+
+    # What DRF's as_view() sets; the schema generator looks for these
+    view.cls = view_class
+    view.initkwargs = {}
+    return csrf_exempt(view)
+
+
+listing_list = async_read_view(ListingListCreateView, _list, _prepare_list)
+listing_detail = async_read_view(ListingDetailView, _retrieve)
@@ -0,0 +1,156 @@
+# core/authentication.py
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.utils.functional import cached_property
+from django.utils.translation import gettext_lazy as _
+from rest_framework import permissions
+from rest_framework_simplejwt.authentication import JWTStatelessUserAuthentication
+from rest_framework_simplejwt.exceptions import AuthenticationFailed, InvalidToken
+from rest_framework_simplejwt.models import TokenUser
+from rest_framework_simplejwt.settings import api_settings as jwt_settings
+
+TOKEN_VERSION_CLAIM = 'token_version'
+
+# Short TTL: a revoked token keeps working for at most this many seconds on
+# workers that have not seen the post_save invalidation.
+USER_CACHE_TTL = getattr(settings, 'JWT_USER_CACHE_TTL', 60)
+
+
+def _token_version_key(user_id):
+    return f'auth:token_version:{user_id}'
+
+
+def _user_key(user_id):
+    return f'auth:user:{user_id}'
+
+
+def add_token_claims(token, user):
+    """
+    Embed the fields IsAgentOrReadOnly and the listing views need, so that
+    requests carrying the token never have to load the user row.
+    """
+    token['is_agent'] = user.is_agent
+    token['is_staff'] = user.is_staff
+    token['agency_name'] = user.agency_name or ''
+    token[TOKEN_VERSION_CLAIM] = user.token_version
+    return token
+
+
+def get_token_version(user_id):
+    """Current token version for a user, served from the cache when possible."""
+    key = _token_version_key(user_id)
+    version = cache.get(key)
+    if version is None:
+        User = get_user_model()
+        version = (
+            User.objects.filter(pk=user_id, is_active=True)
+            .values_list('token_version', flat=True)
+            .first()
+        )
+        # -1 marks deleted/inactive users so repeated requests stay cached
+        version = -1 if version is None else version
+        cache.set(key, version, USER_CACHE_TTL)
+    return version
+
+
+def get_cached_user(user_id):
+    """Full User instance for a token, cached for USER_CACHE_TTL seconds."""
+    key = _user_key(user_id)
+    user = cache.get(key)
+    if user is None:
+        User = get_user_model()
+        user = User.objects.filter(pk=user_id).first()
+        if user is None:
+            return None
+        cache.set(key, user, USER_CACHE_TTL)
+    return user
+
+
+def invalidate_cached_user(user):
+    cache.set_many({_token_version_key(user.pk): user.token_version}, USER_CACHE_TTL)
+    cache.delete(_user_key(user.pk))
+
+
+def forget_cached_user(user_id):
+    cache.delete_many([_token_version_key(user_id), _user_key(user_id)])
+
+
+class ClaimsUser(TokenUser):
+    """
+    Lightweight user built from signed token claims.
+
+    Claims cover everything the listing read path needs (id, is_agent,
+    is_staff, agency_name). Any other attribute falls back to the full model,
+    loaded once through the short-TTL cache.
+    """
+
+    @cached_property
+    def is_agent(self):
+        return self.token.get('is_agent', False)
+
+    @cached_property
+    def agency_name(self):
+        return self.token.get('agency_name', '')
+
+    @cached_property
+    def user(self):
+        user = get_cached_user(self.id)
+        if user is None:
+            raise AuthenticationFailed(_('User not found'), code='user_not_found')
+        return user
+
+    def __getattr__(self, attr):
+        if attr.startswith('_') or attr == 'token':
+            raise AttributeError(attr)
+        if attr in self.token:
+            return self.token[attr]
+        return getattr(self.user, attr)
+
+
+class StatelessJWTAuthentication(JWTStatelessUserAuthentication):
+    """
+    JWT authentication that trusts the claims embedded at token issuance.
+
+    Safe requests to views that set ``stateless_user = True`` get a
+    ``ClaimsUser`` and never touch the users table. Everything else gets the
+    full model from a short-TTL cache. Either way the token version is checked
+    so revoked tokens are rejected.
+    """
+
+    def authenticate(self, request):
+        header = self.get_header(request)
+        if header is None:
+            return None
+
+        raw_token = self.get_raw_token(header)
+        if raw_token is None:
+            return None
+
+        validated_token = self.get_validated_token(raw_token)
+        user_id = self._get_user_id(validated_token)
+        self._check_token_version(validated_token, user_id)
+
+        view = (getattr(request, 'parser_context', None) or {}).get('view')
+        if request.method in permissions.SAFE_METHODS and getattr(view, 'stateless_user', False):
+            return ClaimsUser(validated_token), validated_token
+
+        user = get_cached_user(user_id)
+        if user is None:
+            raise AuthenticationFailed(_('User not found'), code='user_not_found')
+        if not user.is_active:
+            raise AuthenticationFailed(_('User is inactive'), code='user_inactive')
+        return user, validated_token
+
+    def _get_user_id(self, validated_token):
+        try:
+            return validated_token[jwt_settings.USER_ID_CLAIM]
+        except KeyError:
+            raise InvalidToken(_('Token contained no recognizable user identification'))
+
+    def _check_token_version(self, validated_token, user_id):
+        if TOKEN_VERSION_CLAIM not in validated_token:
+            # Issued before claims were embedded; force a fresh login.
+            raise InvalidToken(_('Token is missing required claims'))
+        if validated_token[TOKEN_VERSION_CLAIM] != get_token_version(user_id):
+            raise AuthenticationFailed(_('Token has been revoked'), code='token_revoked')
@@ -0,0 +1,151 @@
+# core/benchmarking.py
+"""Small helpers shared by the bench_* management commands."""
+import asyncio
+import json
+import os
+import platform
+import statistics
+import subprocess
+from datetime import datetime, timezone
+from wsgiref.util import setup_testing_defaults
+
+from django.conf import settings
+
+# Data generated by seed_bench; the email domain marks its users so a reseed
+# or --reset only ever touches benchmark rows.
+BENCH_EMAIL_DOMAIN = 'bench.bookit.test'
+BENCH_AGENT_EMAIL = f'agent-0@{BENCH_EMAIL_DOMAIN}'
+BENCH_PASSWORD = 'bench-password'
+
+AMENITY_NAMES = [
+    'WiFi', 'Parking', 'Swimming Pool', 'Gym', 'Air Conditioning', '24/7 Security',
+    'Power Backup', 'Balcony', 'Furnished', 'Kitchen', 'TV', 'Washing Machine',
+]
+
+
+def percentile(samples, pct):
+    """Nearest-rank percentile of a list of numbers."""
+    if not samples:
+        return None
+    ordered = sorted(samples)
+    rank = max(0, min(len(ordered) - 1, round(pct / 100 * len(ordered) + 0.5) - 1))
+    return ordered[rank]
+
+
+def summarize(samples):
+    """Latency summary in milliseconds for a list of durations in seconds."""
+    if not samples:
+        return {'count': 0}
+    return {
+        'count': len(samples),
+        'mean_ms': statistics.fmean(samples) * 1e3,
+        'p50_ms': percentile(samples, 50) * 1e3,
+        'p95_ms': percentile(samples, 95) * 1e3,
+        'p99_ms': percentile(samples, 99) * 1e3,
+        'max_ms': max(samples) * 1e3,
+    }
+
+
+def format_summary(summary):
+    if not summary.get('count'):
+        return 'no samples'
+    return (
+        f"n={summary['count']:<6} p50={summary['p50_ms']:8.2f}ms "
+        f"p95={summary['p95_ms']:8.2f}ms p99={summary['p99_ms']:8.2f}ms "
+        f"mean={summary['mean_ms']:8.2f}ms"
+    )
+
+
+def wsgi_environ(path, method='GET', host=None, **extra):
+    """A minimal WSGI environ for driving a handler directly."""
+    path, _, query = path.partition('?')
+    environ = {}
+    setup_testing_defaults(environ)
+    environ.update({
+        'PATH_INFO': path,
+        'QUERY_STRING': query,
+        'REQUEST_METHOD': method,
+        'HTTP_HOST': host or default_host(),
+    })
+    environ.update(extra)
+    return environ
+
+
+def asgi_scope(path, method='GET', host=None, headers=()):
+    """A minimal HTTP scope for driving an ASGI application directly."""
+    path, _, query = path.partition('?')
+    return {
+        'type': 'http',
+        'asgi': {'version': '3.0'},
+        'http_version': '1.1',
+        'method': method,
+        'scheme': 'http',
+        'path': path,
+        'raw_path': path.encode(),
+        'query_string': query.encode(),
+        'root_path': '',
+        'headers': [(b'host', (host or default_host()).encode()), *headers],
+        'client': ('127.0.0.1', 50000),
+        'server': ('127.0.0.1', 80),
+    }
+
+
+async def call_asgi(application, scope, body=b''):
+    """Run one request through an ASGI application; returns (status, body)."""
+    received = []
+    sent = False
+
+    async def receive():
+        nonlocal sent
+        if sent:
+            # The client stays connected; Django cancels this wait once the
+            # response is sent (an http.disconnect would abort the request).
+            await asyncio.Event().wait()
+        sent = True
+        return {'type': 'http.request', 'body': body, 'more_body': False}
+
+    async def send(message):
+        received.append(message)
+
+    await application(scope, receive, send)
+    status = next(m['status'] for m in received if m['type'] == 'http.response.start')
+    return status, b''.join(m.get('body', b'') for m in received if m['type'] == 'http.response.body')
+
+
+def default_host():
+    hosts = [h.lstrip('.') for h in settings.ALLOWED_HOSTS if h != '*']
+    return hosts[0] if hosts else 'localhost'
+
+
+def git_revision():
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'],
+            cwd=settings.BASE_DIR, capture_output=True, text=True, check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def write_results(output, name, results, **metadata):
+    """
+    Write benchmark results as JSON, tagged with the git revision, database
+    vendor and timestamp so runs can be compared over time.
+    """
+    from django.db import connection
+
+    document = {
+        'benchmark': name,
+        'timestamp': datetime.now(timezone.utc).isoformat(),
+        'revision': git_revision(),
+        'python': platform.python_version(),
+        'database': connection.vendor,
+        **metadata,
+        'results': results,
+    }
+    directory = os.path.dirname(output)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    with open(output, 'w') as fh:
+        json.dump(document, fh, indent=2, default=str)
+    return document
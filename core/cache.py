@@ -0,0 +1,230 @@
+# core/cache.py
+"""
+Two-tier cache: a bounded per-process LRU in front of the shared Django cache
+(CACHES['default'], file-based or Redis in production, local memory in tests).
+
+Keys can be grouped under tags. Each tag has a version number stored in the
+shared backend; bumping it (see invalidate_tags, wired to model signals in
+core.signals) changes the effective key of every entry under the tag, so old
+entries are never read again and simply expire. Other processes notice a bump
+once their locally cached tag version expires (TIERED_CACHE['TAG_TTL']).
+
+Loaders returning None are cached as a negative result for a shorter time, so
+repeated lookups of missing rows do not reach the database either.
+"""
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.cache import caches
+
+MISSING = object()
+NEGATIVE = '__cached_none__'
+
+
+class LRUCache:
+    """Thread-safe LRU with per-entry expiry and hit/miss/eviction counters."""
+
+    def __init__(self, maxsize):
+        self.maxsize = maxsize
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = self.misses = self.evictions = 0
+
+    def get(self, key, default=MISSING):
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is not None:
+                value, expires = entry
+                if expires > time.monotonic():
+                    self._data.move_to_end(key)
+                    self.hits += 1
+                    return value
+                del self._data[key]
+            self.misses += 1
+            return default
+
+    def set(self, key, value, timeout):
+        with self._lock:
+            self._data[key] = (value, time.monotonic() + timeout)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def delete(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
+
+
+class TieredCache:
+    def __init__(self, alias='default', namespace='bookit', local_size=2048,
+                 local_ttl=30, tag_ttl=5, default_timeout=300, negative_timeout=30):
+        self.alias = alias
+        self.namespace = namespace
+        self.local = LRUCache(local_size)
+        self.tags = LRUCache(1024)
+        self.local_ttl = local_ttl
+        self.tag_ttl = tag_ttl
+        self.default_timeout = default_timeout
+        self.negative_timeout = negative_timeout
+        self.shared_hits = self.negative_hits = self.sets = self.invalidations = 0
+
+    @property
+    def shared(self):
+        return caches[self.alias]
+
+    # -- tags ------------------------------------------------------------
+    def _tag_key(self, tag):
+        return f'{self.namespace}:tag:{tag}'
+
+    def tag_versions(self, tags):
+        versions = []
+        missing = []
+        for tag in tags:
+            version = self.tags.get(self._tag_key(tag))
+            versions.append(version)
+            if version is MISSING:
+                missing.append(self._tag_key(tag))
+        if missing:
+            found = self.shared.get_many(missing)
+            for i, tag in enumerate(tags):
+                if versions[i] is MISSING:
+                    key = self._tag_key(tag)
+                    version = found.get(key)
+                    if version is None:
+                        # Seed with a timestamp so a lost counter never rolls
+                        # back to a version that is still cached somewhere.
+                        version = int(time.time() * 1000)
+                        self.shared.add(key, version, None)
+                        version = self.shared.get(key, version)
+                    self.tags.set(key, version, self.tag_ttl)
+                    versions[i] = version
+        return versions
+
+    def invalidate_tags(self, *tags):
+        for tag in tags:
+            key = self._tag_key(tag)
+            try:
+                version = self.shared.incr(key)
+            except ValueError:
+                version = int(time.time() * 1000)
+                self.shared.set(key, version, None)
+            self.tags.set(key, version, self.tag_ttl)
+            self.invalidations += 1
+
+    def make_key(self, key, tags=()):
+        if not tags:
+            return f'{self.namespace}:{key}'
+        versions = '.'.join(str(v) for v in self.tag_versions(tags))
+        return f'{self.namespace}:{key}:{versions}'
+
+    # -- values ----------------------------------------------------------
+    def get(self, key, default=None, tags=()):
+        value = self._get(self.make_key(key, tags))
+        if value is MISSING or value == NEGATIVE:
+            return default
+        return value
+
+    def _get(self, full_key):
+        value = self.local.get(full_key)
+        if value is not MISSING:
+            return value
+        value = self.shared.get(full_key, MISSING)
+        if value is not MISSING:
+            self.shared_hits += 1
+            self.local.set(full_key, value, self.local_ttl)
+        return value
+
+    def set(self, key, value, timeout=None, tags=()):
+        self._set(self.make_key(key, tags), value, timeout)
+
+    def _set(self, full_key, value, timeout):
+        if timeout is None:
+            timeout = self.default_timeout
+        self.shared.set(full_key, value, timeout)
+        self.local.set(full_key, value, min(timeout, self.local_ttl))
+        self.sets += 1
+
+    def delete(self, key, tags=()):
+        full_key = self.make_key(key, tags)
+        self.local.delete(full_key)
+        self.shared.delete(full_key)
+
+    def get_or_set(self, key, loader, timeout=None, tags=(), negative_timeout=None):
+        """Return the cached value for key, calling loader() on a miss."""
+        full_key = self.make_key(key, tags)
+        value = self._get(full_key)
+        if value == NEGATIVE:
+            self.negative_hits += 1
+            return None
+        if value is not MISSING:
+            return value
+        value = loader()
+        if value is None:
+            if negative_timeout is None:
+                negative_timeout = self.negative_timeout
+            self._set(full_key, NEGATIVE, negative_timeout)
+        else:
+            self._set(full_key, value, timeout)
+        return value
+
+    def clear_local(self):
+        self.local.clear()
+        self.tags.clear()
+
+    def stats(self):
+        local_hits = self.local.hits
+        return {
+            'local_hits': local_hits,
+            'shared_hits': self.shared_hits,
+            # Local misses that the shared tier could not answer either
+            'misses': self.local.misses - self.shared_hits,
+            'negative_hits': self.negative_hits,
+            'local_evictions': self.local.evictions,
+            'local_size': len(self.local),
+            'sets': self.sets,
+            'tag_invalidations': self.invalidations,
+        }
+
+
+def _build_cache():
+    config = getattr(settings, 'TIERED_CACHE', {})
+    return TieredCache(
+        alias=config.get('CACHE_ALIAS', 'default'),
+        namespace=config.get('NAMESPACE', 'bookit'),
+        local_size=config.get('LOCAL_SIZE', 2048),
+        local_ttl=config.get('LOCAL_TTL', 30),
+        tag_ttl=config.get('TAG_TTL', 5),
+        default_timeout=config.get('TIMEOUT', 300),
+        negative_timeout=config.get('NEGATIVE_TIMEOUT', 30),
+    )
+
+
+tiered_cache = _build_cache()
+
+
+# -- hot lookups ------------------------------------------------------------
+
+def get_amenity_catalogue():
+    """All amenities as plain dicts, ordered by name."""
+    from .models import Amenity
+
+    return tiered_cache.get_or_set(
+        'amenities:catalogue',
+        lambda: list(Amenity.objects.values('id', 'name', 'icon', 'description')),
+        tags=('amenities',),
+    )
+
+
+def get_amenity_ids_by_name():
+    """Amenity name -> id, built from the cached catalogue."""
+    return {a['name']: a['id'] for a in get_amenity_catalogue()}
@@ -0,0 +1,111 @@
+# core/changes.py
+"""
+Delta sync for clients that keep their own copy of the listings
+(GET /api/listings/changes/, ListingChangesView).
+
+A sync token is a signed cursor into two streams: listing_search rows by
+(refreshed_at, listing_id) and ListingDeletion tombstones by (deleted_at,
+id). Each call returns at most ``limit`` rows and ``limit`` tombstones past
+the cursor, plus the token for the next call; clients call again while
+``more`` is true. Without a token every row is sent, page by page, and only
+deletions from then on.
+
+Only entries older than SETTLE_SECONDS are handed out: refreshed_at and
+deleted_at are stamped before their transaction commits, and a slow one
+would otherwise commit behind a cursor that has already moved past it.
+
+``manage.py listing_search prune`` keeps tombstones for RETENTION_DAYS. A
+token whose deletion cursor is older than that may have missed some, so it
+is refused with 410 and the client starts over without one.
+"""
+from datetime import datetime, timedelta, timezone as dt_timezone
+
+from django.conf import settings
+from django.core import signing
+from django.db.models import Q
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.exceptions import APIException, ValidationError
+
+from .models import ListingDeletion, ListingSearch
+
+SALT = 'core.changes'
+EPOCH = datetime(1970, 1, 1, tzinfo=dt_timezone.utc)
+_MICROSECOND = timedelta(microseconds=1)
+
+
+class SyncTokenExpired(APIException):
+    status_code = status.HTTP_410_GONE
+    default_detail = 'This sync token is too old; sync again without one.'
+    default_code = 'sync_token_expired'
+
+
+def _config():
+    return settings.LISTING_CHANGES
+
+
+def encode_token(rows_after, deletions_after):
+    """Sign the two cursors, each a (datetime, id) pair."""
+    return signing.dumps(
+        [[(moment - EPOCH) // _MICROSECOND, pk] for moment, pk in (rows_after, deletions_after)],
+        salt=SALT, compress=True,
+    )
+
+
+def decode_token(token):
+    try:
+        cursors = signing.loads(token, salt=SALT)
+        return tuple((EPOCH + moment * _MICROSECOND, pk) for moment, pk in cursors)
+    except (signing.BadSignature, TypeError, ValueError):
+        raise ValidationError({'since': ['Not a sync token from this server.']})
+
+
+def _page(queryset, moment_field, id_field, after, until, limit):
+    moment, pk = after
+    return queryset.filter(
+        Q(**{f'{moment_field}__gt': moment}) | Q(**{moment_field: moment, f'{id_field}__gt': pk}),
+        **{f'{moment_field}__lt': until},
+    ).order_by(moment_field, id_field)[:limit + 1]
+
+
+def changes_since(token=None, limit=None):
+    """
+    {'changed': ListingSearch rows, 'deleted': listing ids, 'next': token,
+    'more': whether another call would return more}.
+    """
+    config = _config()
+    limit = limit or config['PAGE_SIZE']
+    now = timezone.now()
+    until = now - timedelta(seconds=config['SETTLE_SECONDS'])
+    if token:
+        rows_after, deletions_after = decode_token(token)
+        if deletions_after[0] < now - timedelta(days=config['RETENTION_DAYS']):
+            raise SyncTokenExpired()
+    else:
+        # A new copy starts from every row there is, so older tombstones
+        # are of no use to it
+        rows_after, deletions_after = (EPOCH, 0), (until, 0)
+
+    rows = list(_page(ListingSearch.objects.all(), 'refreshed_at', 'listing_id', rows_after, until, limit))
+    deletions = list(_page(
+        ListingDeletion.objects.all(), 'deleted_at', 'id', deletions_after, until, limit,
+    ).values_list('deleted_at', 'id', 'listing_id'))
+    more = len(rows) > limit or len(deletions) > limit
+    rows, deletions = rows[:limit], deletions[:limit]
+
+    # A stream read to the end is caught up to ``until``; that also keeps
+    # the deletion cursor of an idle client recent, so its token stays valid
+    if len(rows) < limit:
+        rows_after = (until, 0)
+    elif rows:
+        rows_after = (rows[-1].refreshed_at, rows[-1].listing_id)
+    if len(deletions) < limit:
+        deletions_after = (until, 0)
+    elif deletions:
+        deletions_after = deletions[-1][:2]
+    return {
+        'changed': rows,
+        'deleted': [listing_id for _, _, listing_id in deletions],
+        'next': encode_token(rows_after, deletions_after),
+        'more': more,
+    }
@@ -1,10 +1,14 @@
 # core/email_backends.py
 import os
 from django.core.mail.backends.base import BaseEmailBackend
-from sendgrid import SendGridAPIClient
-from sendgrid.helpers.mail import Mail, Content, To, From, MailSettings, SandBoxMode
+
+from .metrics import external_call
+
+# The sendgrid SDK is imported on first send, not at startup
 
 def _send_single_message(self, email_message):
+    from sendgrid.helpers.mail import Mail, To, From, MailSettings, SandBoxMode
+
     to_emails = [To(email) for email in email_message.to]
     
     # Check if sandbox should be enabled (e.g., from settings or env)
@@ -57,6 +61,9 @@ class SendGridBackend(BaseEmailBackend):
         """
         Send a single EmailMessage using SendGrid API.
         """
+        from sendgrid import SendGridAPIClient
+        from sendgrid.helpers.mail import Mail, Content, To, From
+
         # Prepare recipients
         to_emails = [To(email) for email in email_message.to]
         
@@ -83,7 +90,8 @@ class SendGridBackend(BaseEmailBackend):
         
         # Send email
         sg = SendGridAPIClient(self.api_key)
-        response = sg.send(mail)
+        with external_call('sendgrid'):
+            response = sg.send(mail)
         
         # Check response
         if response.status_code not in [200, 201, 202]:
@@ -0,0 +1,44 @@
+# core/fake_uploads.py
+"""
+A stand-in for Cloudinary uploads (settings.FAKE_MEDIA_UPLOADS), for load
+tests and offline development.
+
+CloudinaryField uploads through cloudinary.uploader.upload_resource, which
+calls uploader.upload/upload_large; install() swaps those for a function
+that reads the file, optionally waits FAKE_MEDIA_UPLOAD_MS to stand in for
+the network round trip, and returns the fields of a real upload response.
+Nothing leaves the machine and the stored public ids are not servable.
+"""
+import time
+import uuid
+
+from django.conf import settings
+
+_installed = False
+
+
+def fake_upload(file, **options):
+    data = file.read() if hasattr(file, 'read') else b''
+    delay = getattr(settings, 'FAKE_MEDIA_UPLOAD_MS', 0)
+    if delay:
+        time.sleep(delay / 1e3)
+    name = getattr(file, 'name', '') or ''
+    return {
+        'public_id': f'fake/{uuid.uuid4().hex}',
+        'version': int(time.time()),
+        'format': name.rsplit('.', 1)[-1].lower() if '.' in name else None,
+        'type': options.get('type', 'upload'),
+        'resource_type': options.get('resource_type', 'image'),
+        'bytes': len(data),
+    }
+
+
+def install():
+    global _installed
+    if _installed:
+        return
+    from cloudinary import uploader
+
+    uploader.upload = fake_upload
+    uploader.upload_large = fake_upload
+    _installed = True
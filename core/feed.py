@@ -0,0 +1,445 @@
+# core/feed.py
+"""
+Push feed of listing changes at /api/listings/stream/.
+
+Clients that used to poll /api/listings/ subscribe once and get an event
+whenever a listing they care about is created, changed or made
+(un)available, and a tombstone when one is deleted:
+
+    event: created | updated | availability | deleted
+    data: {"event": "created", "id": 12, "listing": {...card...}}
+
+as Server-Sent Events, or as JSON text frames over a WebSocket on the same
+path (routed by core.handlers). ?location= and ?room_type= (comma-separated)
+and ?min_price= / ?max_price= (on first_price) narrow the events sent. The
+stream is only served by the ASGI deployment. After a reconnect, or an
+``overflow`` event from a client too slow to keep up, clients catch up with
+/api/listings/changes/.
+
+Each worker has one Broadcaster. A subscriber is an asyncio queue, so an
+idle one costs a parked coroutine and its socket; subscribers are indexed by
+location, so an event only visits those it may match, and each event is
+serialized once whatever the number of subscribers.
+
+A transport (LISTING_FEED['TRANSPORT']) tells the broadcaster which listings
+changed, wherever they were written:
+
+- DatabaseTransport (default) polls listing_search and ListingDeletion, as
+  core.listingindex does, and needs no other service;
+- RedisTransport relays the ids writers publish after each commit over
+  Redis pub/sub (requires the redis package);
+- LocalTransport only sees writes made by its own process (development).
+"""
+import asyncio
+import json
+import logging
+import queue
+import threading
+import time
+from datetime import timedelta
+from decimal import Decimal, InvalidOperation
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.handlers.asgi import ASGIRequest
+from django.db import close_old_connections, transaction
+from django.http import JsonResponse, QueryDict, StreamingHttpResponse
+from django.urls import reverse
+from django.utils import timezone
+from django.utils.module_loading import import_string
+from django.views.decorators.http import require_GET
+
+from .models import LOCATION_CHOICES, Listing, ListingDeletion, ListingSearch
+
+logger = logging.getLogger(__name__)
+
+LOCATIONS = {value for value, _ in LOCATION_CHOICES}
+ROOM_TYPES = {value for value, _ in Listing.ROOM_TYPE_CHOICES}
+
+
+def _config():
+    return settings.LISTING_FEED
+
+
+class Event:
+    """One change, encoded once for every subscriber and protocol."""
+
+    __slots__ = ('kind', 'listing_id', 'row', 'text', 'sse')
+
+    def __init__(self, kind, listing_id, row=None, card=None):
+        self.kind = kind
+        self.listing_id = listing_id
+        self.row = row
+        self.text = json.dumps({'event': kind, 'id': listing_id, 'listing': card}, separators=(',', ':'))
+        self.sse = f'event: {kind}\ndata: {self.text}\n\n'.encode()
+
+
+# Sent in place of the events a subscriber had no room for
+OVERFLOW = Event('overflow', None)
+
+
+def subscription_filters(params):
+    """Subscription keyword arguments from query parameters; ValueError if invalid."""
+    filters = {}
+    for name, choices in (('location', LOCATIONS), ('room_type', ROOM_TYPES)):
+        values = {value.strip() for value in params.get(name, '').split(',') if value.strip()}
+        unknown = values - choices
+        if unknown:
+            raise ValueError(f"Unknown {name}: {', '.join(sorted(unknown))}.")
+        filters[f'{name}s'] = frozenset(values) or None
+    for name in ('min_price', 'max_price'):
+        value = params.get(name)
+        try:
+            filters[name] = Decimal(value) if value else None
+        except InvalidOperation:
+            raise ValueError(f'{name} must be a number.')
+    return filters
+
+
+class Subscription:
+    def __init__(self, loop, locations=None, room_types=None, min_price=None, max_price=None):
+        self.loop = loop
+        self.locations = locations
+        self.room_types = room_types
+        self.min_price = min_price
+        self.max_price = max_price
+        self.queue = asyncio.Queue(_config()['QUEUE_SIZE'])
+        self.overflowed = False
+
+    def matches(self, row):
+        """Everything but the location, which Broadcaster's index has checked."""
+        return (
+            (self.room_types is None or row.room_type in self.room_types)
+            and (self.min_price is None or row.first_price >= self.min_price)
+            and (self.max_price is None or row.first_price <= self.max_price)
+        )
+
+    def offer(self, event):
+        # Runs on the subscriber's event loop
+        if self.overflowed:
+            return
+        try:
+            self.queue.put_nowait(event)
+        except asyncio.QueueFull:
+            self.overflowed = True
+            self.queue.get_nowait()
+            self.queue.put_nowait(OVERFLOW)
+
+    async def next(self, timeout=None):
+        """The next event, or None after ``timeout`` seconds without one."""
+        try:
+            return await asyncio.wait_for(self.queue.get(), timeout)
+        except asyncio.TimeoutError:
+            return None
+
+
+def _offer(pairs):
+    for subscription, event in pairs:
+        subscription.offer(event)
+
+
+class Broadcaster:
+    """Fans the changes a transport reports out to this worker's subscribers."""
+
+    def __init__(self, transport):
+        self.transport = transport
+        self._lock = threading.Lock()
+        # location (None: any location) -> subscriptions
+        self._subscribers = {}
+        self.count = 0
+        # listing id -> (refreshed_at, is_available) as last broadcast
+        self._known = {}
+
+    def start(self):
+        rows = ListingSearch.objects.values_list('listing_id', 'refreshed_at', 'is_available')
+        self._known = {pk: (refreshed_at, available) for pk, refreshed_at, available in rows.iterator()}
+        self.transport.start(self)
+
+    def subscribe(self, subscription):
+        """Add a subscriber; False when the worker already has MAX_SUBSCRIBERS."""
+        with self._lock:
+            if self.count >= _config()['MAX_SUBSCRIBERS']:
+                return False
+            for location in subscription.locations or (None,):
+                self._subscribers.setdefault(location, set()).add(subscription)
+            self.count += 1
+        return True
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            for location in subscription.locations or (None,):
+                self._subscribers.get(location, set()).discard(subscription)
+            self.count -= 1
+
+    def listings_changed(self, listing_ids, deleted_ids=()):
+        """Broadcast these listings as they are now (for transports that only pass ids)."""
+        rows = list(ListingSearch.objects.filter(listing_id__in=listing_ids)) if listing_ids else []
+        self.deliver(rows, deleted_ids)
+
+    def deliver(self, rows, deleted_ids=()):
+        """Broadcast the rows not seen in this state yet, and the deletions of known listings."""
+        from .serializers import ListingCardSerializer
+
+        fresh, kinds = [], []
+        for row in rows:
+            known = self._known.get(row.listing_id)
+            if known is not None and known[0] == row.refreshed_at:
+                continue
+            if known is None:
+                kinds.append('created')
+            else:
+                kinds.append('availability' if known[1] != row.is_available else 'updated')
+            self._known[row.listing_id] = (row.refreshed_at, row.is_available)
+            fresh.append(row)
+        cards = ListingCardSerializer(fresh, many=True).data if fresh else []
+        events = [Event(kind, row.listing_id, row, card) for kind, row, card in zip(kinds, fresh, cards)]
+        events += [Event('deleted', pk) for pk in deleted_ids if self._known.pop(pk, None) is not None]
+        if events:
+            self.dispatch(events)
+        return events
+
+    def dispatch(self, events):
+        by_loop = {}
+        with self._lock:
+            anywhere = self._subscribers.get(None, set())
+            for event in events:
+                if event.row is None:
+                    targets = set().union(*self._subscribers.values())
+                else:
+                    targets = [
+                        subscription
+                        for subscription in self._subscribers.get(event.row.location, set()) | anywhere
+                        if subscription.matches(event.row)
+                    ]
+                for subscription in targets:
+                    by_loop.setdefault(subscription.loop, []).append((subscription, event))
+        # One wake-up per event loop, however many subscribers it serves
+        for loop, pairs in by_loop.items():
+            try:
+                loop.call_soon_threadsafe(_offer, pairs)
+            except RuntimeError:
+                # The loop is gone; its subscribers with it
+                pass
+
+
+# -- transports ----------------------------------------------------------------
+
+class Transport:
+    """Tells a Broadcaster which listings changed."""
+
+    # Whether writers must publish() the listings they change
+    publishes = False
+
+    def start(self, broadcaster):
+        raise NotImplementedError
+
+    def publish(self, listing_ids, deleted_ids):
+        pass
+
+    def _run_in_thread(self, target, *args):
+        threading.Thread(target=target, args=args, name=type(self).__name__, daemon=True).start()
+
+
+class LocalTransport(Transport):
+    publishes = True
+
+    def __init__(self):
+        self.changes = queue.SimpleQueue()
+        self.broadcaster = None
+
+    def start(self, broadcaster):
+        self.broadcaster = broadcaster
+        self._run_in_thread(self.run)
+
+    def publish(self, listing_ids, deleted_ids):
+        if self.broadcaster is not None:
+            self.changes.put((listing_ids, deleted_ids))
+
+    def run(self):
+        while True:
+            listing_ids, deleted_ids = self.changes.get()
+            close_old_connections()
+            try:
+                self.broadcaster.listings_changed(listing_ids, deleted_ids)
+            except Exception:
+                logger.exception('Could not broadcast listing changes')
+
+
+class DatabaseTransport(Transport):
+    def start(self, broadcaster):
+        self._run_in_thread(self.run, broadcaster, timezone.now())
+
+    def run(self, broadcaster, watermark):
+        config = _config()
+        while True:
+            time.sleep(config['POLL_SECONDS'])
+            close_old_connections()
+            now = timezone.now()
+            # Late commits still carry a refreshed_at in the overlap; rows
+            # already broadcast are skipped by the broadcaster
+            since = watermark - timedelta(seconds=config['OVERLAP_SECONDS'])
+            try:
+                rows = list(ListingSearch.objects.filter(refreshed_at__gte=since))
+                deleted = ListingDeletion.objects.filter(deleted_at__gte=since).values_list('listing_id', flat=True)
+                broadcaster.deliver(rows, list(deleted))
+            except Exception:
+                logger.exception('Could not poll for listing changes')
+                continue
+            watermark = now
+
+
+class RedisTransport(Transport):
+    publishes = True
+    channel = 'bookit:listing-changes'
+
+    def __init__(self):
+        import redis
+
+        self.client = redis.Redis.from_url(_config()['REDIS_URL'])
+
+    def start(self, broadcaster):
+        self._run_in_thread(self.run, broadcaster)
+
+    def publish(self, listing_ids, deleted_ids):
+        self.client.publish(self.channel, json.dumps({'changed': sorted(listing_ids), 'deleted': sorted(deleted_ids)}))
+
+    def run(self, broadcaster):
+        while True:
+            try:
+                pubsub = self.client.pubsub(ignore_subscribe_messages=True)
+                pubsub.subscribe(self.channel)
+                for message in pubsub.listen():
+                    close_old_connections()
+                    changes = json.loads(message['data'])
+                    broadcaster.listings_changed(changes['changed'], changes['deleted'])
+            except Exception:
+                logger.exception('Lost the listing changes channel; reconnecting')
+                time.sleep(1)
+
+
+# -- this worker's feed --------------------------------------------------------
+
+_transport = None
+_broadcaster = None
+_lock = threading.RLock()
+
+
+def get_transport():
+    global _transport
+    with _lock:
+        if _transport is None:
+            _transport = import_string(_config()['TRANSPORT'])()
+        return _transport
+
+
+def get_broadcaster():
+    """This worker's broadcaster, started on first use."""
+    global _broadcaster
+    with _lock:
+        if _broadcaster is None:
+            broadcaster = Broadcaster(get_transport())
+            broadcaster.start()
+            _broadcaster = broadcaster
+        return _broadcaster
+
+
+def discard():
+    """Forget this worker's transport and broadcaster (tests)."""
+    global _transport, _broadcaster
+    with _lock:
+        _transport = _broadcaster = None
+
+
+def publish_on_commit(listing_ids, deleted_ids, using=None):
+    """Hand changes to the transport once the writing transaction commits."""
+    transport = get_transport()
+    listing_ids, deleted_ids = set(listing_ids), set(deleted_ids)
+
+    def publish():
+        try:
+            transport.publish(listing_ids, deleted_ids)
+        except Exception:
+            # The write has committed; subscribers catch up through /changes/
+            logger.exception('Could not publish listing changes')
+
+    transaction.on_commit(publish, using=using)
+
+
+# -- endpoints -----------------------------------------------------------------
+
+@require_GET
+async def listing_stream(request):
+    if not isinstance(request, ASGIRequest):
+        return JsonResponse(
+            {'detail': 'The listing stream is only served by the ASGI deployment (config/asgi.py).'}, status=501
+        )
+    try:
+        filters = subscription_filters(request.GET)
+    except ValueError as exc:
+        return JsonResponse({'detail': str(exc)}, status=400)
+    broadcaster = await sync_to_async(get_broadcaster)()
+    subscription = Subscription(asyncio.get_running_loop(), **filters)
+    if not broadcaster.subscribe(subscription):
+        response = JsonResponse({'detail': 'Too many subscribers, please retry shortly.'}, status=503)
+        response['Retry-After'] = '30'
+        return response
+    response = StreamingHttpResponse(_event_stream(broadcaster, subscription), content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    # Stop nginx from buffering the stream
+    response['X-Accel-Buffering'] = 'no'
+    return response
+
+
+async def _event_stream(broadcaster, subscription):
+    keepalive = _config()['KEEPALIVE_SECONDS']
+    try:
+        yield b'retry: 5000\n\n'
+        while True:
+            event = await subscription.next(keepalive)
+            if event is None:
+                # A comment line keeps proxies from closing an idle stream
+                yield b': keepalive\n\n'
+                continue
+            yield event.sse
+            if event is OVERFLOW:
+                return
+    finally:
+        broadcaster.unsubscribe(subscription)
+
+
+async def _disconnected(receive):
+    while (await receive())['type'] != 'websocket.disconnect':
+        pass
+
+
+async def websocket_stream(scope, receive, send):
+    """ASGI app serving the feed as JSON text frames to WebSocket clients."""
+    if (await receive())['type'] != 'websocket.connect':
+        return
+    # Closing before accepting rejects the handshake (403)
+    if scope['path'] != reverse('core:listing-stream'):
+        return await send({'type': 'websocket.close'})
+    try:
+        filters = subscription_filters(QueryDict(scope.get('query_string', b'').decode('latin-1')))
+    except ValueError:
+        return await send({'type': 'websocket.close'})
+    broadcaster = await sync_to_async(get_broadcaster)()
+    subscription = Subscription(asyncio.get_running_loop(), **filters)
+    if not broadcaster.subscribe(subscription):
+        return await send({'type': 'websocket.close'})
+
+    await send({'type': 'websocket.accept'})
+    disconnected = asyncio.ensure_future(_disconnected(receive))
+    try:
+        while True:
+            event = asyncio.ensure_future(subscription.queue.get())
+            await asyncio.wait({event, disconnected}, return_when=asyncio.FIRST_COMPLETED)
+            if disconnected.done():
+                event.cancel()
+                return
+            await send({'type': 'websocket.send', 'text': event.result().text})
+            if event.result() is OVERFLOW:
+                return await send({'type': 'websocket.close', 'code': 1000})
+    finally:
+        disconnected.cancel()
+        broadcaster.unsubscribe(subscription)
@@ -0,0 +1,152 @@
+# core/handlers.py
+"""
+Path-scoped request handlers.
+
+Stateless JWT API routes do not need sessions, CSRF, messages, allauth's
+AccountMiddleware or X-Frame-Options, so requests under LEAN_MIDDLEWARE_PATHS
+are dispatched to a second handler built from LEAN_MIDDLEWARE. Everything
+else (admin, allauth, dj-rest-auth) keeps the full MIDDLEWARE chain.
+
+The dispatch happens at the handler level rather than inside a middleware
+because Django's admin checks and allauth require the full MIDDLEWARE setting
+to list sessions, messages and AccountMiddleware verbatim.
+"""
+import time
+from contextlib import contextmanager
+
+import django
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.handlers.asgi import ASGIHandler
+from django.core.handlers.wsgi import WSGIHandler
+
+
+def is_lean_path(path):
+    """Whether a request path is served by the lean middleware chain."""
+    if not getattr(settings, 'LEAN_MIDDLEWARE_ENABLED', True):
+        return False
+    if any(path.startswith(prefix) for prefix in getattr(settings, 'LEAN_MIDDLEWARE_EXCLUDE', [])):
+        return False
+    return any(path.startswith(prefix) for prefix in getattr(settings, 'LEAN_MIDDLEWARE_PATHS', []))
+
+
+@contextmanager
+def middleware_setting(middleware):
+    """
+    Temporarily point settings.MIDDLEWARE at another chain. Only used while a
+    handler loads its middleware, which happens once per process at startup.
+    """
+    original = settings.MIDDLEWARE
+    settings.MIDDLEWARE = list(middleware)
+    try:
+        yield
+    finally:
+        settings.MIDDLEWARE = original
+
+
+class LeanMiddlewareMixin:
+    def load_middleware(self, is_async=False):
+        with middleware_setting(settings.LEAN_MIDDLEWARE):
+            super().load_middleware(is_async=is_async)
+
+
+class LeanWSGIHandler(LeanMiddlewareMixin, WSGIHandler):
+    pass
+
+
+class LeanASGIHandler(LeanMiddlewareMixin, ASGIHandler):
+    pass
+
+
+class PathScopedWSGIHandler(WSGIHandler):
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.lean_handler = LeanWSGIHandler()
+
+    def __call__(self, environ, start_response):
+        if is_lean_path(environ.get('PATH_INFO', '')):
+            return self.lean_handler(environ, start_response)
+        return super().__call__(environ, start_response)
+
+
+class PathScopedASGIHandler(ASGIHandler):
+    def __init__(self):
+        super().__init__()
+        self.lean_handler = LeanASGIHandler()
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'http' and is_lean_path(scope.get('path', '')):
+            return await self.lean_handler(scope, receive, send)
+        if scope['type'] == 'websocket':
+            # Django only speaks HTTP; the listing feed is the one WebSocket
+            from .feed import websocket_stream
+
+            return await websocket_stream(scope, receive, send)
+        if scope['type'] == 'lifespan':
+            return await self.lifespan(receive, send)
+        return await super().__call__(scope, receive, send)
+
+    async def lifespan(self, receive, send):
+        """
+        Warm the worker (core.warmup) before uvicorn accepts connections.
+        Under gunicorn, post_worker_init has already done it.
+        """
+        from .warmup import WARMUP_ON_START, warm_up
+
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                if WARMUP_ON_START:
+                    await sync_to_async(warm_up, thread_sensitive=False)()
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
+
+
+def get_wsgi_application():
+    django.setup(set_prefix=False)
+    return PathScopedWSGIHandler()
+
+
+def get_asgi_application():
+    django.setup(set_prefix=False)
+    return PathScopedASGIHandler()
+
+
+class MiddlewareProbe:
+    """
+    Timestamp marker interleaved between middleware by the middleware_report
+    command. Entry marks are recorded outermost first and exit marks innermost
+    first, so the self time of the middleware between two probes is the gap
+    between their entries plus the gap between their exits.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        marks = request.__dict__.setdefault('_probe_marks', ([], []))
+        marks[0].append(time.perf_counter())
+        response = self.get_response(request)
+        marks[1].append(time.perf_counter())
+        return response
+
+
+def probed(middleware):
+    """Interleave MiddlewareProbe before, between and after each middleware."""
+    probe = f'{MiddlewareProbe.__module__}.{MiddlewareProbe.__name__}'
+    chain = [probe]
+    for path in middleware:
+        chain.extend([path, probe])
+    return chain
+
+
+def self_times(marks):
+    """Per-middleware self time in seconds from one probed request."""
+    entries, exits = marks
+    exits = exits[::-1]
+    return [
+        (entries[i + 1] - entries[i]) + (exits[i] - exits[i + 1])
+        for i in range(len(entries) - 1)
+    ]
@@ -0,0 +1,30 @@
+# core/lazy.py
+"""
+Views whose module is imported on the first request instead of when the
+URLconf loads, for rarely used routes backed by heavy packages (the
+drf-spectacular schema and docs views pull in the schema generator,
+PyYAML and the renderers).
+"""
+from django.utils.functional import cached_property
+from django.utils.module_loading import import_string
+
+
+class LazyView:
+    def __init__(self, view_path, **initkwargs):
+        self.view_path = view_path
+        self.initkwargs = initkwargs
+        # Checked by CsrfViewMiddleware on the URL callback itself; DRF
+        # views are exempt anyway.
+        self.csrf_exempt = True
+
+    @cached_property
+    def view(self):
+        return import_string(self.view_path).as_view(**self.initkwargs)
+
+    def __call__(self, request, *args, **kwargs):
+        return self.view(request, *args, **kwargs)
+
+
+def lazy_view(view_path, **initkwargs):
+    """``as_view(**initkwargs)`` of the class-based view at ``view_path``, imported on first use."""
+    return LazyView(view_path, **initkwargs)
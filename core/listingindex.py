@@ -0,0 +1,312 @@
+# core/listingindex.py
+"""
+In-process index of listing_search for the listings grid.
+
+With LISTING_INDEX['ENABLED'], every worker keeps all listing_search rows in
+memory and ListingListCreateView answers list requests from them without a
+query:
+
+- columns: one list per filterable or orderable field, indexed by slot;
+- postings: value -> slots for each filterset field, amenity id -> slots and
+  search token -> slots;
+- orders: every slot sorted by an ordering, built the first time it is asked
+  for and kept until the next change.
+
+Filters, search terms and ordering are parsed by the same filterset and DRF
+filter backends the database path uses, so the two answer alike; the parity
+tests in core.tests hold them to that.
+
+The index loads at warm-up (core.warmup). The first request after
+REFRESH_SECONDS catches it up: rows whose refreshed_at moved are reloaded and
+listings logged in ListingDeletion are dropped (see core.readmodel). Other
+threads keep answering from the current state meanwhile.
+"""
+import logging
+import re
+import threading
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, DatabaseError, connections
+from django.db.models import Model
+from django.utils import timezone
+from django_filters.constants import EMPTY_VALUES
+from django_filters.rest_framework import DjangoFilterBackend
+from django_filters.utils import translate_validation
+from rest_framework.filters import OrderingFilter, SearchFilter
+
+from .models import ListingDeletion, ListingSearch
+
+logger = logging.getLogger(__name__)
+
+# ListingListCreateView.filterset_fields -> the column each one compares
+FILTER_COLUMNS = {
+    'location': 'location',
+    'room_type': 'room_type',
+    'is_available': 'is_available',
+    'agent': 'agent_id',
+    'first_price': 'first_price',
+    'year_price': 'year_price',
+    'total_rooms': 'total_rooms',
+}
+# ListingListCreateView.ordering_fields
+SORT_COLUMNS = ('first_price', 'year_price', 'effective_price', 'total_rooms', 'created_at', 'updated_at')
+COLUMNS = tuple(dict.fromkeys([*FILTER_COLUMNS.values(), *SORT_COLUMNS]))
+
+# An unquoted search term never contains these, so it can only match inside
+# one token of the text
+_TOKEN_SEPARATORS = re.compile(r'[\s,]+')
+
+# Memoized search terms kept between changes
+MAX_CACHED_TERMS = 1024
+
+
+def tokenize(text):
+    return {token for token in _TOKEN_SEPARATORS.split(text.lower()) if token}
+
+
+def _discard(postings, key, slot):
+    slots = postings.get(key)
+    if slots is not None:
+        slots.discard(slot)
+        if not slots:
+            del postings[key]
+
+
+class ListingIndex:
+    """Every listing_search row, by slot, with the lookups the list view needs."""
+
+    def __init__(self, using=DEFAULT_DB_ALIAS):
+        self.using = using
+        # Where NULL year_price sorts, as the database would put it
+        self.nulls_largest = connections[using].features.nulls_order_largest
+        self.rows = []  # slot -> ListingSearch, None when free
+        self.slots = {}  # listing id -> slot
+        self.free = []
+        self.columns = {name: [] for name in COLUMNS}
+        self.postings = {column: {} for column in FILTER_COLUMNS.values()}
+        self.amenities = {}
+        self.tokens = {}
+        self._orders = {}
+        self._terms = {}
+        # refreshed_at the next refresh reads from, and when (monotonic)
+        # the index was loaded and last refreshed
+        self.watermark = None
+        self.loaded_at = self.refreshed_at = 0.0
+
+    def __len__(self):
+        return len(self.slots)
+
+    # -- changes ---------------------------------------------------------------
+
+    def upsert(self, rows):
+        for row in rows:
+            slot = self.slots.get(row.listing_id)
+            if slot is None:
+                slot = self.free.pop() if self.free else self._grow()
+                self.slots[row.listing_id] = slot
+            else:
+                self._unlink(slot)
+            self._link(slot, row)
+        self._changed()
+
+    def remove(self, listing_ids):
+        for listing_id in listing_ids:
+            slot = self.slots.pop(listing_id, None)
+            if slot is not None:
+                self._unlink(slot)
+                self.rows[slot] = None
+                self.free.append(slot)
+        self._changed()
+
+    def _grow(self):
+        self.rows.append(None)
+        for column in self.columns.values():
+            column.append(None)
+        return len(self.rows) - 1
+
+    def _link(self, slot, row):
+        self.rows[slot] = row
+        for name, column in self.columns.items():
+            column[slot] = getattr(row, name)
+        for name, postings in self.postings.items():
+            postings.setdefault(getattr(row, name), set()).add(slot)
+        for amenity_id in row.amenity_id_list:
+            self.amenities.setdefault(amenity_id, set()).add(slot)
+        for token in tokenize(row.search_text):
+            self.tokens.setdefault(token, set()).add(slot)
+
+    def _unlink(self, slot):
+        row = self.rows[slot]
+        for name, postings in self.postings.items():
+            _discard(postings, getattr(row, name), slot)
+        for amenity_id in row.amenity_id_list:
+            _discard(self.amenities, amenity_id, slot)
+        for token in tokenize(row.search_text):
+            _discard(self.tokens, token, slot)
+
+    def _changed(self):
+        self._orders.clear()
+        self._terms.clear()
+
+    # -- queries ---------------------------------------------------------------
+
+    def query(self, filters=(), amenity_ids=(), terms=(), ordering=()):
+        """
+        Rows equal to every (column, value) filter, with every amenity and
+        containing every search term (case-insensitively), in ``ordering``.
+        """
+        matches = [self.postings[column].get(value, set()) for column, value in filters]
+        matches += [self.amenities.get(amenity_id, set()) for amenity_id in amenity_ids]
+        matches += [self._matching(term) for term in terms]
+        if not matches:
+            return [self.rows[slot] for slot in self._order(tuple(ordering))]
+
+        matches.sort(key=len)
+        candidates = matches[0]
+        for slots in matches[1:]:
+            if not candidates:
+                break
+            candidates = candidates & slots
+        if len(candidates) * 8 < len(self.slots):
+            # Cheaper to sort the few than to walk the whole order
+            return [self.rows[slot] for slot in self._sorted(candidates, ordering)]
+        return [self.rows[slot] for slot in self._order(tuple(ordering)) if slot in candidates]
+
+    def _matching(self, term):
+        slots = self._terms.get(term)
+        if slots is None:
+            needle = term.lower()
+            if not needle or _TOKEN_SEPARATORS.search(needle):
+                # A quoted phrase may span tokens: look at the text itself
+                slots = {
+                    slot for slot in self.slots.values() if needle in self.rows[slot].search_text.lower()
+                }
+            else:
+                slots = set()
+                for token, token_slots in self.tokens.items():
+                    if needle in token:
+                        slots |= token_slots
+            if len(self._terms) >= MAX_CACHED_TERMS:
+                self._terms.clear()
+            self._terms[term] = slots
+        return slots
+
+    def _order(self, ordering):
+        order = self._orders.get(ordering)
+        if order is None:
+            order = self._orders[ordering] = self._sorted(self.slots.values(), ordering)
+        return order
+
+    def _sorted(self, slots, ordering):
+        # Slot order first, so ties come out the same however they are sorted
+        slots = sorted(slots)
+        for field in reversed(ordering):
+            column = self.columns[field.lstrip('-')]
+            if self.nulls_largest:
+                key = lambda slot: (column[slot] is None, column[slot])  # noqa: E731
+            else:
+                key = lambda slot: (column[slot] is not None, column[slot])  # noqa: E731
+            slots.sort(key=key, reverse=field.startswith('-'))
+        return slots
+
+
+# -- the worker's index --------------------------------------------------------
+
+_index = None
+# Held while the index is read or changed
+_lock = threading.Lock()
+# Held by the one thread loading or refreshing it
+_refresh_lock = threading.Lock()
+
+
+def _config():
+    return getattr(settings, 'LISTING_INDEX', {})
+
+
+def load(using=DEFAULT_DB_ALIAS):
+    """Index the whole table and make it this worker's index."""
+    global _index
+    started = time.monotonic()
+    index = ListingIndex(using)
+    index.watermark = timezone.now()
+    index.upsert(ListingSearch.objects.using(using).order_by().iterator(chunk_size=2000))
+    index.loaded_at = index.refreshed_at = time.monotonic()
+    with _lock:
+        _index = index
+    logger.info('Listing index loaded %d rows in %.0f ms', len(index), (time.monotonic() - started) * 1e3)
+    return index
+
+
+def refresh(index):
+    """Catch up with rows rewritten and listings deleted since the last refresh."""
+    now = timezone.now()
+    # Rows committed late, by a transaction that started earlier, still have
+    # a refreshed_at in the overlap
+    since = index.watermark - timedelta(seconds=_config().get('OVERLAP_SECONDS', 30))
+    rows = list(ListingSearch.objects.using(index.using).filter(refreshed_at__gte=since).order_by())
+    deleted = ListingDeletion.objects.using(index.using).filter(deleted_at__gte=since)
+    deleted = list(deleted.values_list('listing_id', flat=True))
+    with _lock:
+        index.upsert(rows)
+        index.remove(deleted)
+        index.watermark = now
+        index.refreshed_at = time.monotonic()
+    return len(rows), len(deleted)
+
+
+def discard():
+    """Forget this worker's index; the next get_index() loads a new one."""
+    global _index
+    with _lock:
+        _index = None
+
+
+def get_index():
+    """This worker's index, caught up if due; None when LISTING_INDEX is off."""
+    config = _config()
+    if not config.get('ENABLED'):
+        return None
+    index = _index
+    if index is None:
+        with _refresh_lock:
+            return _index or load()
+
+    now = time.monotonic()
+    reload = now - index.loaded_at > config.get('FULL_RELOAD_SECONDS', 3600)
+    if not reload and now - index.refreshed_at <= config.get('REFRESH_SECONDS', 2):
+        return index
+    # Someone else is at it already: answer from the current state
+    if _refresh_lock.acquire(blocking=False):
+        try:
+            if reload:
+                load(index.using)
+            else:
+                refresh(index)
+        except DatabaseError:
+            logger.warning('Listing index refresh failed; serving the last state', exc_info=True)
+        finally:
+            _refresh_lock.release()
+    return _index
+
+
+def query_view(index, view):
+    """The rows ``view``, a ListingListCreateView, lists for its request."""
+    request = view.request
+    queryset = view.get_queryset()
+    filterset = DjangoFilterBackend().get_filterset(request, queryset, view)
+    if not filterset.is_valid():
+        raise translate_validation(filterset.errors)
+    filters = [
+        (FILTER_COLUMNS[name], value.pk if isinstance(value, Model) else value)
+        for name, value in filterset.form.cleaned_data.items()
+        if value not in EMPTY_VALUES
+    ]
+    amenity_ids = view.requested_amenity_ids()
+    if amenity_ids is None:
+        return []
+    terms = SearchFilter().get_search_terms(request)
+    ordering = OrderingFilter().get_ordering(request, queryset, view) or ()
+    with _lock:
+        return index.query(filters, amenity_ids, terms, ordering)
@@ -0,0 +1,87 @@
+import time
+
+from django.core.handlers.wsgi import WSGIHandler
+from django.core.management.base import BaseCommand
+from django.db import connections
+from django.db.backends.signals import connection_created
+
+from core.benchmarking import format_summary, summarize, wsgi_environ, write_results
+
+
+class Command(BaseCommand):
+    help = (
+        "Measure request latency with a new database connection per request, "
+        "with persistent connections, and (on Postgres with psycopg 3) with a "
+        "bounded connection pool."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--path', default='/api/listings/', help='Path to request.')
+        parser.add_argument('--requests', type=int, default=200, help='Requests per mode.')
+        parser.add_argument('--database', default='default', help='Database alias to benchmark.')
+        parser.add_argument('--output', help='Write results as JSON to this file.')
+
+    def handle(self, *args, **options):
+        alias = options['database']
+        connection = connections[alias]
+        original = {
+            'CONN_MAX_AGE': connection.settings_dict['CONN_MAX_AGE'],
+            'OPTIONS': dict(connection.settings_dict['OPTIONS']),
+        }
+        modes = {
+            'no-reuse': {'CONN_MAX_AGE': 0, 'pool': None},
+            'persistent': {'CONN_MAX_AGE': None, 'pool': None},
+        }
+        if connection.vendor == 'postgresql':
+            modes['pool'] = {'CONN_MAX_AGE': 0, 'pool': {'min_size': 1, 'max_size': 4}}
+        else:
+            self.stdout.write(f'{connection.vendor}: pool mode needs Postgres with psycopg 3, skipping it.')
+
+        handler = WSGIHandler()
+        opened = []
+
+        def count_connection(sender, connection, **kwargs):
+            if connection.alias == alias:
+                opened.append(1)
+
+        connection_created.connect(count_connection)
+        results = {}
+        try:
+            for name, mode in modes.items():
+                self.configure(connection, original, mode)
+                self.run(handler, options['path'], 5)  # warm caches and the URLconf
+                opened.clear()
+                samples = self.run(handler, options['path'], options['requests'])
+                results[name] = {**summarize(samples), 'connections_opened': len(opened)}
+                self.stdout.write(
+                    f'{name:<11} {format_summary(results[name])} connections={len(opened)}'
+                )
+        finally:
+            connection_created.disconnect(count_connection)
+            self.configure(connection, original, {'CONN_MAX_AGE': original['CONN_MAX_AGE'], 'pool': None})
+            connection.settings_dict['OPTIONS'] = original['OPTIONS']
+
+        if options['output']:
+            write_results(options['output'], 'db_connections', results, path=options['path'])
+
+    def configure(self, connection, original, mode):
+        connection.close()
+        if connection.vendor == 'postgresql':
+            connection.close_pool()
+        connection.settings_dict['CONN_MAX_AGE'] = mode['CONN_MAX_AGE']
+        options = {k: v for k, v in original['OPTIONS'].items() if k != 'pool'}
+        if mode['pool']:
+            options['pool'] = mode['pool']
+        connection.settings_dict['OPTIONS'] = options
+
+    def run(self, handler, path, count):
+        samples = []
+        for _ in range(count):
+            started = time.perf_counter()
+            # request_started/request_finished fire here, so connections are
+            # closed or kept exactly as they would be under gunicorn.
+            response = handler(wsgi_environ(path), lambda status, headers: None)
+            b''.join(response)
+            response.close()
+            samples.append(time.perf_counter() - started)
+        return samples
@@ -0,0 +1,183 @@
+import json
+import random
+import statistics
+import time
+import tracemalloc
+from contextlib import ExitStack
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+from django.test import Client
+from django.test.utils import override_settings
+
+from core.benchmarking import (
+    AMENITY_NAMES, BENCH_AGENT_EMAIL, BENCH_PASSWORD, default_host, format_summary, summarize, write_results,
+)
+from core.cache import tiered_cache
+
+SEARCH_TERMS = ['Royal', 'Villa', 'borehole', 'Emerald Suites']
+
+# Throttles would reject most of a run from one client
+NO_THROTTLING = {
+    **settings.REST_FRAMEWORK,
+    'DEFAULT_THROTTLE_RATES': {scope: None for scope in settings.REST_FRAMEWORK['DEFAULT_THROTTLE_RATES']},
+}
+
+
+class QueryCounter:
+    def __init__(self):
+        self.count = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        self.count += 1
+        return execute(sql, params, many, context)
+
+
+class Command(BaseCommand):
+    help = (
+        "Latency (p50/p95), queries and allocations per request for the main "
+        "endpoints, driven through the Django test client against the data "
+        "from seed_bench. Timed requests run uninstrumented; queries and "
+        "allocations come from a separate, smaller pass."
+    )
+
+    cases = ['list', 'detail', 'search', 'amenity_filter', 'create', 'login']
+
+    def add_arguments(self, parser):
+        parser.add_argument('--case', action='append', choices=self.cases, help='Run only these (repeatable).')
+        parser.add_argument('--iterations', type=int, default=200, help='Timed requests per case.')
+        parser.add_argument('--warmup', type=int, default=10)
+        parser.add_argument('--instrumented', type=int, default=5, help='Requests measuring queries and allocations.')
+        parser.add_argument('--cold', action='store_true', help='Clear the caches before every request.')
+        parser.add_argument('--seed', type=int, default=42)
+        parser.add_argument('--output', help='Write results as JSON to this file.')
+        parser.add_argument('--compare', help='Earlier --output file to show the change against.')
+
+    def handle(self, *args, **options):
+        from core.models import Listing, User
+
+        agent = User.objects.filter(email=BENCH_AGENT_EMAIL).first()
+        if agent is None:
+            raise CommandError('No benchmark data; run manage.py seed_bench first.')
+        self.random = random.Random(options['seed'])
+        self.cold = options['cold']
+        self.listing_ids = list(Listing.objects.values_list('pk', flat=True)[:10_000])
+        self.client = Client(HTTP_HOST=default_host())
+        last_listing = Listing.objects.order_by('-pk').values_list('pk', flat=True).first() or 0
+
+        results = {}
+        with override_settings(REST_FRAMEWORK=NO_THROTTLING):
+            self.token = self.login().json()['access']
+            try:
+                for case in options['case'] or self.cases:
+                    results[case] = self.run(getattr(self, case), options)
+                    self.report(case, results[case])
+            finally:
+                # Leave the data set as seeded, so runs stay comparable
+                Listing.objects.filter(pk__gt=last_listing, agent=agent).delete()
+
+        if options['compare']:
+            self.compare(options['compare'], results)
+        if options['output']:
+            write_results(options['output'], 'endpoints', results, listings=Listing.objects.count(), **{
+                k: options[k] for k in ('iterations', 'cold', 'seed')
+            })
+
+    # -- cases ---------------------------------------------------------------
+
+    def list(self):
+        return self.client.get('/api/listings/')
+
+    def detail(self):
+        return self.client.get(f'/api/listings/{self.random.choice(self.listing_ids)}/')
+
+    def search(self):
+        return self.client.get('/api/listings/', {'search': self.random.choice(SEARCH_TERMS)})
+
+    def amenity_filter(self):
+        return self.client.get('/api/listings/', {'amenities': ','.join(self.random.sample(AMENITY_NAMES, 2))})
+
+    def create(self):
+        return self.client.post('/api/listings/', {
+            'lodge_name': 'Bench created lodge',
+            'description': 'Created by bench_endpoints',
+            'first_price': '75000.00',
+            'location': 'AROMA',
+            'amenity_names': self.random.sample(AMENITY_NAMES, 3),
+        }, content_type='application/json', HTTP_AUTHORIZATION=f'Bearer {self.token}')
+
+    def login(self):
+        return self.client.post(
+            '/api/token/', {'email': BENCH_AGENT_EMAIL, 'password': BENCH_PASSWORD},
+            content_type='application/json',
+        )
+
+    # -- measurement -----------------------------------------------------------
+
+    def request(self, case):
+        if self.cold:
+            cache.clear()
+            tiered_cache.clear_local()
+        started = time.perf_counter()
+        response = case()
+        return time.perf_counter() - started, response.status_code
+
+    def run(self, case, options):
+        for _ in range(options['warmup']):
+            self.request(case)
+
+        samples, errors = [], {}
+        for _ in range(options['iterations']):
+            elapsed, status = self.request(case)
+            samples.append(elapsed)
+            if status >= 400:
+                errors[status] = errors.get(status, 0) + 1
+
+        queries, peaks = [], []
+        for _ in range(options['instrumented']):
+            counter = QueryCounter()
+            with ExitStack() as stack:
+                for alias in connections:
+                    stack.enter_context(connections[alias].execute_wrapper(counter))
+                tracemalloc.start()
+                try:
+                    self.request(case)
+                    peaks.append(tracemalloc.get_traced_memory()[1])
+                finally:
+                    tracemalloc.stop()
+            queries.append(counter.count)
+
+        return {
+            'latency': summarize(samples),
+            'queries': statistics.median(queries) if queries else None,
+            'alloc_peak_kib': statistics.median(peaks) / 1024 if peaks else None,
+            'errors': errors,
+        }
+
+    def report(self, case, result):
+        line = f"{case:<15} {format_summary(result['latency'])} queries={result['queries']}"
+        if result['alloc_peak_kib'] is not None:
+            line += f" alloc_peak={result['alloc_peak_kib']:.0f}KiB"
+        self.stdout.write(line)
+        if result['errors']:
+            self.stdout.write(self.style.WARNING(f"  error responses: {result['errors']}"))
+
+    def compare(self, path, results):
+        with open(path) as fh:
+            previous = json.load(fh)
+        self.stdout.write(self.style.MIGRATE_HEADING(
+            f"\nAgainst {path} (revision {previous.get('revision')}, {previous.get('timestamp')})"
+        ))
+        for case, result in results.items():
+            before = previous['results'].get(case)
+            if not before or not before['latency'].get('count'):
+                continue
+            changes = []
+            for key in ('p50_ms', 'p95_ms'):
+                old, new = before['latency'][key], result['latency'][key]
+                changes.append(f'{key[:3]} {old:8.2f} -> {new:8.2f}ms ({(new - old) / old:+.0%})')
+            if before.get('queries') != result['queries']:
+                changes.append(f"queries {before.get('queries')} -> {result['queries']}")
+            self.stdout.write(f"{case:<15} {'  '.join(changes)}")
@@ -0,0 +1,164 @@
+import os
+import random
+import sqlite3
+import tempfile
+import threading
+import time
+
+from django.core.management.base import BaseCommand
+
+from core.benchmarking import format_summary, summarize, write_results
+from core.sqlite import apply_pragmas
+
+SCHEMA = """
+CREATE TABLE core_listing (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    title VARCHAR(255) NOT NULL,
+    description TEXT NOT NULL,
+    price DECIMAL NOT NULL,
+    location VARCHAR(100) NOT NULL,
+    is_available BOOL NOT NULL,
+    agent_id INTEGER NOT NULL,
+    created_at DATETIME NOT NULL,
+    updated_at DATETIME NOT NULL
+);
+CREATE INDEX core_listing_created ON core_listing (created_at);
+CREATE TABLE core_listingimage (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    listing_id INTEGER NOT NULL REFERENCES core_listing (id),
+    image VARCHAR(255) NOT NULL,
+    uploaded_at DATETIME NOT NULL
+);
+CREATE INDEX core_listingimage_listing ON core_listingimage (listing_id);
+"""
+
+READ_SQL = (
+    "SELECT l.id, l.title, l.price, l.location, "
+    "(SELECT image FROM core_listingimage i WHERE i.listing_id = l.id ORDER BY i.id LIMIT 1) "
+    "FROM core_listing l WHERE l.is_available = 1 ORDER BY l.created_at DESC LIMIT 20"
+)
+
+LOCATIONS = ['AROMA', 'AMANSEA', 'IFITE_ANAMBRA', 'TEMP SITE']
+
+
+class Command(BaseCommand):
+    help = (
+        "Mixed read/write SQLite throughput with the old settings (rollback "
+        "journal, deferred transactions) and the tuned profile from core.sqlite."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--readers', type=int, default=8)
+        parser.add_argument('--writers', type=int, default=2)
+        parser.add_argument('--seconds', type=float, default=5.0, help='Duration per profile.')
+        parser.add_argument('--rows', type=int, default=5000, help='Listings seeded before the run.')
+        parser.add_argument('--timeout', type=float, default=20.0, help='sqlite3 busy timeout.')
+        parser.add_argument('--output', help='Write results as JSON to this file.')
+
+    def handle(self, *args, **options):
+        results = {}
+        for profile in ('baseline', 'tuned'):
+            with tempfile.TemporaryDirectory() as directory:
+                path = os.path.join(directory, 'bench.sqlite3')
+                self.seed(path, options['rows'])
+                results[profile] = self.run(path, profile, options)
+            r = results[profile]
+            self.stdout.write(self.style.MIGRATE_HEADING(profile))
+            self.stdout.write(f"  reads  {r['reads_per_second']:9.1f}/s  {format_summary(r['read_latency'])}")
+            self.stdout.write(f"  writes {r['writes_per_second']:9.1f}/s  {format_summary(r['write_latency'])}")
+            self.stdout.write(f"  'database is locked' errors: {r['locked_errors']}")
+
+        if options['output']:
+            write_results(options['output'], 'sqlite_mixed', results, **{
+                k: options[k] for k in ('readers', 'writers', 'seconds', 'rows', 'timeout')
+            })
+
+    def connect(self, path, profile, timeout):
+        conn = sqlite3.connect(path, timeout=timeout, isolation_level=None, check_same_thread=False)
+        if profile == 'tuned':
+            apply_pragmas(conn)
+        return conn
+
+    def seed(self, path, rows):
+        conn = sqlite3.connect(path)
+        conn.executescript(SCHEMA)
+        now = time.time()
+        conn.executemany(
+            'INSERT INTO core_listing (title, description, price, location, is_available, agent_id, created_at, updated_at) '
+            'VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
+            [
+                (f'Lodge {i}', 'x' * 200, 50000 + i, random.choice(LOCATIONS), i % 5 != 0, i % 50, now - i, now - i)
+                for i in range(rows)
+            ],
+        )
+        conn.commit()
+        conn.close()
+
+    def run(self, path, profile, options):
+        begin = 'BEGIN IMMEDIATE' if profile == 'tuned' else 'BEGIN'
+        deadline = time.perf_counter() + options['seconds']
+        lock = threading.Lock()
+        reads, writes = [], []
+        locked = [0]
+
+        def reader():
+            conn = self.connect(path, profile, options['timeout'])
+            samples = []
+            while time.perf_counter() < deadline:
+                started = time.perf_counter()
+                try:
+                    conn.execute(READ_SQL).fetchall()
+                except sqlite3.OperationalError:
+                    with lock:
+                        locked[0] += 1
+                    continue
+                samples.append(time.perf_counter() - started)
+            conn.close()
+            with lock:
+                reads.extend(samples)
+
+        def writer():
+            conn = self.connect(path, profile, options['timeout'])
+            samples = []
+            while time.perf_counter() < deadline:
+                started = time.perf_counter()
+                try:
+                    # Same shape as a listing create: a read, then writes.
+                    conn.execute(begin)
+                    conn.execute('SELECT COUNT(*) FROM core_listing WHERE agent_id = 1').fetchone()
+                    now = time.time()
+                    cursor = conn.execute(
+                        'INSERT INTO core_listing (title, description, price, location, is_available, agent_id, created_at, updated_at) '
+                        'VALUES (?, ?, ?, ?, 1, 1, ?, ?)',
+                        ('New lodge', 'y' * 200, 60000, random.choice(LOCATIONS), now, now),
+                    )
+                    conn.executemany(
+                        'INSERT INTO core_listingimage (listing_id, image, uploaded_at) VALUES (?, ?, ?)',
+                        [(cursor.lastrowid, f'img{n}.jpg', now) for n in range(2)],
+                    )
+                    conn.execute('COMMIT')
+                except sqlite3.OperationalError:
+                    if conn.in_transaction:
+                        conn.execute('ROLLBACK')
+                    with lock:
+                        locked[0] += 1
+                    continue
+                samples.append(time.perf_counter() - started)
+            conn.close()
+            with lock:
+                writes.extend(samples)
+
+        threads = [threading.Thread(target=reader) for _ in range(options['readers'])]
+        threads += [threading.Thread(target=writer) for _ in range(options['writers'])]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        return {
+            'reads_per_second': len(reads) / options['seconds'],
+            'writes_per_second': len(writes) / options['seconds'],
+            'read_latency': summarize(reads),
+            'write_latency': summarize(writes),
+            'locked_errors': locked[0],
+        }
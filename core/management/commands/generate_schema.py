@@ -0,0 +1,38 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from core.schema import code_version, generate_schema, read_schema, schema_path, write_schema
+
+
+class Command(BaseCommand):
+    help = (
+        "Generate the OpenAPI schema served at /api/schema/ and store it with "
+        "the current code version. Run at build/deploy time; --check exits "
+        "non-zero when the stored schema is missing or stale."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--file', help='Schema file. Defaults to settings.OPENAPI_SCHEMA_FILE.')
+        parser.add_argument('--check', action='store_true', help='Only check that the file is current.')
+        parser.add_argument('--force', action='store_true', help='Regenerate even if the file is current.')
+
+    def handle(self, *args, **options):
+        path = options['file'] or schema_path()
+        version = code_version()
+        stored = read_schema(path)
+        current = bool(stored) and stored.get('version') == version
+
+        if options['check']:
+            if not current:
+                raise CommandError(f'{path} is missing or was not generated from code version {version}.')
+            self.stdout.write(f'{path} is current (version {version}).')
+            return
+
+        if current and not options['force']:
+            self.stdout.write(f'{path} is already current (version {version}).')
+            return
+
+        schema = generate_schema()
+        write_schema(path, version, schema)
+        self.stdout.write(self.style.SUCCESS(
+            f"Wrote {path}: {len(schema.get('paths', {}))} paths, version {version}."
+        ))
@@ -0,0 +1,57 @@
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from core.readmodel import check, prune_deletions, rebuild, refresh_listings
+
+
+class Command(BaseCommand):
+    help = (
+        "Maintain the listing_search read model (core.readmodel). rebuild "
+        "regenerates every row from the source tables; check compares every "
+        "row with them and exits non-zero on drift (--fix refreshes those rows); "
+        "prune forgets logged deletions older than --days."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('action', choices=['rebuild', 'check', 'prune'])
+        parser.add_argument('--batch-size', type=int, default=1000)
+        parser.add_argument('--database', default='default', help='Database alias.')
+        parser.add_argument('--fix', action='store_true', help='With check: refresh the rows that drifted.')
+        parser.add_argument('--limit', type=int, default=20, help='With check: drifted rows to list.')
+        parser.add_argument(
+            '--days', type=float, default=settings.LISTING_CHANGES['RETENTION_DAYS'],
+            help='With prune: days of deletions to keep (sync tokens older than that are refused).',
+        )
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        using = options['database']
+        if options['action'] == 'rebuild':
+            total = rebuild(options['batch_size'], using)
+            self.stdout.write(self.style.SUCCESS(
+                f'Rebuilt {total} rows in {time.perf_counter() - started:.1f}s'
+            ))
+            return
+        if options['action'] == 'prune':
+            pruned = prune_deletions(timezone.now() - timedelta(days=options['days']), using)
+            self.stdout.write(self.style.SUCCESS(f'Pruned {pruned} logged deletions'))
+            return
+
+        problems = check(options['batch_size'], using)
+        elapsed = time.perf_counter() - started
+        if not problems:
+            self.stdout.write(self.style.SUCCESS(f'listing_search is consistent ({elapsed:.1f}s)'))
+            return
+        for listing_id, problem in list(problems.items())[:options['limit']]:
+            self.stdout.write(f'  listing {listing_id}: {problem}')
+        if len(problems) > options['limit']:
+            self.stdout.write(f'  ... and {len(problems) - options["limit"]} more')
+        if options['fix']:
+            refresh_listings(problems, using)
+            self.stdout.write(self.style.SUCCESS(f'Refreshed {len(problems)} rows'))
+            return
+        raise CommandError(f'{len(problems)} rows of listing_search drifted; rerun with --fix or rebuild.')
@@ -0,0 +1,76 @@
+import statistics
+import time
+
+from django.conf import settings
+from django.core.handlers.base import BaseHandler
+from django.core.management.base import BaseCommand
+from django.test import RequestFactory
+
+from core.handlers import is_lean_path, middleware_setting, probed, self_times
+
+
+class Command(BaseCommand):
+    help = (
+        "Time each middleware on sample paths through the full MIDDLEWARE chain "
+        "and the lean LEAN_MIDDLEWARE chain used for stateless API routes."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--path', action='append', dest='paths',
+            help='Request path to sample (repeatable). Defaults to /api/listings/ and /admin/login/.',
+        )
+        parser.add_argument('--requests', type=int, default=200, help='Requests per path and chain.')
+        parser.add_argument('--host', help='Host header to send. Defaults to the first ALLOWED_HOSTS entry.')
+
+    def handle(self, *args, **options):
+        paths = options['paths'] or ['/api/listings/', '/admin/login/']
+        count = options['requests']
+        hosts = [h.lstrip('.') for h in settings.ALLOWED_HOSTS if h != '*']
+        self.host = options['host'] or (hosts[0] if hosts else 'localhost')
+        chains = {'full': settings.MIDDLEWARE, 'lean': settings.LEAN_MIDDLEWARE}
+
+        for path in paths:
+            lean = is_lean_path(path)
+            self.stdout.write(self.style.MIGRATE_HEADING(
+                f"{path} (served by the {'lean' if lean else 'full'} chain)"
+            ))
+            # Routes outside the lean prefixes need session/auth state, so
+            # only time the chain they actually run through.
+            names = ['full', 'lean'] if lean else ['full']
+            totals = {}
+            for name in names:
+                middleware = chains[name]
+                per_middleware, total = self.measure(path, middleware, count)
+                totals[name] = total
+                self.stdout.write(f'  {name} chain:')
+                for mw_path, samples in zip(middleware, per_middleware):
+                    median = statistics.median(samples) * 1e6 if samples else float('nan')
+                    self.stdout.write(f'    {median:9.1f} us  {mw_path}')
+                self.stdout.write(f'    {statistics.median(total) * 1e3:9.3f} ms  total request (median)')
+            if lean:
+                saved = statistics.median(totals['full']) - statistics.median(totals['lean'])
+                self.stdout.write(f'  lean chain saves {saved * 1e3:.3f} ms per request (median)')
+            self.stdout.write('')
+
+    def measure(self, path, middleware, count):
+        with middleware_setting(probed(middleware)):
+            handler = BaseHandler()
+            handler.load_middleware()
+
+        factory = RequestFactory()
+        per_middleware = [[] for _ in middleware]
+        totals = []
+        for _ in range(count):
+            request = factory.get(path, HTTP_HOST=self.host)
+            started = time.perf_counter()
+            response = handler.get_response(request)
+            totals.append(time.perf_counter() - started)
+            response.close()
+
+            marks = request.__dict__.get('_probe_marks')
+            # A middleware that answered early leaves fewer marks; skip those.
+            if marks and len(marks[0]) == len(middleware) + 1:
+                for samples, elapsed in zip(per_middleware, self_times(marks)):
+                    samples.append(elapsed)
+        return per_middleware, totals
@@ -0,0 +1,37 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from core.outbox import Consumer, compact, status
+
+
+class Command(BaseCommand):
+    help = (
+        "Maintain the listing outbox (core.outbox). status lists each consumer's "
+        "position and how many events it is behind; compact drops superseded "
+        "events and expired deletion events; seek moves a consumer to --position "
+        "(0 starts it over)."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('action', choices=['status', 'compact', 'seek'])
+        parser.add_argument('--consumer', help='With seek: the consumer to move.')
+        parser.add_argument('--position', type=int, default=0, help='With seek: the last event id to skip.')
+        parser.add_argument('--database', default='default', help='Database alias.')
+
+    def handle(self, *args, **options):
+        using = options['database']
+        if options['action'] == 'compact':
+            superseded, deletions = compact(using)
+            self.stdout.write(self.style.SUCCESS(
+                f'Dropped {superseded} superseded events and {deletions} expired deletion events'
+            ))
+        elif options['action'] == 'seek':
+            if not options['consumer']:
+                raise CommandError('seek needs --consumer.')
+            Consumer(options['consumer'], using=using).seek(options['position'])
+            self.stdout.write(self.style.SUCCESS(f'{options["consumer"]} now reads after {options["position"]}'))
+        else:
+            consumers = status(using)
+            if not consumers:
+                self.stdout.write('No consumers yet')
+            for consumer, position, behind in consumers:
+                self.stdout.write(f'  {consumer}: at {position}, {behind} events behind')
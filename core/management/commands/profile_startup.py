@@ -0,0 +1,162 @@
+import json
+import os
+import re
+import subprocess
+import sys
+from collections import defaultdict
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from core.benchmarking import write_results
+
+# Runs in a fresh interpreter, so nothing is imported yet. Times the
+# settings import, each app's module import, models import and ready(),
+# the WSGI module import and the URLconf load (the first request pays for
+# it), then prints the numbers as JSON on the last line of stdout.
+CHILD_SCRIPT = r'''
+import json, sys, time
+
+started = time.perf_counter()
+
+from django.apps.config import AppConfig
+
+apps = {}
+create = AppConfig.create.__func__
+import_models = AppConfig.import_models
+
+
+def ms(since):
+    return (time.perf_counter() - since) * 1e3
+
+
+def timed_create(cls, entry):
+    t = time.perf_counter()
+    config = create(cls, entry)
+    timing = apps[config.label] = {'name': config.name, 'import_ms': ms(t), 'models_ms': 0.0, 'ready_ms': 0.0}
+    ready = config.ready
+
+    def timed_ready():
+        t = time.perf_counter()
+        ready()
+        timing['ready_ms'] = ms(t)
+
+    config.ready = timed_ready
+    return config
+
+
+def timed_import_models(self):
+    t = time.perf_counter()
+    import_models(self)
+    apps[self.label]['models_ms'] = ms(t)
+
+
+AppConfig.create = classmethod(timed_create)
+AppConfig.import_models = timed_import_models
+
+t = time.perf_counter()
+from django.conf import settings
+settings.INSTALLED_APPS
+settings_ms = ms(t)
+
+t = time.perf_counter()
+__import__(sys.argv[1])
+wsgi_ms = ms(t)
+
+t = time.perf_counter()
+from django.urls import get_resolver
+get_resolver().url_patterns
+urlconf_ms = ms(t)
+
+print(json.dumps({
+    'settings_ms': settings_ms,
+    'wsgi_ms': wsgi_ms,
+    'urlconf_ms': urlconf_ms,
+    'total_ms': ms(started),
+    'apps': apps,
+}))
+'''
+
+IMPORTTIME_LINE = re.compile(r'^import time:\s+(\d+) \|\s+(\d+) \|( *)(\S+)$')
+
+
+class Command(BaseCommand):
+    help = (
+        "Profile a cold start: time the settings import, each app's import, "
+        "models and ready(), the WSGI module import and the URLconf load in a "
+        "fresh interpreter, with per-package import time from -X importtime. "
+        "Use --budget-ms in CI to fail when the cold start gets slower."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--runs', type=int, default=3, help='Fresh interpreters to start; the median run is reported.')
+        parser.add_argument('--top', type=int, default=15, help='Packages and modules to list.')
+        parser.add_argument(
+            '--budget-ms', type=float,
+            help='Fail if the WSGI import plus URLconf load (what the first request waits for) exceeds this.',
+        )
+        parser.add_argument('--output', help='Write results as JSON to this file.')
+
+    def handle(self, *args, **options):
+        runs = sorted((self.profile() for _ in range(max(1, options['runs']))), key=lambda r: r['total_ms'])
+        run = runs[len(runs) // 2]
+        cold_start_ms = run['wsgi_ms'] + run['urlconf_ms']
+
+        self.stdout.write(self.style.MIGRATE_HEADING('Phases'))
+        wsgi_module = settings.WSGI_APPLICATION.rsplit('.', 1)[0]
+        for label, value in [
+            ('settings import', run['settings_ms']),
+            (f'{wsgi_module} import (apps included)', run['wsgi_ms']),
+            ('URLconf load', run['urlconf_ms']),
+            ('interpreter total', run['total_ms']),
+        ]:
+            self.stdout.write(f'  {label:<45} {value:8.1f} ms')
+
+        self.stdout.write(self.style.MIGRATE_HEADING('Apps (import / models / ready)'))
+        apps = sorted(
+            run['apps'].values(), key=lambda a: a['import_ms'] + a['models_ms'] + a['ready_ms'], reverse=True,
+        )
+        for app in apps:
+            self.stdout.write(
+                f"  {app['name']:<45} {app['import_ms']:7.1f} {app['models_ms']:7.1f} {app['ready_ms']:7.1f} ms"
+            )
+
+        self.stdout.write(self.style.MIGRATE_HEADING('Import time by top-level package (self time)'))
+        for package, self_ms in run['packages'][:options['top']]:
+            self.stdout.write(f'  {package:<45} {self_ms:8.1f} ms')
+
+        self.stdout.write(self.style.MIGRATE_HEADING('Slowest modules (cumulative)'))
+        for module, cumulative_ms in run['modules'][:options['top']]:
+            self.stdout.write(f'  {module:<60} {cumulative_ms:8.1f} ms')
+
+        if options['output']:
+            write_results(options['output'], 'startup', run, runs=len(runs), cold_start_ms=cold_start_ms)
+
+        budget = options['budget_ms']
+        if budget is not None:
+            if cold_start_ms > budget:
+                raise CommandError(f'Cold start took {cold_start_ms:.1f} ms, over the {budget:.0f} ms budget.')
+            self.stdout.write(self.style.SUCCESS(f'Cold start {cold_start_ms:.1f} ms is within the {budget:.0f} ms budget.'))
+
+    def profile(self):
+        module = settings.WSGI_APPLICATION.rsplit('.', 1)[0]
+        process = subprocess.run(
+            [sys.executable, '-X', 'importtime', '-c', CHILD_SCRIPT, module],
+            cwd=settings.BASE_DIR, env=os.environ.copy(), capture_output=True, text=True,
+        )
+        if process.returncode:
+            raise CommandError(f'Startup profile failed:\n{process.stderr}')
+        result = json.loads(process.stdout.strip().splitlines()[-1])
+
+        packages = defaultdict(float)
+        modules = []
+        for line in process.stderr.splitlines():
+            match = IMPORTTIME_LINE.match(line)
+            if not match:
+                continue
+            self_us, cumulative_us, _, name = match.groups()
+            packages[name.split('.')[0]] += int(self_us) / 1e3
+            modules.append((name, int(cumulative_us) / 1e3))
+        result['packages'] = sorted(packages.items(), key=lambda item: item[1], reverse=True)
+        result['modules'] = sorted(modules, key=lambda item: item[1], reverse=True)
+        return result
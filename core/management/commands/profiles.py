@@ -0,0 +1,117 @@
+import json
+import shutil
+import sys
+from collections import Counter
+
+from django.core.management.base import BaseCommand, CommandError
+
+from core.profiling import (
+    capture_directory, capture_ids, folded_stacks, load_capture, profile_path, summarize, top_functions,
+)
+
+
+class Command(BaseCommand):
+    help = (
+        "List, inspect and download the request profiles kept by "
+        "ProfilingMiddleware (PROFILING['DIRECTORY'] on this host)."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('action', choices=['list', 'show', 'download'])
+        parser.add_argument('capture_id', nargs='?', help='Capture to show or download.')
+        parser.add_argument('--limit', type=int, default=20, help='Captures to list, or rows to show per section.')
+        parser.add_argument(
+            '--file', choices=['prof', 'json', 'stacks'],
+            help='What to download: pstats data (default when present), the capture JSON, or folded stacks.',
+        )
+        parser.add_argument('--output', help="Download destination. Defaults to the capture's file name; - for stdout.")
+
+    def handle(self, *args, **options):
+        if options['action'] == 'list':
+            return self.list(options['limit'])
+        if not options['capture_id']:
+            raise CommandError(f"{options['action']} needs a capture id; see 'profiles list'.")
+        capture_id = options['capture_id']
+        capture = load_capture(capture_id) if capture_id in capture_ids() else None
+        if capture is None:
+            raise CommandError(f'No capture {capture_id} in {capture_directory()}.')
+        if options['action'] == 'show':
+            self.show(capture, options['limit'])
+        else:
+            self.download(capture, options['file'], options['output'])
+
+    def list(self, limit):
+        ids = capture_ids()
+        if not ids:
+            self.stdout.write(f'No captures in {capture_directory()}.')
+            return
+        self.stdout.write(f"{'id':<25} {'reasons':<15} {'ms':>9} {'queries':>7}  request")
+        for capture_id in ids[:limit]:
+            capture = load_capture(capture_id)
+            if capture is None:
+                continue
+            summary = summarize(capture)
+            self.stdout.write(
+                f"{summary['id']:<25} {','.join(summary['reasons']):<15} {summary['duration_ms']:9.1f} "
+                f"{summary['queries']:7d}  {summary['method']} {summary['path']} -> {summary['status']}"
+            )
+        if len(ids) > limit:
+            self.stdout.write(f'... {len(ids) - limit} older captures (--limit)')
+
+    def show(self, capture, limit):
+        summary = summarize(capture)
+        self.stdout.write(self.style.MIGRATE_HEADING(
+            f"{summary['method']} {summary['path']} -> {summary['status']} "
+            f"in {summary['duration_ms']:.1f} ms ({', '.join(summary['reasons'])})"
+        ))
+        self.stdout.write(f"captured {summary['created']} by pid {capture.get('pid')}")
+        self.stdout.write(f"SQL: {summary['queries']} queries, {summary['sql_ms']:.1f} ms")
+        if summary['tracemalloc_peak'] is not None:
+            self.stdout.write(f"tracemalloc peak: {summary['tracemalloc_peak'] / 1024:.0f} KiB")
+
+        functions = top_functions(capture['id'], limit)
+        if functions:
+            self.stdout.write(self.style.MIGRATE_HEADING('\nTop functions (cumulative)'))
+            for row in functions:
+                self.stdout.write(
+                    f"  {row['cumulative_ms']:9.2f} ms {row['own_ms']:9.2f} ms own {row['calls']:7d}x  {row['function']}"
+                )
+
+        # Grouped by their innermost frames; the outer ones are the server
+        stacks = Counter()
+        for stack, count in capture.get('stacks', {}).items():
+            stacks[' <- '.join(reversed(stack.split(';')[-4:]))] += count
+        if stacks:
+            total = sum(stacks.values())
+            self.stdout.write(self.style.MIGRATE_HEADING(f'\nHottest sampled stacks ({total} samples)'))
+            for stack, count in stacks.most_common(limit):
+                self.stdout.write(f'  {count / total:6.1%}  {stack}')
+
+        queries = sorted(capture['sql'], key=lambda query: -query['ms'])
+        if queries:
+            self.stdout.write(self.style.MIGRATE_HEADING('\nSlowest queries'))
+            for query in queries[:limit]:
+                self.stdout.write(f"  {query['ms']:9.2f} ms [{query['database']}] {query['sql'][:200]}")
+
+    def download(self, capture, kind, output):
+        capture_id = capture['id']
+        kind = kind or ('prof' if profile_path(capture_id) else 'json')
+        if kind == 'prof':
+            source = profile_path(capture_id)
+            if source is None:
+                raise CommandError(f'{capture_id} was captured by the stack sampler and has no cProfile data.')
+            output = output or f'{capture_id}.prof'
+            if output == '-':
+                with open(source, 'rb') as fh:
+                    shutil.copyfileobj(fh, sys.stdout.buffer)
+                return
+            shutil.copyfile(source, output)
+        else:
+            content = folded_stacks(capture) if kind == 'stacks' else json.dumps(capture, indent=2)
+            output = output or f"{capture_id}.{'folded.txt' if kind == 'stacks' else 'json'}"
+            if output == '-':
+                self.stdout.write(content, ending='')
+                return
+            with open(output, 'w') as fh:
+                fh.write(content)
+        self.stderr.write(self.style.SUCCESS(f'Wrote {output}'))
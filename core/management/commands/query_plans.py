@@ -0,0 +1,55 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+
+from core.queryplans import VENDORS, capture, compare, load_snapshot, save_snapshot, snapshot_path
+
+
+class Command(BaseCommand):
+    help = (
+        "Explain the canonical listing list/detail queries and compare the "
+        "plans with the snapshot for this database vendor. check fails when "
+        "a query now scans a whole table or its estimated cost jumps; update "
+        "rewrites the snapshot. Run against seed_bench data (--scale 1k)."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('action', nargs='?', choices=['check', 'update', 'show'], default='check')
+        parser.add_argument('--database', default='default', help='Database alias.')
+        parser.add_argument(
+            '--cost-factor', type=float, default=2.0,
+            help='Fail when an estimated cost grows by more than this factor (Postgres).',
+        )
+
+    def handle(self, *args, **options):
+        connection = connections[options['database']]
+        if connection.vendor not in VENDORS:
+            raise CommandError(f'Query plans are only captured on SQLite and Postgres, not {connection.vendor}.')
+
+        # Plans follow the planner statistics, so refresh them first
+        with connection.cursor() as cursor:
+            cursor.execute('ANALYZE')
+        current = capture(options['database'])
+
+        if options['action'] == 'show':
+            for name, plan in current.items():
+                self.stdout.write(self.style.MIGRATE_HEADING(name))
+                self.stdout.write('  ' + plan['sql'][:300])
+                for line in plan['plan']:
+                    self.stdout.write(f'    {line}')
+            return
+        if options['action'] == 'update':
+            path = save_snapshot(connection.vendor, current)
+            self.stdout.write(self.style.SUCCESS(f'Wrote {len(current)} plans to {path}'))
+            return
+
+        snapshot = load_snapshot(connection.vendor)
+        if snapshot is None:
+            raise CommandError(f"No snapshot at {snapshot_path(connection.vendor)}; run 'query_plans update'.")
+        regressions, changes = compare(snapshot, current, options['cost_factor'])
+        for change in changes:
+            self.stdout.write(self.style.WARNING(change))
+        if regressions:
+            raise CommandError('Query plans regressed:\n' + '\n'.join(regressions))
+        self.stdout.write(self.style.SUCCESS(
+            f'{len(current)} plans checked' + (f", {len(changes)} changed; run 'query_plans update'" if changes else '')
+        ))
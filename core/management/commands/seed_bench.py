@@ -0,0 +1,140 @@
+import random
+import time
+from decimal import Decimal
+
+from django.contrib.auth.hashers import make_password
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from core.benchmarking import AMENITY_NAMES, BENCH_EMAIL_DOMAIN, BENCH_PASSWORD
+from core.cache import tiered_cache
+from core.models import LOCATION_CHOICES, Amenity, Listing, ListingImage, User
+from core.readmodel import refresh_listings
+
+SCALES = {'1k': 1_000, '100k': 100_000, '1m': 1_000_000}
+
+NAME_WORDS = ['Royal', 'Golden', 'Unity', 'Grace', 'Emerald', 'Sunrise', 'Peace', 'Cedar', 'Victory', 'Palm']
+NAME_KINDS = ['Lodge', 'Hostel', 'Court', 'Villa', 'Apartments', 'Suites']
+DESCRIPTIONS = [
+    'Quiet compound close to the school gate.',
+    'Tiled rooms with wardrobe and ceiling fan.',
+    'Constant water supply and a borehole on site.',
+    'Walking distance to the market and bus stop.',
+    'Newly painted, with a fenced and gated compound.',
+    'Prepaid meter in every room.',
+]
+
+
+class Command(BaseCommand):
+    help = (
+        "Bulk-generate benchmark users, agents, amenities, listings and images "
+        f"(users are under @{BENCH_EMAIL_DOMAIN}, password '{BENCH_PASSWORD}'). "
+        "Tops up to the requested size, so it can be rerun to grow a data set."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--scale', choices=SCALES, default='1k', help='Number of listings.')
+        parser.add_argument('--listings', type=int, help='Exact number of listings; overrides --scale.')
+        parser.add_argument('--listings-per-agent', type=int, default=50)
+        parser.add_argument('--users-per-listing', type=float, default=0.5, help='Non-agent users per listing.')
+        parser.add_argument('--max-images', type=int, default=4, help='Each listing gets 1 to this many images.')
+        parser.add_argument('--batch-size', type=int, default=5000)
+        parser.add_argument('--seed', type=int, default=42)
+        parser.add_argument('--reset', action='store_true', help='Delete the benchmark data instead.')
+
+    def handle(self, *args, **options):
+        if options['reset']:
+            return self.reset()
+
+        self.random = random.Random(options['seed'])
+        self.batch_size = options['batch_size']
+        listings = options['listings'] if options['listings'] is not None else SCALES[options['scale']]
+        # Hashing once keeps a million users affordable; they all share the password
+        self.password = make_password(BENCH_PASSWORD)
+
+        started = time.perf_counter()
+        amenity_ids = self.seed_amenities()
+        agent_ids = self.seed_users('agent', max(1, listings // options['listings_per_agent']), is_agent=True)
+        self.seed_users('user', int(listings * options['users_per_listing']), is_agent=False)
+        self.seed_listings(listings, agent_ids, amenity_ids, options['max_images'])
+        tiered_cache.invalidate_tags('listings', 'amenities')
+        self.stdout.write(self.style.SUCCESS(f'Seeded in {time.perf_counter() - started:.1f}s'))
+
+    def seed_amenities(self):
+        existing = set(Amenity.objects.filter(name__in=AMENITY_NAMES).values_list('name', flat=True))
+        Amenity.objects.bulk_create([Amenity(name=name) for name in AMENITY_NAMES if name not in existing])
+        return list(Amenity.objects.filter(name__in=AMENITY_NAMES).values_list('pk', flat=True))
+
+    def seed_users(self, kind, count, is_agent):
+        emails = [f'{kind}-{n}@{BENCH_EMAIL_DOMAIN}' for n in range(count)]
+        existing = set(
+            User.objects.filter(email__endswith=f'@{BENCH_EMAIL_DOMAIN}', email__startswith=f'{kind}-')
+            .values_list('email', flat=True)
+        )
+        missing = [email for email in emails if email not in existing]
+        for start in range(0, len(missing), self.batch_size):
+            batch = missing[start:start + self.batch_size]
+            User.objects.bulk_create([
+                User(
+                    email=email, username=email, password=self.password,
+                    full_name=f'Bench {kind.title()} {email.split("@")[0].split("-")[1]}',
+                    phone_number=f'080{self.random.randrange(10**8):08d}',
+                    is_agent=is_agent,
+                    agency_name=f'{self.random.choice(NAME_WORDS)} Realty' if is_agent else None,
+                )
+                for email in batch
+            ], batch_size=self.batch_size)
+        self.stdout.write(f'{kind}s: {count} ({len(missing)} new)')
+        if not is_agent:
+            return None
+        agents = User.objects.filter(email__in=emails).values_list('pk', 'agency_name')
+        return list(agents)
+
+    def seed_listings(self, count, agents, amenity_ids, max_images):
+        existing = Listing.objects.filter(agent__email__endswith=f'@{BENCH_EMAIL_DOMAIN}').count()
+        locations = [value for value, _ in LOCATION_CHOICES]
+        room_types = [value for value, _ in Listing.ROOM_TYPE_CHOICES]
+        Through = Listing.amenities.through
+
+        for start in range(existing, count, self.batch_size):
+            stop = min(count, start + self.batch_size)
+            rows = []
+            for n in range(start, stop):
+                agent_id, agency = self.random.choice(agents)
+                price = Decimal(self.random.randrange(40, 600) * 1000)
+                rows.append(Listing(
+                    lodge_name=f'{self.random.choice(NAME_WORDS)} {self.random.choice(NAME_KINDS)} {n}',
+                    description=' '.join(self.random.sample(DESCRIPTIONS, 3)),
+                    first_price=price,
+                    year_price=price * 10 if self.random.random() < 0.5 else None,
+                    location=self.random.choice(locations),
+                    room_type=self.random.choice(room_types),
+                    total_rooms=self.random.randint(1, 30),
+                    room_number=str(self.random.randint(1, 40)),
+                    agent_id=agent_id,
+                    agency=agency,
+                    is_available=self.random.random() < 0.85,
+                    contact_phone=f'080{self.random.randrange(10**8):08d}',
+                ))
+            with transaction.atomic():
+                listings = Listing.objects.bulk_create(rows, batch_size=self.batch_size)
+                images, links = [], []
+                for n, listing in zip(range(start, stop), listings):
+                    for i in range(self.random.randint(1, max_images)):
+                        images.append(ListingImage(listing=listing, image=f'bench/lodge-{n}-{i}', is_primary=i == 0))
+                    for amenity_id in self.random.sample(amenity_ids, self.random.randint(2, 6)):
+                        links.append(Through(listing_id=listing.pk, amenity_id=amenity_id))
+                ListingImage.objects.bulk_create(images, batch_size=self.batch_size)
+                Through.objects.bulk_create(links, batch_size=self.batch_size)
+                # bulk_create skips the signals that maintain the read model
+                refresh_listings([listing.pk for listing in listings])
+            self.stdout.write(f'listings: {stop}/{count}')
+        if existing >= count:
+            self.stdout.write(f'listings: {existing} (none new)')
+
+    def reset(self):
+        with transaction.atomic():
+            deleted, _ = Listing.objects.filter(agent__email__endswith=f'@{BENCH_EMAIL_DOMAIN}').delete()
+            users, _ = User.objects.filter(email__endswith=f'@{BENCH_EMAIL_DOMAIN}').delete()
+        tiered_cache.invalidate_tags('listings', 'amenities')
+        self.stdout.write(self.style.SUCCESS(f'Deleted {deleted} listing rows and {users} user rows'))
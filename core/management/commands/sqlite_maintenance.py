@@ -0,0 +1,44 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+
+
+class Command(BaseCommand):
+    help = (
+        "Checkpoint the SQLite write-ahead log and run PRAGMA optimize. "
+        "Use --interval to keep running periodically (e.g. as a sidecar process)."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--database', default='default', help='Database alias.')
+        parser.add_argument(
+            '--mode', default='TRUNCATE', choices=['PASSIVE', 'FULL', 'RESTART', 'TRUNCATE'],
+            help='wal_checkpoint mode (TRUNCATE also shrinks the -wal file).',
+        )
+        parser.add_argument('--interval', type=int, help='Repeat every N seconds until interrupted.')
+
+    def handle(self, *args, **options):
+        connection = connections[options['database']]
+        if connection.vendor != 'sqlite':
+            raise CommandError(f"Database '{options['database']}' is {connection.vendor}, not SQLite.")
+
+        while True:
+            self.run_once(connection, options['mode'])
+            if not options['interval']:
+                break
+            time.sleep(options['interval'])
+
+    def run_once(self, connection, mode):
+        started = time.perf_counter()
+        with connection.cursor() as cursor:
+            cursor.execute(f'PRAGMA wal_checkpoint({mode})')
+            busy, log_frames, checkpointed = cursor.fetchone()
+            cursor.execute('PRAGMA optimize')
+        elapsed = (time.perf_counter() - started) * 1e3
+        self.stdout.write(
+            f'checkpoint {mode}: busy={busy} wal_frames={log_frames} '
+            f'checkpointed={checkpointed}; optimize done in {elapsed:.1f} ms'
+        )
+        # Release the connection so the next round starts fresh.
+        connection.close()
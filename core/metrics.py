@@ -0,0 +1,375 @@
+# core/metrics.py
+"""
+Per-request timings, Server-Timing headers and Prometheus metrics.
+
+MetricsMiddleware puts a RequestTimings in a context variable for each
+request, so it follows the request into sync_to_async threads. While it is
+set, these hooks record into it:
+
+- a database execute wrapper (query count and time), installed on every
+  connection as it is created;
+- TimedSerializerMixin on the core serializers (outermost
+  to_representation only, including any queries it triggers);
+- the middleware's template-response hook (DRF response rendering);
+- external_call() around SendGrid, Cloudinary and Google requests
+  (minus any database time inside the block).
+
+The totals go out as a Server-Timing header and into per-route counters
+and histograms. Each worker keeps its own and writes them to
+METRICS['DIRECTORY'] every FLUSH_SECONDS; /metrics sums the files of all
+workers on the host, plus the archive of workers that have exited.
+Each snapshot also carries the worker's tiered cache counters (core.cache),
+so cache hit rates are summed across workers the same way.
+"""
+import atexit
+import bisect
+import fcntl
+import hmac
+import ipaddress
+import json
+import os
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.http import HttpResponse, HttpResponseForbidden
+
+current_timings = ContextVar('current_timings', default=None)
+
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+ARCHIVE_FILE = 'archived.json'
+
+METRIC_HELP = {
+    'http_request_duration_seconds': ('histogram', 'Time from the first to the last middleware.'),
+    'http_request_db_seconds': ('histogram', 'Database time per request.'),
+    'http_request_db_queries_total': ('counter', 'Database queries executed.'),
+    'http_request_serialize_seconds_total': ('counter', 'Time spent in serializers.'),
+    'http_request_render_seconds_total': ('counter', 'Time spent rendering responses.'),
+    'http_request_external_seconds_total': ('counter', 'Time spent calling external services.'),
+    'tiered_cache_hits_total': ('counter', 'Tiered cache lookups answered, by tier.'),
+    'tiered_cache_misses_total': ('counter', 'Tiered cache lookups a tier could not answer.'),
+    'tiered_cache_negative_hits_total': ('counter', 'Lookups answered by a cached missing row.'),
+    'tiered_cache_evictions_total': ('counter', 'Entries evicted to keep a tier within its size.'),
+    'tiered_cache_sets_total': ('counter', 'Values written to the tiered cache.'),
+    'tiered_cache_tag_invalidations_total': ('counter', 'Cache tags invalidated.'),
+}
+
+
+def metrics_config():
+    return getattr(settings, 'METRICS', {})
+
+
+class RequestTimings:
+    __slots__ = ('started', 'db_queries', 'db', 'serialize', 'render', 'external', 'serializing')
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.db_queries = 0
+        self.db = 0.0
+        self.serialize = 0.0
+        self.render = 0.0
+        self.external = {}
+        self.serializing = 0
+
+    def server_timing(self, total):
+        parts = [
+            f'db;dur={self.db * 1e3:.1f};desc="{self.db_queries} queries"',
+            f'serialize;dur={self.serialize * 1e3:.1f}',
+            f'render;dur={self.render * 1e3:.1f}',
+        ]
+        parts += [f'ext-{service};dur={seconds * 1e3:.1f}' for service, seconds in self.external.items()]
+        parts.append(f'total;dur={total * 1e3:.1f}')
+        return ', '.join(parts)
+
+
+def record_query(execute, sql, params, many, context):
+    timings = current_timings.get()
+    if timings is None:
+        return execute(sql, params, many, context)
+    started = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        timings.db += time.perf_counter() - started
+        timings.db_queries += 1
+
+
+def install_query_recorder(sender, connection, **kwargs):
+    """connection_created receiver; execute_wrappers outlive reconnects."""
+    if record_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(record_query)
+
+
+@contextmanager
+def timed(component):
+    """Add the block's duration to ``component`` ('serialize' or 'render')."""
+    timings = current_timings.get()
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        if timings is not None:
+            setattr(timings, component, getattr(timings, component) + time.perf_counter() - started)
+
+
+@contextmanager
+def external_call(service):
+    """Time a call to an external service, excluding database time inside it."""
+    timings = current_timings.get()
+    if timings is None:
+        yield
+        return
+    started = time.perf_counter()
+    db_before = timings.db
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - started - (timings.db - db_before)
+        timings.external[service] = timings.external.get(service, 0.0) + max(0.0, elapsed)
+
+
+class TimedSerializerMixin:
+    """Count serializer time once, at the outermost to_representation()."""
+
+    def to_representation(self, instance):
+        timings = current_timings.get()
+        if timings is None or timings.serializing:
+            return super().to_representation(instance)
+        timings.serializing += 1
+        started = time.perf_counter()
+        try:
+            return super().to_representation(instance)
+        finally:
+            timings.serializing -= 1
+            timings.serialize += time.perf_counter() - started
+
+
+# -- per-worker registry ----------------------------------------------------
+
+def _empty():
+    return {'histograms': {}, 'counters': {}}
+
+
+def _merge(into, data):
+    for key, (buckets, total, count) in data['histograms'].items():
+        entry = into['histograms'].setdefault(key, [[0] * len(buckets), 0.0, 0])
+        entry[0] = [a + b for a, b in zip(entry[0], buckets)]
+        entry[1] += total
+        entry[2] += count
+    for key, value in data['counters'].items():
+        into['counters'][key] = into['counters'].get(key, 0) + value
+    return into
+
+
+def _read(path):
+    try:
+        with open(path) as fh:
+            return json.load(fh)
+    except (OSError, ValueError):
+        return _empty()
+
+
+def _write(path, data):
+    directory = os.path.dirname(path)
+    fd, tmp = tempfile.mkstemp(dir=directory, prefix='.metrics-')
+    with os.fdopen(fd, 'w') as fh:
+        json.dump(data, fh)
+    os.replace(tmp, path)
+
+
+def _key(name, labels):
+    # JSON object keys must be strings
+    return json.dumps([name, labels])
+
+
+def cache_counters():
+    """This worker's tiered cache counters, as (name, labels, value)."""
+    from .cache import tiered_cache
+
+    stats = tiered_cache.stats()
+    return [
+        ('tiered_cache_hits_total', {'tier': 'local'}, stats['local_hits']),
+        ('tiered_cache_hits_total', {'tier': 'shared'}, stats['shared_hits']),
+        # Every shared lookup is a local miss
+        ('tiered_cache_misses_total', {'tier': 'local'}, stats['shared_hits'] + stats['misses']),
+        ('tiered_cache_misses_total', {'tier': 'shared'}, stats['misses']),
+        ('tiered_cache_negative_hits_total', {}, stats['negative_hits']),
+        ('tiered_cache_evictions_total', {'tier': 'local'}, stats['local_evictions']),
+        ('tiered_cache_sets_total', {}, stats['sets']),
+        ('tiered_cache_tag_invalidations_total', {}, stats['tag_invalidations']),
+    ]
+
+
+class MetricsRegistry:
+    def __init__(self, directory=None, flush_seconds=5):
+        self.directory = directory
+        self.flush_seconds = flush_seconds
+        self.pid = os.getpid()
+        self._data = _empty()
+        self._lock = threading.Lock()
+        self._flusher = None
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+            atexit.register(self.flush)
+
+    def record(self, method, route, status, timings, total):
+        labels = {'method': method, 'route': route}
+        with self._lock:
+            self._observe('http_request_duration_seconds', {**labels, 'status': str(status)}, total)
+            self._observe('http_request_db_seconds', labels, timings.db)
+            self._inc('http_request_db_queries_total', labels, timings.db_queries)
+            self._inc('http_request_serialize_seconds_total', labels, timings.serialize)
+            self._inc('http_request_render_seconds_total', labels, timings.render)
+            for service, seconds in timings.external.items():
+                self._inc('http_request_external_seconds_total', {**labels, 'service': service}, seconds)
+            if self.directory and self._flusher is None:
+                self._flusher = threading.Thread(target=self._flush_periodically, name='metrics-flush', daemon=True)
+                self._flusher.start()
+
+    def _flush_periodically(self):
+        # Idle workers still publish their last numbers
+        while True:
+            time.sleep(self.flush_seconds)
+            self.flush()
+
+    def _observe(self, name, labels, value):
+        entry = self._data['histograms'].setdefault(_key(name, labels), [[0] * (len(DURATION_BUCKETS) + 1), 0.0, 0])
+        entry[0][bisect.bisect_left(DURATION_BUCKETS, value)] += 1
+        entry[1] += value
+        entry[2] += 1
+
+    def _inc(self, name, labels, value):
+        key = _key(name, labels)
+        self._data['counters'][key] = self._data['counters'].get(key, 0) + value
+
+    def snapshot(self):
+        with self._lock:
+            data = json.loads(json.dumps(self._data))
+        # Cumulative per-process totals: set, not added, so each flush
+        # replaces the worker's previous numbers
+        for name, labels, value in cache_counters():
+            data['counters'][_key(name, labels)] = value
+        return data
+
+    def flush(self):
+        if not self.directory or os.getpid() != self.pid:
+            return
+        try:
+            _write(os.path.join(self.directory, f'{self.pid}.json'), self.snapshot())
+        except OSError:
+            pass
+
+    def collect(self):
+        """This worker's live numbers plus every other worker's last flush."""
+        merged = _merge(_empty(), self.snapshot())
+        if self.directory:
+            own = f'{self.pid}.json'
+            for name in os.listdir(self.directory):
+                if name.endswith('.json') and name != own:
+                    _merge(merged, _read(os.path.join(self.directory, name)))
+        return merged
+
+
+def archive_worker(directory, pid):
+    """
+    Fold an exited worker's file into the archive so its counts survive and
+    the directory doesn't grow with every worker recycle. Called from the
+    gunicorn master (child_exit), so it must not need Django settings.
+    """
+    path = os.path.join(directory, f'{pid}.json')
+    if not os.path.exists(path):
+        return
+    with open(os.path.join(directory, '.archive.lock'), 'w') as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        archive = os.path.join(directory, ARCHIVE_FILE)
+        _write(archive, _merge(_read(archive), _read(path)))
+        os.unlink(path)
+
+
+_registry = None
+_registry_lock = threading.Lock()
+
+
+def get_registry():
+    global _registry
+    if _registry is None or _registry.pid != os.getpid():
+        with _registry_lock:
+            if _registry is None or _registry.pid != os.getpid():
+                config = metrics_config()
+                _registry = MetricsRegistry(config.get('DIRECTORY'), config.get('FLUSH_SECONDS', 5))
+    return _registry
+
+
+# -- exposition ---------------------------------------------------------------
+
+def _escape(value):
+    return str(value).replace('\\', r'\\').replace('"', r'\"').replace('\n', r'\n')
+
+
+def _labels(labels, **extra):
+    items = {**labels, **extra}
+    if not items:
+        return ''
+    return '{' + ','.join(f'{k}="{_escape(v)}"' for k, v in items.items()) + '}'
+
+
+def render_prometheus(data):
+    by_name = {}
+    for kind in ('histograms', 'counters'):
+        for key, value in data[kind].items():
+            name, labels = json.loads(key)
+            by_name.setdefault(name, []).append((labels, value))
+
+    lines = []
+    for name in sorted(by_name):
+        kind, description = METRIC_HELP.get(name, ('untyped', ''))
+        lines.append(f'# HELP {name} {description}')
+        lines.append(f'# TYPE {name} {kind}')
+        for labels, value in sorted(by_name[name], key=lambda item: sorted(item[0].items())):
+            if kind == 'histogram':
+                buckets, total, count = value
+                cumulative = 0
+                for bound, observed in zip(DURATION_BUCKETS, buckets):
+                    cumulative += observed
+                    lines.append(f'{name}_bucket{_labels(labels, le=bound)} {cumulative}')
+                lines.append(f'{name}_bucket{_labels(labels, le="+Inf")} {count}')
+                lines.append(f'{name}_sum{_labels(labels)} {total:.6f}')
+                lines.append(f'{name}_count{_labels(labels)} {count}')
+            else:
+                formatted = value if isinstance(value, int) else f'{value:.6f}'
+                lines.append(f'{name}{_labels(labels)} {formatted}')
+    return '\n'.join(lines) + '\n'
+
+
+def may_read_metrics(request):
+    """
+    With METRICS['TOKEN'] set, only "Authorization: Bearer <token>". Without
+    one, a DEBUG server, or a scraper on the host's own network talking to
+    the worker directly: anything that came through the public proxy carries
+    X-Forwarded-For.
+    """
+    token = metrics_config().get('TOKEN')
+    if token:
+        return hmac.compare_digest(request.headers.get('Authorization', ''), f'Bearer {token}')
+    if settings.DEBUG:
+        return True
+    if 'X-Forwarded-For' in request.headers:
+        return False
+    try:
+        address = ipaddress.ip_address(request.META.get('REMOTE_ADDR', ''))
+    except ValueError:
+        return False
+    return address.is_loopback or address.is_private
+
+
+def metrics_view(request):
+    if not may_read_metrics(request):
+        return HttpResponseForbidden()
+    return HttpResponse(
+        render_prometheus(get_registry().collect()),
+        content_type='text/plain; version=0.0.4; charset=utf-8',
+    )
@@ -0,0 +1,250 @@
+# core/middleware.py
+import cProfile
+import random
+import threading
+import time
+from contextlib import ExitStack
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+from django.http import JsonResponse
+
+from .metrics import RequestTimings, current_timings, get_registry, metrics_config
+from .profiling import (
+    QueryLog, capture_record, get_sampler, profiling_config, save_capture, start_tracemalloc,
+    stop_tracemalloc,
+)
+
+
+def request_queue_seconds(request, header):
+    """
+    Time a request spent queued before reaching the worker, from a proxy
+    header such as ``X-Request-Start: t=1700000000.123``. Accepts seconds,
+    milliseconds or microseconds since the epoch.
+    """
+    value = request.META.get(header)
+    if not value:
+        return None
+    try:
+        started = float(value.strip().removeprefix('t='))
+    except ValueError:
+        return None
+    # Normalise ms/us timestamps to seconds by magnitude.
+    while started > 1e11:
+        started /= 1000
+    return max(0.0, time.time() - started)
+
+
+class InFlight:
+    """Requests in progress in this worker, across every middleware chain."""
+
+    def __init__(self):
+        self.count = 0
+        self._lock = threading.Lock()
+
+    def enter(self, limit=None):
+        """Count a request in, unless ``limit`` are already in progress."""
+        with self._lock:
+            if limit is not None and self.count >= limit:
+                return False
+            self.count += 1
+            return True
+
+    def leave(self):
+        with self._lock:
+            self.count -= 1
+
+
+# One per worker process: the full and lean handlers (core.handlers) each
+# build their own LoadSheddingMiddleware, and both must share the cap
+in_flight = InFlight()
+
+
+class LoadSheddingMiddleware:
+    """
+    Reject requests with 503 + Retry-After while the worker is saturated,
+    instead of queueing them until latency collapses for everyone.
+
+    A request is shed when the worker already has LOAD_SHEDDING['MAX_IN_FLIGHT']
+    requests in progress (threaded and ASGI workers), or when the proxy's
+    queue-time header says it waited longer than MAX_QUEUE_SECONDS. Probes
+    under EXEMPT_PATHS are neither shed nor counted.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        config = getattr(settings, 'LOAD_SHEDDING', {})
+        self.max_in_flight = config.get('MAX_IN_FLIGHT')
+        self.max_queue_seconds = config.get('MAX_QUEUE_SECONDS')
+        self.queue_header = config.get('QUEUE_HEADER', 'HTTP_X_REQUEST_START')
+        self.retry_after = config.get('RETRY_AFTER', 5)
+        self.exempt_paths = tuple(config.get('EXEMPT_PATHS', ()))
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        if request.path.startswith(self.exempt_paths):
+            return self.get_response(request)
+        if not self.admit(request):
+            return self.overloaded()
+        try:
+            return self.get_response(request)
+        finally:
+            in_flight.leave()
+
+    async def __acall__(self, request):
+        if request.path.startswith(self.exempt_paths):
+            return await self.get_response(request)
+        if not self.admit(request):
+            return self.overloaded()
+        try:
+            return await self.get_response(request)
+        finally:
+            in_flight.leave()
+
+    def admit(self, request):
+        """Whether to serve the request; counts it in when it is."""
+        if self.max_queue_seconds is not None:
+            queued = request_queue_seconds(request, self.queue_header)
+            if queued is not None and queued > self.max_queue_seconds:
+                return False
+        return in_flight.enter(self.max_in_flight)
+
+    def overloaded(self):
+        response = JsonResponse(
+            {'detail': 'Server is busy, please retry shortly.'},
+            status=503,
+        )
+        response['Retry-After'] = str(self.retry_after)
+        return response
+
+
+class MetricsMiddleware:
+    """
+    Time each request (see core.metrics), add a Server-Timing header and
+    record per-route metrics. Goes first in the chain so the total covers
+    every other middleware.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.server_timing = metrics_config().get('SERVER_TIMING', True)
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        timings = RequestTimings()
+        token = current_timings.set(timings)
+        try:
+            response = self.get_response(request)
+        finally:
+            current_timings.reset(token)
+        return self.finish(request, response, timings)
+
+    async def __acall__(self, request):
+        timings = RequestTimings()
+        token = current_timings.set(timings)
+        try:
+            response = await self.get_response(request)
+        finally:
+            current_timings.reset(token)
+        return self.finish(request, response, timings)
+
+    def process_template_response(self, request, response):
+        # Runs last among the template-response hooks, right before Django
+        # renders the (DRF) response.
+        timings = current_timings.get()
+        if timings is not None:
+            started = time.perf_counter()
+
+            def rendered(response):
+                timings.render += time.perf_counter() - started
+
+            response.add_post_render_callback(rendered)
+        return response
+
+    def finish(self, request, response, timings):
+        total = time.perf_counter() - timings.started
+        match = getattr(request, 'resolver_match', None)
+        route = match.route if match else 'unmatched'
+        get_registry().record(request.method, route, response.status_code, timings, total)
+        if self.server_timing:
+            response['Server-Timing'] = timings.server_timing(total)
+        return response
+
+
+class ProfilingMiddleware:
+    """
+    Keep profiles of sampled and slow requests (see core.profiling). Not
+    loaded unless PROFILING['ENABLED'] is set.
+    """
+
+    def __init__(self, get_response):
+        config = profiling_config()
+        if not config.get('ENABLED'):
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        self.paths = tuple(config.get('PATHS', ()))
+        self.sample_every = config.get('SAMPLE_EVERY') or 0
+        self.slow = config['SLOW_MS'] / 1e3 if config.get('SLOW_MS') else None
+        self.tracemalloc = config.get('TRACEMALLOC', True)
+
+    def __call__(self, request):
+        if not request.path.startswith(self.paths):
+            return self.get_response(request)
+        # Random rather than every Nth so workers don't all profile together
+        sampled = bool(self.sample_every) and random.randrange(self.sample_every) == 0
+        if not sampled and self.slow is None:
+            return self.get_response(request)
+
+        thread_id = threading.get_ident()
+        profiler = cProfile.Profile() if sampled else None
+        stacks = None if sampled else get_sampler().watch(thread_id)
+        tracing = sampled and self.tracemalloc and start_tracemalloc()
+        logs = []
+        started = time.perf_counter()
+        try:
+            with ExitStack() as stack:
+                for connection in connections.all():
+                    log = QueryLog(connection.alias)
+                    logs.append(log)
+                    stack.enter_context(connection.execute_wrapper(log))
+                if profiler is not None:
+                    profiler.enable()
+                try:
+                    response = self.get_response(request)
+                finally:
+                    if profiler is not None:
+                        profiler.disable()
+        finally:
+            duration = time.perf_counter() - started
+            peak = stop_tracemalloc() if tracing else None
+            if stacks is not None:
+                get_sampler().unwatch(thread_id)
+
+        reasons = ['sampled'] if sampled else []
+        if self.slow is not None and duration > self.slow:
+            reasons.append('slow')
+        if reasons:
+            capture = capture_record(request, response, duration, reasons)
+            capture.update({
+                'profiler': 'cprofile' if sampled else 'sampler',
+                'tracemalloc_peak': peak,
+                'sql': [query for log in logs for query in log.queries],
+                'sql_dropped': sum(log.dropped for log in logs),
+                'stacks': dict(stacks.most_common()) if stacks is not None else {},
+            })
+            save_capture(capture, profiler)
+        return response
@@ -0,0 +1,29 @@
+# Generated by Django 5.2.9 on 2026-10-19 10:53
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0008_user_token_version'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='listing',
+            index=models.Index(fields=['-created_at'], name='listing_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='listing',
+            index=models.Index(fields=['location', '-created_at'], name='listing_location_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='listing',
+            index=models.Index(fields=['first_price'], name='listing_price_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='listingimage',
+            index=models.Index(fields=['listing', '-is_primary', 'uploaded_at'], name='listingimage_listing_order_idx'),
+        ),
+    ]
@@ -0,0 +1,105 @@
+# Generated by Django 5.2.9 on 2026-10-19 10:57
+
+from collections import defaultdict
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+# Listing fields SearchFilter matched; copied into search_text
+SEARCH_FIELDS = ('lodge_name', 'description', 'room_number', 'agency', 'contact_phone', 'contact_email')
+
+
+def populate(apps, schema_editor):
+    # Backfills from the models as they are at this migration, so it keeps
+    # working whatever the app code becomes. Writes after this are kept in
+    # step by core.readmodel; ``manage.py listing_search rebuild`` redoes it.
+    alias = schema_editor.connection.alias
+    Listing = apps.get_model('core', 'Listing')
+    ListingImage = apps.get_model('core', 'ListingImage')
+    ListingSearch = apps.get_model('core', 'ListingSearch')
+    Through = Listing.amenities.through
+
+    listings = Listing.objects.using(alias).select_related('agent').order_by('pk')
+    last = 0
+    while batch := list(listings.filter(pk__gt=last)[:1000]):
+        ids = [listing.pk for listing in batch]
+        amenities = defaultdict(list)
+        for listing_id, amenity_id in Through.objects.using(alias).filter(listing_id__in=ids).values_list(
+            'listing_id', 'amenity_id'
+        ):
+            amenities[listing_id].append(amenity_id)
+        images = defaultdict(list)
+        # Cover image first, as ListingImage.Meta.ordering puts it
+        for listing_id, image in ListingImage.objects.using(alias).filter(listing_id__in=ids).order_by(
+            '-is_primary', 'uploaded_at'
+        ).values_list('listing_id', 'image'):
+            images[listing_id].append(image)
+
+        rows = []
+        for listing in batch:
+            own_images = images[listing.pk]
+            rows.append(ListingSearch(
+                listing_id=listing.pk,
+                lodge_name=listing.lodge_name,
+                description=listing.description,
+                first_price=listing.first_price,
+                year_price=listing.year_price,
+                effective_price=listing.year_price if listing.year_price is not None else listing.first_price,
+                location=listing.location,
+                room_type=listing.room_type,
+                total_rooms=listing.total_rooms,
+                is_available=listing.is_available,
+                agent_id=listing.agent_id,
+                agent_name=listing.agent.full_name,
+                agency=listing.agency,
+                amenity_ids=',' + ''.join(f'{pk},' for pk in sorted(amenities[listing.pk])),
+                cover_image_url=own_images[0].url if own_images else None,
+                image_count=len(own_images),
+                search_text='\n'.join(str(value) for field in SEARCH_FIELDS if (value := getattr(listing, field))),
+                created_at=listing.created_at,
+                updated_at=listing.updated_at,
+            ))
+        ListingSearch.objects.using(alias).bulk_create(rows)
+        last = ids[-1]
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0009_listing_read_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ListingSearch',
+            fields=[
+                ('listing', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='search_row', serialize=False, to='core.listing')),
+                ('lodge_name', models.CharField(max_length=255)),
+                ('description', models.TextField()),
+                ('first_price', models.DecimalField(decimal_places=2, max_digits=10)),
+                ('year_price', models.DecimalField(blank=True, decimal_places=2, max_digits=10, null=True)),
+                ('effective_price', models.DecimalField(decimal_places=2, max_digits=10)),
+                ('location', models.CharField(choices=[('AROMA', 'Aroma'), ('AMANSEA', 'Amansea'), ('IFITE_ANAMBRA', 'Ifite Anambra'), ('IFITE UP SCHOOL', 'Ifite Up School'), ('IFITE DOWN SCHOOL', 'Ifite Down School'), ('TEMP SITE', 'Temp Site'), ('OTHER', 'Other')], max_length=100)),
+                ('room_type', models.CharField(choices=[('SELF_CONTAINED', 'Self Contained'), ('ONE_BEDROOM', 'One Bedroom'), ('TWO_BEDROOM', 'Two Bedroom'), ('STUDIO', 'Studio'), ('SHARED_ROOM', 'Shared Room'), ('SINGLE_ROOM', 'Single Room'), ('OTHER', 'Other')], max_length=50)),
+                ('total_rooms', models.PositiveIntegerField()),
+                ('is_available', models.BooleanField()),
+                ('agent_name', models.CharField(max_length=255)),
+                ('agency', models.CharField(blank=True, max_length=255, null=True)),
+                ('amenity_ids', models.TextField(default=',')),
+                ('cover_image_url', models.CharField(blank=True, max_length=500, null=True)),
+                ('image_count', models.PositiveIntegerField(default=0)),
+                ('search_text', models.TextField(blank=True)),
+                ('created_at', models.DateTimeField()),
+                ('updated_at', models.DateTimeField()),
+                ('agent', models.ForeignKey(db_constraint=False, on_delete=django.db.models.deletion.DO_NOTHING, related_name='+', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'db_table': 'listing_search',
+                'ordering': ['-created_at'],
+                'indexes': [models.Index(fields=['-created_at'], name='search_created_idx'), models.Index(fields=['location', '-created_at'], name='search_location_created_idx'), models.Index(fields=['first_price'], name='search_price_idx'), models.Index(fields=['effective_price'], name='search_effective_price_idx')],
+            },
+        ),
+        migrations.RunPython(populate, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,34 @@
+# Generated by Django 5.2.9 on 2026-10-19 11:02
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0010_listing_search'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ListingDeletion',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('listing_id', models.BigIntegerField()),
+                ('deleted_at', models.DateTimeField(db_index=True, default=django.utils.timezone.now)),
+            ],
+            options={
+                'ordering': ['deleted_at'],
+            },
+        ),
+        migrations.AddField(
+            model_name='listingsearch',
+            name='refreshed_at',
+            field=models.DateTimeField(default=django.utils.timezone.now),
+        ),
+        migrations.AddIndex(
+            model_name='listingsearch',
+            index=models.Index(fields=['refreshed_at'], name='search_refreshed_idx'),
+        ),
+    ]
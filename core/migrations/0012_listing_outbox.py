@@ -0,0 +1,64 @@
+# Generated by Django 5.2.9 on 2026-10-19 11:15
+
+import django.core.serializers.json
+import django.utils.timezone
+from django.db import migrations, models
+
+
+# listing_search columns left out of event payloads (core.outbox)
+SKIPPED_FIELDS = {'listing', 'search_text', 'refreshed_at', 'amenity_ids'}
+
+
+def seed(apps, schema_editor):
+    # One 'changed' event per listing, so a consumer starting at 0 gets the
+    # current state. Built from the models as they are at this migration,
+    # with the payload core.outbox.payload() writes.
+    alias = schema_editor.connection.alias
+    ListingSearch = apps.get_model('core', 'ListingSearch')
+    ListingEvent = apps.get_model('core', 'ListingEvent')
+    fields = [field for field in ListingSearch._meta.concrete_fields if field.name not in SKIPPED_FIELDS]
+
+    rows = ListingSearch.objects.using(alias).order_by('listing_id')
+    last = 0
+    while batch := list(rows.filter(listing_id__gt=last)[:1000]):
+        events = []
+        for row in batch:
+            payload = {field.attname: getattr(row, field.attname) for field in fields}
+            payload['amenity_ids'] = [int(pk) for pk in row.amenity_ids.strip(',').split(',') if pk]
+            events.append(ListingEvent(listing_id=row.listing_id, kind='changed', payload=payload))
+        ListingEvent.objects.using(alias).bulk_create(events)
+        last = batch[-1].listing_id
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0011_listing_index_changes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='OutboxCheckpoint',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('consumer', models.CharField(max_length=100, unique=True)),
+                ('position', models.BigIntegerField(default=0)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='ListingEvent',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('listing_id', models.BigIntegerField()),
+                ('kind', models.CharField(choices=[('changed', 'Changed'), ('deleted', 'Deleted')], max_length=10)),
+                ('payload', models.JSONField(blank=True, encoder=django.core.serializers.json.DjangoJSONEncoder, null=True)),
+                ('created_at', models.DateTimeField(default=django.utils.timezone.now)),
+            ],
+            options={
+                'ordering': ['id'],
+                'indexes': [models.Index(fields=['listing_id', 'id'], name='event_listing_idx')],
+            },
+        ),
+        migrations.RunPython(seed, migrations.RunPython.noop),
+    ]
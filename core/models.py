@@ -1,3 +1,4 @@
+from django.core.serializers.json import DjangoJSONEncoder
 from django.db import models
 from django.contrib.auth.models import AbstractBaseUser, PermissionsMixin, BaseUserManager
 from django.utils import timezone
@@ -37,6 +38,13 @@ class UserManager(BaseUserManager):
 
         return self.create_user(email, full_name, phone_number, password, **extra_fields)
 
+    def with_listing_counts(self):
+        """Annotate the counts AgentProfileSerializer shows, in the same query"""
+        return self.annotate(
+            listings_total=models.Count('listings'),
+            available_listings_total=models.Count('listings', filter=models.Q(listings__is_available=True)),
+        )
+
 
 class User(AbstractBaseUser, PermissionsMixin):
 
@@ -51,14 +59,70 @@ class User(AbstractBaseUser, PermissionsMixin):
     is_active = models.BooleanField(default=True)
     date_joined = models.DateTimeField(default=timezone.now)
 
+    # Bumped whenever a claim embedded in issued JWTs goes stale, which
+    # invalidates every token carrying the previous version.
+    token_version = models.PositiveIntegerField(default=0)
+
     objects = UserManager()
 
     USERNAME_FIELD = "email"
     REQUIRED_FIELDS = ["full_name", "phone_number"]
 
+    # Fields copied into access tokens at issuance (see core.authentication)
+    TOKEN_CLAIM_FIELDS = ("is_agent", "is_staff", "agency_name", "is_active")
+
     def __str__(self):
         return self.full_name
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._loaded_claims = instance._claim_values()
+        return instance
+
+    def _claim_values(self):
+        # Deferred fields (.only()/.defer()) are not in __dict__ until read;
+        # they are left out rather than recorded as None
+        return {
+            name: self.__dict__[name] for name in self.TOKEN_CLAIM_FIELDS if name in self.__dict__
+        }
+
+    def _claims_changed(self):
+        loaded = self._loaded_claims
+        current = self._claim_values()
+        unseen = [name for name in current if name not in loaded]
+        if unseen:
+            # Deferred at load, read or assigned since: compare with the row
+            stored = (
+                type(self)._base_manager.using(self._state.db)
+                .filter(pk=self.pk).values(*unseen).first()
+            )
+            loaded = {**loaded, **(stored or {})}
+        return any(name in loaded and loaded[name] != value for name, value in current.items())
+
+    def set_password(self, raw_password):
+        super().set_password(raw_password)
+        self.revoke_tokens(commit=False)
+
+    def revoke_tokens(self, commit=True):
+        """Invalidate every JWT issued to this user so far."""
+        self.token_version = (self.token_version or 0) + 1
+        self._loaded_claims = self._claim_values()
+        if commit and self.pk:
+            self.save(update_fields=["token_version"])
+
+    def save(self, *args, **kwargs):
+        # Tokens carry is_agent/is_staff/agency_name, so changing any of them
+        # must revoke outstanding tokens instead of trusting stale claims.
+        loaded = getattr(self, "_loaded_claims", None)
+        if self.pk and loaded is not None and self._claims_changed():
+            self.revoke_tokens(commit=False)
+            update_fields = kwargs.get("update_fields")
+            if update_fields is not None:
+                kwargs["update_fields"] = set(update_fields) | {"token_version"}
+        super().save(*args, **kwargs)
+        self._loaded_claims = self._claim_values()
+
 
 
 # Define Location Choices
@@ -87,6 +151,12 @@ class Amenity(models.Model):
 
 # Removed AMENITY_CHOICES constant entirely
 
+class ListingQuerySet(models.QuerySet):
+    def with_related(self):
+        """Load everything ListingSerializer reads: agent, amenities and images"""
+        return self.select_related('agent').prefetch_related('amenities', 'images')
+
+
 class Listing(models.Model):
     # Rename title to lodge_name (with db_column to preserve data)
     lodge_name = models.CharField(max_length=255, db_column='title')
@@ -160,6 +230,8 @@ class Listing(models.Model):
     rules = models.TextField(blank=True, null=True)
     contact_phone = models.CharField(max_length=20, blank=True, null=True)
     contact_email = models.EmailField(blank=True, null=True)
+
+    objects = ListingQuerySet.as_manager()
     
     def __str__(self):
         return self.lodge_name
@@ -167,7 +239,12 @@ class Listing(models.Model):
     @property
     def cover_image_url(self):
         """Get the URL of the first image as cover image"""
-        first_image = self.images.first()
+        if 'images' in getattr(self, '_prefetched_objects_cache', {}):
+            # Prefetched in ListingImage.Meta.ordering, so no query per listing
+            images = self.images.all()
+            first_image = images[0] if images else None
+        else:
+            first_image = self.images.first()
         if first_image:
             return first_image.image.url
         return None
@@ -187,6 +264,13 @@ class Listing(models.Model):
     class Meta:
         ordering = ['-created_at']
         db_table = 'core_listing'  # Keep original table name
+        # Listing reads return newest first, alone or behind the common
+        # filters; core/plan_snapshots records the plans these give
+        indexes = [
+            models.Index(fields=['-created_at'], name='listing_created_idx'),
+            models.Index(fields=['location', '-created_at'], name='listing_location_created_idx'),
+            models.Index(fields=['first_price'], name='listing_price_idx'),
+        ]
 
 class ListingImage(models.Model):
     listing = models.ForeignKey(Listing, on_delete=models.CASCADE, related_name='images')
@@ -204,4 +288,117 @@ class ListingImage(models.Model):
         super().save(*args, **kwargs)
     
     class Meta:
-        ordering = ['-is_primary', 'uploaded_at']
\ No newline at end of file
+        ordering = ['-is_primary', 'uploaded_at']
+        indexes = [
+            # Serves the images prefetch in its ordering, without a sort
+            models.Index(fields=['listing', '-is_primary', 'uploaded_at'], name='listingimage_listing_order_idx'),
+        ]
+
+class ListingSearch(models.Model):
+    """
+    Read model for the listings grid: one flat row per listing, kept in step
+    with Listing, ListingImage, the amenities M2M and Amenity by the signals
+    in core.signals (see core.readmodel). Never written to directly.
+    """
+    listing = models.OneToOneField(
+        Listing, on_delete=models.CASCADE, primary_key=True, related_name='search_row'
+    )
+    lodge_name = models.CharField(max_length=255)
+    description = models.TextField()
+    first_price = models.DecimalField(max_digits=10, decimal_places=2)
+    year_price = models.DecimalField(max_digits=10, decimal_places=2, blank=True, null=True)
+    # What a year's stay costs: year_price when quoted, else first_price
+    effective_price = models.DecimalField(max_digits=10, decimal_places=2)
+    location = models.CharField(max_length=100, choices=LOCATION_CHOICES)
+    room_type = models.CharField(max_length=50, choices=Listing.ROOM_TYPE_CHOICES)
+    total_rooms = models.PositiveIntegerField()
+    is_available = models.BooleanField()
+    # No constraint: the listing's own foreign key already guarantees the agent
+    agent = models.ForeignKey(
+        User, on_delete=models.DO_NOTHING, db_constraint=False, related_name='+'
+    )
+    agent_name = models.CharField(max_length=255)
+    agency = models.CharField(max_length=255, blank=True, null=True)
+    # Ids as ',3,7,12,' so a LIKE '%,7,%' finds one on any database
+    amenity_ids = models.TextField(default=',')
+    cover_image_url = models.CharField(max_length=500, blank=True, null=True)
+    image_count = models.PositiveIntegerField(default=0)
+    # The searchable text fields of the listing, newline separated
+    search_text = models.TextField(blank=True)
+    created_at = models.DateTimeField()
+    updated_at = models.DateTimeField()
+    # When the row was last rewritten, for whatever reason; updated_at only
+    # moves when the listing itself is saved
+    refreshed_at = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        db_table = 'listing_search'
+        ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['-created_at'], name='search_created_idx'),
+            models.Index(fields=['location', '-created_at'], name='search_location_created_idx'),
+            models.Index(fields=['first_price'], name='search_price_idx'),
+            models.Index(fields=['effective_price'], name='search_effective_price_idx'),
+            models.Index(fields=['refreshed_at'], name='search_refreshed_idx'),
+        ]
+
+    def __str__(self):
+        return self.lodge_name
+
+    @property
+    def amenity_id_list(self):
+        return [int(pk) for pk in self.amenity_ids.strip(',').split(',') if pk]
+
+
+class ListingDeletion(models.Model):
+    """
+    Log of deleted listings, written by core.signals, so readers that poll
+    listing_search for changes (core.listingindex) also learn what is gone.
+    Pruned with ``manage.py listing_search prune``.
+    """
+    listing_id = models.BigIntegerField()
+    deleted_at = models.DateTimeField(default=timezone.now, db_index=True)
+
+    class Meta:
+        ordering = ['deleted_at']
+
+    def __str__(self):
+        return f'Listing {self.listing_id} deleted at {self.deleted_at}'
+
+
+class ListingEvent(models.Model):
+    """
+    Transactional outbox of listing changes (core.outbox): one row per
+    listing_search row rewritten or listing deleted, written in the same
+    transaction as the change. ``id`` is the offset consumers read by.
+    """
+    CHANGED = 'changed'
+    DELETED = 'deleted'
+    KIND_CHOICES = [(CHANGED, 'Changed'), (DELETED, 'Deleted')]
+
+    listing_id = models.BigIntegerField()
+    kind = models.CharField(max_length=10, choices=KIND_CHOICES)
+    # The listing_search row as it now is; null for deletions
+    payload = models.JSONField(encoder=DjangoJSONEncoder, blank=True, null=True)
+    created_at = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        ordering = ['id']
+        indexes = [
+            # Compaction looks for a later event of the same listing
+            models.Index(fields=['listing_id', 'id'], name='event_listing_idx'),
+        ]
+
+    def __str__(self):
+        return f'#{self.id} listing {self.listing_id} {self.kind}'
+
+
+class OutboxCheckpoint(models.Model):
+    """How far a named outbox consumer has read (core.outbox.Consumer)."""
+    consumer = models.CharField(max_length=100, unique=True)
+    # The last event id handled
+    position = models.BigIntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f'{self.consumer} at {self.position}'
@@ -0,0 +1,124 @@
+# core/oauth.py
+"""
+Caching for the Google social-login path.
+
+Provider configuration (SocialApp rows) and Google's signing certificates
+change rarely but were fetched on every login. Both are kept in a small
+per-process cache that serves values for ``ttl`` seconds and, once a value is
+older than ``refresh_after``, keeps serving it while a background thread
+reloads it, so a login never waits on a refresh.
+"""
+import logging
+import threading
+import time
+
+from django.conf import settings
+
+from .metrics import external_call
+
+logger = logging.getLogger(__name__)
+
+
+class RefreshingCache:
+    def __init__(self, ttl, refresh_after=None):
+        self.ttl = ttl
+        self.refresh_after = refresh_after if refresh_after is not None else ttl * 0.8
+        self._entries = {}
+        self._refreshing = set()
+        self._lock = threading.Lock()
+
+    def get(self, key, loader):
+        now = time.monotonic()
+        entry = self._entries.get(key)
+        if entry is not None:
+            value, loaded_at = entry
+            age = now - loaded_at
+            if age < self.ttl:
+                if age >= self.refresh_after:
+                    self._refresh_in_background(key, loader)
+                return value
+        return self._load(key, loader)
+
+    def _load(self, key, loader):
+        value = loader()
+        with self._lock:
+            self._entries[key] = (value, time.monotonic())
+        return value
+
+    def _refresh_in_background(self, key, loader):
+        with self._lock:
+            if key in self._refreshing:
+                return
+            self._refreshing.add(key)
+
+        def refresh():
+            try:
+                self._load(key, loader)
+            except Exception:
+                # Keep serving the cached value until it expires.
+                logger.warning('Background refresh of %r failed', key, exc_info=True)
+            finally:
+                with self._lock:
+                    self._refreshing.discard(key)
+
+        threading.Thread(target=refresh, daemon=True).start()
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+OAUTH_CACHE_TTL = getattr(settings, 'OAUTH_CACHE_TTL', 3600)
+
+social_apps = RefreshingCache(OAUTH_CACHE_TTL)
+provider_documents = RefreshingCache(OAUTH_CACHE_TTL)
+
+
+class CachedResponse:
+    """The subset of requests.Response that allauth uses for key documents."""
+
+    def __init__(self, status_code, payload):
+        self.status_code = status_code
+        self.ok = status_code < 400
+        self._payload = payload
+
+    def json(self):
+        return self._payload
+
+    def raise_for_status(self):
+        if not self.ok:
+            import requests
+            raise requests.HTTPError(f'{self.status_code} error fetching provider document')
+
+
+class CachingSession:
+    """
+    Wraps a requests session so GETs to provider documents (Google's signing
+    certificates) are answered from ``provider_documents``. Every other call
+    passes straight through.
+    """
+
+    def __init__(self, session, cached_urls, service='google'):
+        self._session = session
+        self._cached_urls = set(cached_urls)
+        self._service = service
+
+    def get(self, url, *args, **kwargs):
+        if url not in self._cached_urls or args or kwargs:
+            with external_call(self._service):
+                return self._session.get(url, *args, **kwargs)
+
+        def load():
+            with external_call(self._service):
+                response = self._session.get(url)
+            response.raise_for_status()
+            return response.json()
+
+        return CachedResponse(200, provider_documents.get(url, load))
+
+    def post(self, url, *args, **kwargs):
+        with external_call(self._service):
+            return self._session.post(url, *args, **kwargs)
+
+    def __getattr__(self, name):
+        return getattr(self._session, name)
@@ -0,0 +1,172 @@
+# core/outbox.py
+"""
+Transactional outbox of listing changes (models.ListingEvent).
+
+Every consumer of listing changes (a search index, cache invalidation,
+analytics, partner feeds) would otherwise need its own signal handlers on
+Listing, ListingImage, Amenity and the amenities M2M. Instead, record() is
+connected to core.readmodel.rows_changed, which those handlers already send
+from inside the writing transaction: each rewritten listing_search row
+appends a 'changed' event carrying the row, each deleted listing a
+'deleted' event. Events commit or roll back with the change itself.
+
+Consumers follow the table by id with a Consumer, which keeps its position
+in OutboxCheckpoint::
+
+    consumer = Consumer('search-index')
+    consumer.consume(lambda events: index.apply(events))
+
+Delivery is at least once: the checkpoint moves after the handler returns,
+so a handler that fails sees the same batch again. Each consumer name is
+meant to be read by one process at a time.
+
+Ids are assigned when a row is inserted but become visible when its
+transaction commits, so a reader could pass an id that is still to appear.
+Consumers only read events older than SETTLE_SECONDS for that reason.
+
+``manage.py outbox compact`` drops events superseded by a later event of the
+same listing (a 'changed' event carries the whole row, so only the last one
+matters) and, after RETENTION_DAYS, 'deleted' events too. The outbox then
+still holds the current state of every listing, so a new consumer starting
+at 0 catches up from it. A consumer that stopped before the dropped
+deletions gets OutboxExpired and has to start over from 0.
+"""
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS
+from django.db.models import Exists, Max, OuterRef
+from django.utils import timezone
+
+from .models import ListingEvent, ListingSearch, OutboxCheckpoint
+
+# Checkpoint row holding the last deletion event compaction dropped
+HORIZON = 'outbox:compacted'
+
+# listing_search columns left out of payloads: search_text only repeats the
+# listing's text fields, and the event has its own time
+_SKIPPED_FIELDS = {'listing', 'search_text', 'refreshed_at', 'amenity_ids'}
+_PAYLOAD_FIELDS = [field for field in ListingSearch._meta.concrete_fields if field.name not in _SKIPPED_FIELDS]
+
+
+class OutboxExpired(Exception):
+    """Events this consumer had not read yet were compacted away."""
+
+
+def _config():
+    return settings.LISTING_OUTBOX
+
+
+def payload(row):
+    data = {field.attname: getattr(row, field.attname) for field in _PAYLOAD_FIELDS}
+    data['amenity_ids'] = row.amenity_id_list
+    return data
+
+
+def record(sender=None, listing_ids=(), deleted_ids=(), using=None, rows=None, **kwargs):
+    """
+    Append events for these changes; a rows_changed receiver. ``rows`` are
+    the rewritten listing_search rows when the sender has them at hand.
+    """
+    if rows is None and listing_ids:
+        rows = ListingSearch.objects.using(using).filter(listing_id__in=listing_ids).order_by('listing_id')
+    events = [
+        ListingEvent(listing_id=row.listing_id, kind=ListingEvent.CHANGED, payload=payload(row))
+        for row in rows or ()
+    ]
+    events += [ListingEvent(listing_id=pk, kind=ListingEvent.DELETED) for pk in sorted(deleted_ids)]
+    if events:
+        ListingEvent.objects.using(using).bulk_create(events)
+
+
+def read(after, limit, using=DEFAULT_DB_ALIAS):
+    """Up to ``limit`` settled events past offset ``after``, in order."""
+    settled = timezone.now() - timedelta(seconds=_config()['SETTLE_SECONDS'])
+    return list(
+        ListingEvent.objects.using(using).filter(id__gt=after, created_at__lt=settled).order_by('id')[:limit]
+    )
+
+
+def _horizon(using):
+    return OutboxCheckpoint.objects.using(using).filter(consumer=HORIZON).values_list('position', flat=True).first()
+
+
+class Consumer:
+    """A named reader of the outbox that remembers how far it got."""
+
+    def __init__(self, name, batch_size=None, using=DEFAULT_DB_ALIAS):
+        if name == HORIZON:
+            raise ValueError(f'{HORIZON!r} is reserved.')
+        self.name = name
+        self.batch_size = batch_size or _config()['BATCH_SIZE']
+        self.using = using
+
+    @property
+    def position(self):
+        checkpoint, _ = OutboxCheckpoint.objects.using(self.using).get_or_create(consumer=self.name)
+        return checkpoint.position
+
+    def poll(self, limit=None):
+        """The next batch of events; the position does not move until commit()."""
+        position = self.position
+        horizon = _horizon(self.using)
+        if position and horizon and position < horizon:
+            raise OutboxExpired(
+                f'Consumer {self.name!r} is at {position}, but deletions up to {horizon} were compacted away.'
+            )
+        return read(position, limit or self.batch_size, self.using)
+
+    def commit(self, position):
+        """Record that every event up to ``position`` has been handled."""
+        OutboxCheckpoint.objects.using(self.using).update_or_create(
+            consumer=self.name, defaults={'position': position},
+        )
+
+    def seek(self, position=0):
+        """Read from ``position`` on; 0 starts over from the compacted state."""
+        self.commit(position)
+
+    def consume(self, handler, max_batches=None):
+        """
+        Pass batches to ``handler`` until caught up (or ``max_batches``),
+        committing after each one. Returns the number of events handled.
+        """
+        handled = batches = 0
+        while max_batches is None or batches < max_batches:
+            events = self.poll()
+            if not events:
+                break
+            handler(events)
+            self.commit(events[-1].id)
+            handled += len(events)
+            batches += 1
+        return handled
+
+
+def status(using=DEFAULT_DB_ALIAS):
+    """[(consumer, position, events behind)] for every consumer."""
+    events = ListingEvent.objects.using(using)
+    checkpoints = OutboxCheckpoint.objects.using(using).exclude(consumer=HORIZON).order_by('consumer')
+    return [
+        (consumer, position, events.filter(id__gt=position).count())
+        for consumer, position in checkpoints.values_list('consumer', 'position')
+    ]
+
+
+def compact(using=DEFAULT_DB_ALIAS):
+    """
+    Drop the events a later event of the same listing supersedes, then the
+    deletion events older than RETENTION_DAYS. Returns how many of each.
+    """
+    events = ListingEvent.objects.using(using)
+    later = events.filter(listing_id=OuterRef('listing_id'), id__gt=OuterRef('id'))
+    superseded, _ = events.filter(Exists(later)).delete()
+
+    cutoff = timezone.now() - timedelta(days=_config()['RETENTION_DAYS'])
+    expired = events.filter(kind=ListingEvent.DELETED, created_at__lt=cutoff)
+    last = expired.aggregate(last=Max('id'))['last']
+    if last is None:
+        return superseded, 0
+    deletions, _ = expired.filter(id__lte=last).delete()
+    OutboxCheckpoint.objects.using(using).update_or_create(consumer=HORIZON, defaults={'position': last})
+    return superseded, deletions
@@ -0,0 +1,210 @@
+# core/pagination.py
+"""
+Page-number pagination for the listings grid whose total count does not
+cost a COUNT(*) over the whole result on every page.
+
+The list stays a plain array unless the client asks for a page (?page= or
+?page_size=). A page is fetched with one extra row, which tells whether
+there is a next page; when there is not, the count is simply the rows seen
+so far. Otherwise ?count= (LISTING_PAGINATION['COUNT'] by default) picks how
+the total is found:
+
+- exact: COUNT(*) over the filtered rows;
+- cached: the last exact count for the same filters, kept under the
+  'listings' cache tag, which every listing write bumps (core.signals);
+  counted exactly on a miss;
+- estimated: the planner's row estimate (Postgres: EXPLAIN for a filtered
+  query, pg_class.reltuples for the whole table); counted exactly where
+  there is no planner to ask (SQLite);
+- auto: cached if there is one, else exact if a COUNT bounded at
+  EXACT_COUNT_LIMIT stays under it, else estimated.
+
+``count_kind`` in the response says which one the ``count`` is, so clients
+can show "about 12,000" rather than a precise number they cannot trust.
+Rows from the in-memory index (core.listingindex) are all at hand, so their
+count is always exact.
+"""
+import hashlib
+import json
+from urllib.parse import urlencode
+
+from django.conf import settings
+from django.db import DatabaseError, connections
+from rest_framework.exceptions import NotFound, ValidationError
+from rest_framework.pagination import PageNumberPagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+
+from .cache import tiered_cache
+
+EXACT, CACHED, ESTIMATED = 'exact', 'cached', 'estimated'
+AUTO = 'auto'
+COUNT_KINDS = (AUTO, EXACT, CACHED, ESTIMATED)
+
+
+def _config():
+    return settings.LISTING_PAGINATION
+
+
+def estimate_count(queryset):
+    """The planner's idea of how many rows ``queryset`` has; None when it has none."""
+    connection = connections[queryset.db]
+    if connection.vendor != 'postgresql':
+        return None
+    try:
+        with connection.cursor() as cursor:
+            if not queryset.query.where:
+                cursor.execute(
+                    'SELECT reltuples::bigint FROM pg_class WHERE oid = %s::regclass', [queryset.model._meta.db_table]
+                )
+                estimate = cursor.fetchone()[0]
+            else:
+                sql, params = queryset.order_by().query.sql_with_params()
+                cursor.execute('EXPLAIN (FORMAT JSON) ' + sql, params)
+                document = cursor.fetchone()[0]
+                if isinstance(document, str):
+                    document = json.loads(document)
+                estimate = document[0]['Plan']['Plan Rows']
+    except DatabaseError:
+        return None
+    # reltuples is -1 for a table never analyzed
+    return int(estimate) if estimate is not None and estimate >= 0 else None
+
+
+class CountingPagination(PageNumberPagination):
+    """PageNumberPagination with a choice of exact, cached or estimated counts."""
+    page_size_query_param = 'page_size'
+    count_query_param = 'count'
+    # Not part of what is being counted
+    unfiltered_params = ('page', 'page_size', 'count', 'ordering', 'fields', 'format')
+
+    def __init__(self):
+        config = _config()
+        self.page_size = config['PAGE_SIZE']
+        self.max_page_size = config['MAX_PAGE_SIZE']
+
+    def get_page_size(self, request):
+        # Unpaginated unless asked: the list has always been a plain array
+        params = request.query_params
+        if self.page_query_param not in params and self.page_size_query_param not in params:
+            return None
+        return super().get_page_size(request)
+
+    def get_count_kind(self, request):
+        kind = request.query_params.get(self.count_query_param) or _config()['COUNT']
+        if kind not in COUNT_KINDS:
+            raise ValidationError({self.count_query_param: [f'Choose one of {", ".join(COUNT_KINDS)}.']})
+        return kind
+
+    def paginate_queryset(self, queryset, request, view=None):
+        page_size = self.get_page_size(request)
+        if not page_size:
+            return None
+        # Rejected whether or not this page ends up needing a count
+        self.get_count_kind(request)
+        self.request = request
+        page_number = request.query_params.get(self.page_query_param) or 1
+        try:
+            self.number = int(page_number)
+            if self.number < 1:
+                raise ValueError
+        except ValueError:
+            raise NotFound(self.invalid_page_message.format(
+                page_number=page_number, message='That page number is not a valid integer.',
+            ))
+
+        offset = (self.number - 1) * page_size
+        rows = list(queryset[offset:offset + page_size + 1])
+        self.has_next = len(rows) > page_size
+        rows = rows[:page_size]
+        if not rows and self.number > 1:
+            raise NotFound(self.invalid_page_message.format(
+                page_number=page_number, message='That page contains no results.',
+            ))
+
+        seen = offset + len(rows)
+        if isinstance(queryset, list):
+            self.count, self.count_kind = len(queryset), EXACT
+        elif not self.has_next:
+            self.count, self.count_kind = seen, EXACT
+        else:
+            self.count, self.count_kind = self.count_rows(queryset, request, at_least=seen + 1)
+        return rows
+
+    def count_key(self, request):
+        params = sorted(
+            (name, value) for name, values in request.query_params.lists() if name not in self.unfiltered_params
+            for value in values
+        )
+        return 'listings:count:' + hashlib.sha1(urlencode(params).encode()).hexdigest()
+
+    def count_rows(self, queryset, request, at_least):
+        """(count, kind) for a result known to hold at least ``at_least`` rows."""
+        config = _config()
+        kind = self.get_count_kind(request)
+        key = self.count_key(request)
+        queryset = queryset.order_by()
+
+        if kind in (AUTO, CACHED):
+            cached = tiered_cache.get(key, tags=('listings',))
+            if cached is not None:
+                return max(cached, at_least), CACHED
+        if kind == AUTO:
+            limit = config['EXACT_COUNT_LIMIT']
+            bounded = queryset[:limit].count()
+            if bounded < limit:
+                tiered_cache.set(key, bounded, config['COUNT_CACHE_SECONDS'], tags=('listings',))
+                return bounded, EXACT
+        if kind in (AUTO, ESTIMATED):
+            estimate = estimate_count(queryset)
+            if estimate is not None:
+                return max(estimate, at_least), ESTIMATED
+
+        count = queryset.count()
+        tiered_cache.set(key, count, config['COUNT_CACHE_SECONDS'], tags=('listings',))
+        return count, EXACT
+
+    def get_next_link(self):
+        if not self.has_next:
+            return None
+        return replace_query_param(self.request.build_absolute_uri(), self.page_query_param, self.number + 1)
+
+    def get_previous_link(self):
+        if self.number == 1:
+            return None
+        url = self.request.build_absolute_uri()
+        if self.number == 2:
+            return remove_query_param(url, self.page_query_param)
+        return replace_query_param(url, self.page_query_param, self.number - 1)
+
+    def get_paginated_response(self, data):
+        return Response({
+            'count': self.count,
+            'count_kind': self.count_kind,
+            'next': self.get_next_link(),
+            'previous': self.get_previous_link(),
+            'results': data,
+        })
+
+    def get_paginated_response_schema(self, schema):
+        paginated = super().get_paginated_response_schema(schema)
+        paginated['required'].insert(1, 'count_kind')
+        paginated['properties'] = {
+            'count': paginated['properties']['count'],
+            'count_kind': {
+                'type': 'string', 'enum': [EXACT, CACHED, ESTIMATED],
+                'description': 'How count was found; an estimated count is approximate',
+            },
+            **{name: value for name, value in paginated['properties'].items() if name != 'count'},
+        }
+        # The plain array unless a page is asked for
+        return {'oneOf': [schema, paginated]}
+
+    def get_schema_operation_parameters(self, view):
+        return super().get_schema_operation_parameters(view) + [{
+            'name': self.count_query_param,
+            'required': False,
+            'in': 'query',
+            'description': 'How to count the total: ' + ', '.join(COUNT_KINDS),
+            'schema': {'type': 'string', 'enum': list(COUNT_KINDS)},
+        }]
@@ -0,0 +1,346 @@
+# core/profiling.py
+"""
+Opt-in profiling of production requests (PROFILING['ENABLED']).
+
+ProfilingMiddleware watches requests under PROFILING['PATHS'] and keeps a
+capture in two cases:
+
+- 1 in SAMPLE_EVERY requests runs under cProfile, with tracemalloc tracking
+  the peak of Python allocations while it runs;
+- any other request is followed by a stack sampler (one thread per process,
+  every SAMPLE_INTERVAL_MS) and kept if it took longer than SLOW_MS.
+
+Both record the request's SQL. Captures go to PROFILING['DIRECTORY'], newest
+KEEP kept, as <id>.json (request, SQL log, sampled stacks) plus <id>.prof
+(pstats) for cProfile runs. Staff list and download them at /api/profiles/
+or with ``manage.py profiles``.
+
+Profiles cover the thread running the request. That is the whole request
+under WSGI; the async listing reads (ASYNC_LISTING_READS) run on the event
+loop instead, so profile those paths under WSGI.
+"""
+import json
+import logging
+import os
+import pstats
+import re
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+import uuid
+from collections import Counter
+from datetime import datetime, timezone
+
+from django.conf import settings
+from django.http import FileResponse, Http404
+from rest_framework import exceptions, permissions
+from rest_framework.response import Response
+from rest_framework.views import APIView
+
+# Per-capture limits, to keep a pathological request from filling the disk
+MAX_QUERIES = 2000
+MAX_SQL_LENGTH = 4000
+MAX_STACK_DEPTH = 80
+
+logger = logging.getLogger(__name__)
+
+CAPTURE_ID = re.compile(r'\d{8}-\d{6}-[0-9a-f]{8}')
+
+
+def profiling_config():
+    return getattr(settings, 'PROFILING', {})
+
+
+def capture_directory():
+    return profiling_config().get('DIRECTORY') or os.path.join(tempfile.gettempdir(), 'bookit-profiles')
+
+
+# -- stack sampler ------------------------------------------------------------
+
+def _frame_label(code):
+    filename = code.co_filename
+    base = str(settings.BASE_DIR)
+    if filename.startswith(base):
+        filename = os.path.relpath(filename, base)
+    elif 'site-packages' in filename:
+        filename = filename.split('site-packages' + os.sep, 1)[1]
+    return f'{code.co_qualname} ({filename}:{code.co_firstlineno})'
+
+
+def collapse_stack(frame):
+    """The stack as 'outer;...;inner', the folded format flame graph tools read."""
+    labels = []
+    while frame is not None and len(labels) < MAX_STACK_DEPTH:
+        labels.append(_frame_label(frame.f_code))
+        frame = frame.f_back
+    return ';'.join(reversed(labels))
+
+
+class StackSampler:
+    """Samples the stacks of the threads that registered with watch()."""
+
+    def __init__(self, interval):
+        self.interval = interval
+        self._watched = {}
+        self._lock = threading.Lock()
+        self._thread = None
+
+    def watch(self, thread_id):
+        samples = Counter()
+        with self._lock:
+            self._watched[thread_id] = samples
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name='profiling-sampler', daemon=True)
+                self._thread.start()
+        return samples
+
+    def unwatch(self, thread_id):
+        with self._lock:
+            self._watched.pop(thread_id, None)
+
+    def _run(self):
+        while True:
+            time.sleep(self.interval)
+            with self._lock:
+                watched = dict(self._watched)
+            if not watched:
+                continue
+            frames = sys._current_frames()
+            for thread_id, samples in watched.items():
+                frame = frames.get(thread_id)
+                if frame is not None:
+                    samples[collapse_stack(frame)] += 1
+
+
+_sampler = None
+_sampler_lock = threading.Lock()
+
+
+def get_sampler():
+    global _sampler
+    if _sampler is None:
+        with _sampler_lock:
+            if _sampler is None:
+                _sampler = StackSampler(profiling_config().get('SAMPLE_INTERVAL_MS', 5) / 1e3)
+    return _sampler
+
+
+# -- SQL log and allocations ----------------------------------------------------
+
+class QueryLog:
+    """Execute wrapper recording each query of one request."""
+
+    def __init__(self, alias):
+        self.alias = alias
+        self.queries = []
+        self.dropped = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            if len(self.queries) < MAX_QUERIES:
+                self.queries.append({
+                    'database': self.alias,
+                    'sql': sql[:MAX_SQL_LENGTH],
+                    'params': repr(params)[:MAX_SQL_LENGTH],
+                    'many': many,
+                    'ms': round((time.perf_counter() - started) * 1e3, 3),
+                })
+            else:
+                self.dropped += 1
+
+
+# tracemalloc is process-wide, so only one request tracks allocations at a time
+_tracemalloc_lock = threading.Lock()
+
+
+def start_tracemalloc():
+    if tracemalloc.is_tracing() or not _tracemalloc_lock.acquire(blocking=False):
+        return False
+    tracemalloc.start()
+    return True
+
+
+def stop_tracemalloc():
+    """Peak bytes allocated since start_tracemalloc()."""
+    try:
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+        _tracemalloc_lock.release()
+
+
+def capture_record(request, response, duration, reasons):
+    return {
+        'id': new_capture_id(),
+        'created': datetime.now(timezone.utc).isoformat(),
+        'pid': os.getpid(),
+        'method': request.method,
+        'path': request.get_full_path(),
+        'status': response.status_code if response is not None else None,
+        'duration_ms': round(duration * 1e3, 3),
+        'reasons': reasons,
+    }
+
+
+# -- storage --------------------------------------------------------------------
+
+def new_capture_id():
+    return f"{time.strftime('%Y%m%d-%H%M%S', time.gmtime())}-{uuid.uuid4().hex[:8]}"
+
+
+def _path(capture_id, suffix):
+    if not CAPTURE_ID.fullmatch(capture_id):
+        raise ValueError(f'Invalid capture id: {capture_id!r}')
+    return os.path.join(capture_directory(), capture_id + suffix)
+
+
+def save_capture(capture, profiler=None):
+    """Store a capture; a full or read-only disk only costs the capture."""
+    directory = capture_directory()
+    try:
+        os.makedirs(directory, exist_ok=True)
+        if profiler is not None:
+            profiler.dump_stats(_path(capture['id'], '.prof'))
+        # Write the metadata last and atomically: listings only see whole captures
+        fd, tmp = tempfile.mkstemp(dir=directory, prefix='.capture-')
+        with os.fdopen(fd, 'w') as fh:
+            json.dump(capture, fh)
+        os.replace(tmp, _path(capture['id'], '.json'))
+        rotate(profiling_config().get('KEEP', 200))
+    except OSError:
+        logger.warning('Could not store profile %s in %s', capture['id'], directory, exc_info=True)
+
+
+def capture_ids():
+    """Stored capture ids, newest first."""
+    try:
+        names = os.listdir(capture_directory())
+    except FileNotFoundError:
+        return []
+    ids = [name[:-5] for name in names if name.endswith('.json') and CAPTURE_ID.fullmatch(name[:-5])]
+    return sorted(ids, reverse=True)
+
+
+def rotate(keep):
+    for capture_id in capture_ids()[keep:]:
+        for suffix in ('.json', '.prof'):
+            try:
+                os.unlink(_path(capture_id, suffix))
+            except FileNotFoundError:
+                pass
+
+
+def load_capture(capture_id):
+    """The stored capture, or None if there is no such capture."""
+    try:
+        with open(_path(capture_id, '.json')) as fh:
+            return json.load(fh)
+    except (ValueError, OSError):
+        return None
+
+
+def profile_path(capture_id):
+    path = _path(capture_id, '.prof')
+    return path if os.path.exists(path) else None
+
+
+def summarize(capture):
+    fields = ('id', 'created', 'method', 'path', 'status', 'duration_ms', 'reasons', 'tracemalloc_peak')
+    summary = {field: capture.get(field) for field in fields}
+    summary['queries'] = len(capture['sql']) + capture.get('sql_dropped', 0)
+    summary['sql_ms'] = round(sum(query['ms'] for query in capture['sql']), 3)
+    summary['has_profile'] = capture.get('profiler') == 'cprofile'
+    return summary
+
+
+def top_functions(capture_id, limit=30, sort='cumulative'):
+    """The slowest functions of a cProfile capture, as plain dicts."""
+    path = profile_path(capture_id)
+    if path is None:
+        return []
+    stats = pstats.Stats(path)
+    stats.sort_stats(sort)
+    rows = []
+    for func in stats.fcn_list[:limit]:
+        primitive_calls, calls, own, cumulative, _ = stats.stats[func]
+        filename, line, name = func
+        rows.append({
+            'function': f'{name} ({filename}:{line})',
+            'calls': calls,
+            'primitive_calls': primitive_calls,
+            'own_ms': round(own * 1e3, 3),
+            'cumulative_ms': round(cumulative * 1e3, 3),
+        })
+    return rows
+
+
+def folded_stacks(capture):
+    return ''.join(f'{stack} {count}\n' for stack, count in capture.get('stacks', {}).items())
+
+
+# -- staff endpoints --------------------------------------------------------------
+
+class ProfileListView(APIView):
+    permission_classes = [permissions.IsAdminUser]
+    stateless_user = True  # is_staff comes from the token claims
+    schema = None
+
+    def get(self, request):
+        try:
+            limit = int(request.query_params.get('limit', 50))
+        except ValueError:
+            raise exceptions.ValidationError({'limit': ['A valid integer is required.']})
+        limit = max(1, min(limit, 500))
+        captures = (load_capture(capture_id) for capture_id in capture_ids()[:limit])
+        return Response([summarize(capture) for capture in captures if capture])
+
+
+class ProfileDetailView(APIView):
+    permission_classes = [permissions.IsAdminUser]
+    stateless_user = True
+    schema = None
+
+    def get(self, request, capture_id):
+        capture = _get_or_404(capture_id)
+        capture['top_functions'] = top_functions(capture_id)
+        return Response(capture)
+
+
+class ProfileDownloadView(APIView):
+    """?file=prof (pstats, the default when present), json or stacks (folded)."""
+
+    permission_classes = [permissions.IsAdminUser]
+    stateless_user = True
+    schema = None
+
+    def get(self, request, capture_id):
+        capture = _get_or_404(capture_id)
+        kind = request.query_params.get('file') or ('prof' if profile_path(capture_id) else 'json')
+        if kind == 'prof':
+            path = profile_path(capture_id)
+            if path is None:
+                raise Http404('This capture has no cProfile data.')
+            return FileResponse(open(path, 'rb'), as_attachment=True, filename=f'{capture_id}.prof')
+        if kind == 'stacks':
+            content, filename = folded_stacks(capture), f'{capture_id}.folded.txt'
+        elif kind == 'json':
+            content, filename = json.dumps(capture, indent=2), f'{capture_id}.json'
+        else:
+            raise Http404(f'Unknown file type {kind!r}.')
+        return FileResponse(
+            iter([content.encode()]), as_attachment=True, filename=filename,
+            content_type='text/plain; charset=utf-8' if kind == 'stacks' else 'application/json',
+        )
+
+
+def _get_or_404(capture_id):
+    capture = load_capture(capture_id) if CAPTURE_ID.fullmatch(capture_id) else None
+    if capture is None:
+        raise Http404('No such capture.')
+    return capture
+
@@ -0,0 +1,160 @@
+# core/querybudget.py
+"""
+Query budgets and N+1 detection for tests.
+
+record_queries() captures every query run on any database connection of the
+current thread while it is active. QueryLog groups the queries by shape (the
+SQL with literals, placeholders and IN-lists collapsed). A shape that runs
+once per row is how an N+1 shows up.
+
+assert_query_budget() fails when a block runs more queries than its budget
+or repeats a shape more than ``max_repeats`` times. QueryBudgetMixin adds it
+to a TestCase. There is no pytest plugin: the suite runs under Django's test
+runner (manage.py test), and pytest is not a dependency.
+"""
+import os
+import re
+import traceback
+from collections import Counter
+from contextlib import ExitStack, contextmanager
+from dataclasses import dataclass
+
+from django import db
+from django.conf import settings
+from django.db import connections
+
+_IN_LIST = re.compile(r'\bIN \((?:%s|\?)(?:, (?:%s|\?))*\)', re.IGNORECASE)
+_STRING = re.compile(r"'(?:[^']|'')*'")
+_NUMBER = re.compile(r'\b\d+(?:\.\d+)?\b')
+_SAVEPOINT = re.compile(r'"s\d+_x\d+"')
+_SPACE = re.compile(r'\s+')
+
+# Transaction bookkeeping, not work a view asked for
+_CONTROL = re.compile(r'^(SAVEPOINT|RELEASE SAVEPOINT|ROLLBACK TO SAVEPOINT|BEGIN|COMMIT)\b', re.IGNORECASE)
+
+
+def query_shape(sql):
+    """The SQL with its variable parts replaced, so per-row queries compare equal."""
+    sql = _SAVEPOINT.sub('"sp"', sql)
+    sql = _IN_LIST.sub('IN (...)', sql)
+    sql = _STRING.sub('?', sql)
+    sql = _NUMBER.sub('?', sql)
+    return _SPACE.sub(' ', sql).strip()
+
+
+_ORM_DIR = os.path.dirname(db.__file__) + os.sep
+
+
+def _short(filename):
+    base = str(settings.BASE_DIR) + os.sep
+    if filename.startswith(base):
+        return os.path.relpath(filename, base)
+    if 'site-packages' + os.sep in filename:
+        return filename.split('site-packages' + os.sep, 1)[1]
+    return filename
+
+
+def _origin():
+    """
+    What asked for the query: the innermost frame outside the ORM that was
+    not itself called by the ORM (which rules out execute wrappers).
+    """
+    stack = traceback.extract_stack()[:-2]
+    for caller, frame in zip(reversed(stack[:-1]), reversed(stack)):
+        if not frame.filename.startswith(_ORM_DIR) and not caller.filename.startswith(_ORM_DIR):
+            return f'{_short(frame.filename)}:{frame.lineno} in {frame.name}'
+    return 'unknown'
+
+
+@dataclass
+class CapturedQuery:
+    sql: str
+    alias: str
+    origin: str
+
+    @property
+    def shape(self):
+        return query_shape(self.sql)
+
+    @property
+    def is_control(self):
+        return bool(_CONTROL.match(self.sql))
+
+
+class QueryLog:
+    def __init__(self):
+        self.queries = []
+
+    def __call__(self, alias):
+        def wrapper(execute, sql, params, many, context):
+            self.queries.append(CapturedQuery(sql, alias, _origin()))
+            return execute(sql, params, many, context)
+        return wrapper
+
+    @property
+    def work(self):
+        """The queries, without savepoints and other transaction control."""
+        return [query for query in self.queries if not query.is_control]
+
+    def __len__(self):
+        return len(self.work)
+
+    def shapes(self):
+        return Counter(query.shape for query in self.work)
+
+    def repeated(self, max_repeats=1):
+        """(shape, count, origin) for shapes run more than ``max_repeats`` times."""
+        origins = {}
+        for query in self.work:
+            origins.setdefault(query.shape, query.origin)
+        return [
+            (shape, count, origins[shape])
+            for shape, count in self.shapes().most_common()
+            if count > max_repeats
+        ]
+
+    def report(self):
+        lines = [f'{len(self)} queries:']
+        for shape, count in self.shapes().most_common():
+            lines.append(f'  {count:3d}x {shape[:300]}')
+        return '\n'.join(lines)
+
+
+class QueryBudgetExceeded(AssertionError):
+    pass
+
+
+@contextmanager
+def record_queries(using=None):
+    """Collect the queries run on ``using`` (default: every database)."""
+    log = QueryLog()
+    aliases = [using] if using else list(connections)
+    with ExitStack() as stack:
+        for alias in aliases:
+            stack.enter_context(connections[alias].execute_wrapper(log(alias)))
+        yield log
+
+
+def check_budget(log, budget, max_repeats=1, label='block'):
+    problems = []
+    if budget is not None and len(log) > budget:
+        problems.append(f'{label} ran {len(log)} queries, budget is {budget}.')
+    for shape, count, origin in log.repeated(max_repeats):
+        problems.append(f'{label} ran the same query {count} times (N+1?), first from {origin}:\n    {shape[:300]}')
+    if problems:
+        raise QueryBudgetExceeded('\n'.join(problems) + '\n' + log.report())
+
+
+@contextmanager
+def assert_query_budget(budget, max_repeats=1, label='block'):
+    """Fail if the block runs more than ``budget`` queries or repeats a query shape."""
+    with record_queries() as log:
+        yield log
+    check_budget(log, budget, max_repeats, label)
+
+
+class QueryBudgetMixin:
+    """TestCase mixin: ``with self.assertQueryBudget(3): ...``."""
+
+    def assertQueryBudget(self, budget, max_repeats=1, label='block'):
+        return assert_query_budget(budget, max_repeats, label)
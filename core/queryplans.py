@@ -0,0 +1,203 @@
+# core/queryplans.py
+"""
+Query-plan snapshots for the listing read path.
+
+canonical_cases() builds the querysets ListingListCreateView runs for each
+filterset field, search, the amenity filter and every ordering, plus
+ListingDetailView's lookup, through the views' own get_queryset() and
+filter_queryset(). capture() evaluates each one, records every query it
+runs (prefetches included) and explains them:
+
+- SQLite: EXPLAIN QUERY PLAN, as an indented tree of its detail lines;
+- Postgres: EXPLAIN (ANALYZE, FORMAT JSON), as a tree of node types,
+  relations and indexes, plus the planner's total cost.
+
+Other vendors get a placeholder plan with no scans, so they never fail a
+check. Plans are normalized so they compare across runs and data sizes.
+compare() reports a query that now scans a whole table it used to reach
+through an index, or whose estimated cost grew past a factor; the
+``query_plans`` command stores snapshots per vendor under
+QUERY_PLAN_SNAPSHOTS and checks against them.
+"""
+import json
+import os
+import re
+
+from django.conf import settings
+from django.db import connections
+from rest_framework.test import APIRequestFactory
+
+from .querybudget import query_shape
+
+# Vendors with an EXPLAIN that explain() understands
+VENDORS = ('sqlite', 'postgresql')
+
+_SQLITE_SCAN = re.compile(r'^SCAN (?!CONSTANT ROW)(?:TABLE )?(\w+)')
+
+
+def snapshot_path(vendor):
+    directory = getattr(settings, 'QUERY_PLAN_SNAPSHOTS', settings.BASE_DIR / 'core' / 'plan_snapshots')
+    return os.path.join(directory, f'{vendor}.json')
+
+
+def canonical_cases(using='default'):
+    """(name, queryset) for the queries behind the listing list and detail views."""
+    from .models import Listing, User
+    from .views import ListingDetailView, ListingListCreateView
+
+    listing = Listing.objects.using(using).order_by('pk').first()
+    agent_id = listing.agent_id if listing else User.objects.using(using).values_list('pk', flat=True).first()
+    amenity = listing.amenities.first() if listing else None
+    amenity_name = amenity.name if amenity else 'WiFi'
+
+    params = [
+        ('list', {}),
+        ('list?location', {'location': 'AROMA'}),
+        ('list?room_type', {'room_type': 'SELF_CONTAINED'}),
+        ('list?is_available', {'is_available': 'true'}),
+        ('list?agent', {'agent': agent_id}),
+        ('list?first_price', {'first_price': '50000'}),
+        ('list?year_price', {'year_price': '500000'}),
+        ('list?total_rooms', {'total_rooms': 4}),
+        ('list?search', {'search': 'Royal'}),
+        ('list?amenities=1', {'amenities': amenity_name}),
+        ('list?amenities=2', {'amenities': f'{amenity_name},Parking'}),
+    ]
+    for field in ListingListCreateView.ordering_fields:
+        params.append((f'list?ordering={field}', {'ordering': field}))
+        params.append((f'list?ordering=-{field}', {'ordering': f'-{field}'}))
+
+    cases = []
+    for name, query in params:
+        view = _view(ListingListCreateView, query)
+        cases.append((name, view.filter_queryset(view.get_queryset()).using(using)))
+    view = _view(ListingDetailView, {})
+    pk = listing.pk if listing else 1
+    cases.append(('detail', view.filter_queryset(view.get_queryset()).using(using).filter(pk=pk)))
+    return cases
+
+
+def _view(view_class, query):
+    view = view_class()
+    view.request = view.initialize_request(APIRequestFactory().get('/', query))
+    view.args, view.kwargs, view.format_kwarg = (), {}, None
+    return view
+
+
+def _record(queries):
+    def wrapper(execute, sql, params, many, context):
+        queries.append((sql, params))
+        return execute(sql, params, many, context)
+    return wrapper
+
+
+def capture(using='default'):
+    """{query name: normalized plan} for every query the canonical cases run."""
+    connection = connections[using]
+    snapshots = {}
+    for name, queryset in canonical_cases(using):
+        queries = []
+        with connection.execute_wrapper(_record(queries)):
+            list(queryset)
+        for index, (sql, params) in enumerate(queries, 1):
+            snapshots[f'{name} #{index}'] = explain(connection, sql, params)
+    return snapshots
+
+
+def explain(connection, sql, params):
+    if connection.vendor == 'sqlite':
+        with connection.cursor() as cursor:
+            cursor.execute('EXPLAIN QUERY PLAN ' + sql, params)
+            rows = cursor.fetchall()
+        return _sqlite_plan(sql, rows)
+    if connection.vendor == 'postgresql':
+        with connection.cursor() as cursor:
+            cursor.execute('EXPLAIN (ANALYZE, FORMAT JSON) ' + sql, params)
+            document = cursor.fetchone()[0]
+        if isinstance(document, str):
+            document = json.loads(document)
+        return _postgres_plan(sql, document[0]['Plan'])
+    return {'sql': query_shape(sql), 'plan': [f'no plans for {connection.vendor}'], 'full_scans': [], 'cost': None}
+
+
+def _sqlite_plan(sql, rows):
+    depth = {0: -1}
+    lines, scans = [], set()
+    for node_id, parent, _, detail in rows:
+        depth[node_id] = depth.get(parent, -1) + 1
+        lines.append('  ' * depth[node_id] + detail)
+        match = _SQLITE_SCAN.match(detail)
+        if match:
+            scans.add(match.group(1))
+    return {'sql': query_shape(sql), 'plan': lines, 'full_scans': sorted(scans), 'cost': None}
+
+
+def _postgres_plan(sql, root):
+    lines, scans = [], set()
+
+    def walk(node, depth):
+        line = node['Node Type']
+        if 'Index Name' in node:
+            line += f" using {node['Index Name']}"
+        if 'Relation Name' in node:
+            line += f" on {node['Relation Name']}"
+            if node['Node Type'] == 'Seq Scan':
+                scans.add(node['Relation Name'])
+        lines.append('  ' * depth + line)
+        for child in node.get('Plans', []):
+            walk(child, depth + 1)
+
+    walk(root, 0)
+    return {'sql': query_shape(sql), 'plan': lines, 'full_scans': sorted(scans), 'cost': root['Total Cost']}
+
+
+def load_snapshot(vendor):
+    path = snapshot_path(vendor)
+    if not os.path.exists(path):
+        return None
+    with open(path) as fh:
+        return json.load(fh)['queries']
+
+
+def save_snapshot(vendor, queries):
+    path = snapshot_path(vendor)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'w') as fh:
+        json.dump({'vendor': vendor, 'queries': queries}, fh, indent=2, sort_keys=True)
+        fh.write('\n')
+    return path
+
+
+def compare(snapshot, current, cost_factor=2.0):
+    """
+    (regressions, changes): regressions fail a check, changes (a different
+    plan that is no worse, or a query added or gone) only need a new snapshot.
+    """
+    regressions, changes = [], []
+    for name in sorted(set(snapshot) | set(current)):
+        before, after = snapshot.get(name), current.get(name)
+        if before is None:
+            changes.append(f'{name}: new query')
+            continue
+        if after is None:
+            changes.append(f'{name}: no longer runs')
+            continue
+        if before['sql'] != after['sql']:
+            changes.append(f'{name}: different SQL')
+        new_scans = sorted(set(after['full_scans']) - set(before['full_scans']))
+        if new_scans:
+            regressions.append(f"{name}: full scan of {', '.join(new_scans)}\n" + _diff(before, after))
+        elif before['cost'] and after['cost'] and after['cost'] > before['cost'] * cost_factor:
+            regressions.append(
+                f"{name}: estimated cost {before['cost']:.1f} -> {after['cost']:.1f}\n" + _diff(before, after)
+            )
+        elif before['plan'] != after['plan']:
+            changes.append(f'{name}: plan changed\n' + _diff(before, after))
+    return regressions, changes
+
+
+def _diff(before, after):
+    return '\n'.join(
+        ['    was:'] + [f'      {line}' for line in before['plan']]
+        + ['    now:'] + [f'      {line}' for line in after['plan']]
+    )
@@ -0,0 +1,230 @@
+# core/readmodel.py
+"""
+The listing_search read model (models.ListingSearch).
+
+The listings grid used to join core_listing, core_user, the amenities M2M,
+core_amenity and core_listingimage on every request. listing_search holds
+one flat row per listing with everything a card shows, so the list endpoint
+reads a single table.
+
+Rows are derived, never edited: refresh_listings() rebuilds the rows of the
+given listings from the source tables, and the signals in core.signals call
+it from inside the writing transaction, so the read model commits or rolls
+back together with the write. Writes that skip signals (QuerySet.update(),
+bulk_create(), raw SQL) leave rows stale; ``manage.py listing_search check``
+finds them and ``rebuild`` regenerates the table.
+
+A write that fires several signals (a listing saved, then its amenities set,
+then its images added) would refresh the same row each time. Views wrap such
+writes in deferred_refresh(), which collects the listings and refreshes them
+once when the block ends, still inside the transaction.
+
+Every rewrite stamps the row's refreshed_at, and deleted listings are logged
+in ListingDeletion, so a reader can follow the table by polling
+(core.listingindex). Readers in the same process can listen to rows_changed
+instead (core.feed, core.outbox).
+"""
+from collections import defaultdict
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.db import DEFAULT_DB_ALIAS, transaction
+from django.db.models import Value
+from django.db.models.functions import Replace
+from django.dispatch import Signal
+from django.utils import timezone
+
+from .models import Listing, ListingDeletion, ListingImage, ListingSearch
+
+# Listing fields SearchFilter matched before the read model; their text is
+# copied into ListingSearch.search_text
+SEARCH_FIELDS = ('lodge_name', 'description', 'room_number', 'agency', 'contact_phone', 'contact_email')
+
+_ROW_FIELDS = [field for field in ListingSearch._meta.concrete_fields if not field.primary_key]
+ROW_FIELDS = [field.name for field in _ROW_FIELDS]
+# What check() compares; refreshed_at differs on every rebuild by design
+_CHECKED_FIELDS = [field for field in _ROW_FIELDS if field.name != 'refreshed_at']
+
+
+# Sent with listing_ids (rows rewritten), deleted_ids and using, inside the
+# writing transaction, and rows (the new rows) when at hand; only rewrites
+# by this module are reported
+rows_changed = Signal()
+
+
+def encode_ids(ids):
+    return ',' + ''.join(f'{pk},' for pk in sorted(ids))
+
+
+def build_rows(listing_ids, using=None):
+    """Unsaved ListingSearch rows for the listings that still exist, in three queries."""
+    listings = Listing.objects.using(using).filter(pk__in=listing_ids).select_related('agent')
+    amenities = defaultdict(list)
+    links = Listing.amenities.through.objects.using(using).filter(listing_id__in=listing_ids)
+    for listing_id, amenity_id in links.values_list('listing_id', 'amenity_id'):
+        amenities[listing_id].append(amenity_id)
+    images = defaultdict(list)
+    # ListingImage.Meta.ordering puts the cover image first
+    for listing_id, image in ListingImage.objects.using(using).filter(listing_id__in=listing_ids).values_list(
+        'listing_id', 'image'
+    ):
+        images[listing_id].append(image)
+
+    now = timezone.now()
+    rows = []
+    for listing in listings:
+        own_images = images[listing.pk]
+        rows.append(ListingSearch(
+            listing_id=listing.pk,
+            lodge_name=listing.lodge_name,
+            description=listing.description,
+            first_price=listing.first_price,
+            year_price=listing.year_price,
+            effective_price=listing.year_price if listing.year_price is not None else listing.first_price,
+            location=listing.location,
+            room_type=listing.room_type,
+            total_rooms=listing.total_rooms,
+            is_available=listing.is_available,
+            agent_id=listing.agent_id,
+            agent_name=listing.agent.full_name,
+            agency=listing.agency,
+            amenity_ids=encode_ids(amenities[listing.pk]),
+            cover_image_url=own_images[0].url if own_images else None,
+            image_count=len(own_images),
+            search_text='\n'.join(str(value) for field in SEARCH_FIELDS if (value := getattr(listing, field))),
+            created_at=listing.created_at,
+            updated_at=listing.updated_at,
+            refreshed_at=now,
+        ))
+    return rows
+
+
+def refresh_listings(listing_ids, using=None):
+    """Rebuild the rows of these listings; rows of deleted listings go."""
+    listing_ids = set(listing_ids)
+    if not listing_ids:
+        return
+    with transaction.atomic(using=using):
+        rows = build_rows(listing_ids, using)
+        ListingSearch.objects.using(using).bulk_create(
+            rows, update_conflicts=True, unique_fields=['listing'], update_fields=ROW_FIELDS,
+        )
+        gone = listing_ids - {row.listing_id for row in rows}
+        if gone:
+            ListingSearch.objects.using(using).filter(listing_id__in=gone).delete()
+    rows_changed.send(ListingSearch, listing_ids=listing_ids - gone, deleted_ids=(), using=using, rows=rows)
+
+
+# alias -> listing ids waiting for the end of a deferred_refresh() block
+_deferred = ContextVar('listing_search_deferred', default=None)
+
+
+def listings_changed(listing_ids, using=None):
+    """Refresh these rows now, or at the end of the enclosing deferred_refresh()."""
+    deferred = _deferred.get()
+    if deferred is None:
+        refresh_listings(listing_ids, using)
+    else:
+        deferred[using or DEFAULT_DB_ALIAS].update(listing_ids)
+
+
+@contextmanager
+def deferred_refresh():
+    """Refresh each listing changed in the block once, when it ends without error."""
+    if _deferred.get() is not None:
+        yield
+        return
+    deferred = defaultdict(set)
+    token = _deferred.set(deferred)
+    try:
+        yield
+    finally:
+        _deferred.reset(token)
+    for using, listing_ids in deferred.items():
+        refresh_listings(listing_ids, using)
+
+
+def _update_rows(rows, **values):
+    # Listeners need the ids, which costs a query; skipped when there are none
+    if rows_changed.has_listeners(ListingSearch):
+        listing_ids = set(rows.values_list('listing_id', flat=True))
+        rows = rows.model.objects.using(rows.db).filter(listing_id__in=listing_ids)
+    else:
+        listing_ids = None
+    rows.update(**values, refreshed_at=timezone.now())
+    if listing_ids:
+        rows_changed.send(ListingSearch, listing_ids=listing_ids, deleted_ids=(), using=rows.db)
+
+
+def remove_amenity(amenity_id, using=None):
+    """Drop a deleted amenity from every row, in one statement."""
+    token = f',{amenity_id},'
+    _update_rows(
+        ListingSearch.objects.using(using).filter(amenity_ids__contains=token),
+        amenity_ids=Replace('amenity_ids', Value(token), Value(',')),
+    )
+
+
+def rename_agent(agent, using=None):
+    _update_rows(
+        ListingSearch.objects.using(using).filter(agent_id=agent.pk).exclude(agent_name=agent.full_name),
+        agent_name=agent.full_name,
+    )
+
+
+def record_deletions(listing_ids, using=None):
+    ListingDeletion.objects.using(using).bulk_create([ListingDeletion(listing_id=pk) for pk in listing_ids])
+    rows_changed.send(ListingSearch, listing_ids=(), deleted_ids=set(listing_ids), using=using)
+
+
+def prune_deletions(before, using=None):
+    """Forget deletions logged before ``before``; returns how many."""
+    deleted, _ = ListingDeletion.objects.using(using).filter(deleted_at__lt=before).delete()
+    return deleted
+
+
+def _batches(batch_size, using=None):
+    ids = Listing.objects.using(using).order_by('pk').values_list('pk', flat=True)
+    last = 0
+    while True:
+        batch = list(ids.filter(pk__gt=last)[:batch_size])
+        if not batch:
+            return
+        yield batch
+        last = batch[-1]
+
+
+def rebuild(batch_size=1000, using=None):
+    """Regenerate every row; returns the number of listings."""
+    total = 0
+    for batch in _batches(batch_size, using):
+        refresh_listings(batch, using)
+        total += len(batch)
+    # Only reachable if rows were written around the foreign key
+    ListingSearch.objects.using(using).exclude(listing__in=Listing.objects.using(using).all()).delete()
+    return total
+
+
+def check(batch_size=1000, using=None):
+    """
+    Compare every row with what the source tables give now. Returns
+    {listing id: description of the drift}; empty when consistent.
+    """
+    problems = {}
+    for batch in _batches(batch_size, using):
+        stored = ListingSearch.objects.using(using).in_bulk(batch)
+        for expected in build_rows(batch, using):
+            row = stored.get(expected.listing_id)
+            if row is None:
+                problems[expected.listing_id] = 'missing'
+                continue
+            stale = [
+                field.name for field in _CHECKED_FIELDS
+                if getattr(row, field.attname) != getattr(expected, field.attname)
+            ]
+            if stale:
+                problems[expected.listing_id] = 'stale ' + ', '.join(stale)
+    orphans = ListingSearch.objects.using(using).exclude(listing__in=Listing.objects.using(using).all())
+    for listing_id in orphans.values_list('listing_id', flat=True):
+        problems[listing_id] = 'listing no longer exists'
+    return problems
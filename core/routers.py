@@ -0,0 +1,129 @@
+# core/routers.py
+"""
+Read-replica routing for the listing read path.
+
+Only reads of listing models made while a ReplicaReadMixin view handles a
+safe request go to a replica; everything else, including all writes and any
+read inside a transaction, stays on the primary. After an agent writes
+through one of those views they are pinned to the primary for
+REPLICA_PIN_SECONDS so they always read their own writes.
+"""
+import logging
+import random
+import time
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS, DatabaseError, connections
+from rest_framework import permissions
+
+logger = logging.getLogger(__name__)
+
+REPLICA_MODELS = {'core.listing', 'core.amenity', 'core.listingimage', 'core.listingsearch'}
+
+replica_reads = ContextVar('replica_reads', default=False)
+
+# alias -> (lag in seconds or None when unreachable, checked at)
+_lag_checks = {}
+
+
+def replica_aliases():
+    return getattr(settings, 'DATABASE_REPLICAS', [])
+
+
+def measure_lag(alias):
+    """Replication lag of a replica in seconds (0 where it can't lag)."""
+    connection = connections[alias]
+    if connection.vendor != 'postgresql':
+        return 0.0
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT CASE WHEN pg_is_in_recovery() "
+            "THEN COALESCE(EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()), 0) "
+            "ELSE 0 END"
+        )
+        return float(cursor.fetchone()[0])
+
+
+def replica_lag(alias):
+    """Cached lag for a replica, re-measured every REPLICA_LAG_CHECK_INTERVAL."""
+    now = time.monotonic()
+    checked = _lag_checks.get(alias)
+    if checked is None or now - checked[1] > getattr(settings, 'REPLICA_LAG_CHECK_INTERVAL', 5):
+        try:
+            lag = measure_lag(alias)
+        except DatabaseError:
+            logger.warning('Replica %s is unreachable, reading from primary', alias, exc_info=True)
+            lag = None
+        checked = _lag_checks[alias] = (lag, now)
+    return checked[0]
+
+
+def healthy_replicas():
+    max_lag = getattr(settings, 'REPLICA_MAX_LAG_SECONDS', 5)
+    return [
+        alias for alias in replica_aliases()
+        if (lag := replica_lag(alias)) is not None and lag <= max_lag
+    ]
+
+
+def _pin_key(user_id):
+    return f'replica:pin:{user_id}'
+
+
+def pin_to_primary(user):
+    cache.set(_pin_key(user.pk), True, getattr(settings, 'REPLICA_PIN_SECONDS', 10))
+
+
+def is_pinned(user):
+    return user.is_authenticated and cache.get(_pin_key(user.pk), False)
+
+
+class ReplicaRouter:
+    def db_for_read(self, model, **hints):
+        if not replica_reads.get() or model._meta.label_lower not in REPLICA_MODELS:
+            return None
+        if connections[DEFAULT_DB_ALIAS].in_atomic_block:
+            return None
+        replicas = healthy_replicas()
+        # None falls through to the primary when every replica lags.
+        return random.choice(replicas) if replicas else None
+
+    def db_for_write(self, model, **hints):
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Replicas hold the same rows as the primary.
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return db not in replica_aliases()
+
+
+class ReplicaReadMixin:
+    """
+    Send a view's safe requests to a replica, and pin a user to the primary
+    after a successful write through it.
+    """
+
+    def dispatch(self, request, *args, **kwargs):
+        token = replica_reads.set(False)
+        try:
+            return super().dispatch(request, *args, **kwargs)
+        finally:
+            replica_reads.reset(token)
+
+    def initial(self, request, *args, **kwargs):
+        super().initial(request, *args, **kwargs)
+        if request.method in permissions.SAFE_METHODS and not is_pinned(request.user):
+            replica_reads.set(True)
+
+    def finalize_response(self, request, response, *args, **kwargs):
+        if (
+            request.method not in permissions.SAFE_METHODS
+            and response.status_code < 400
+            and request.user.is_authenticated
+        ):
+            pin_to_primary(request.user)
+        return super().finalize_response(request, response, *args, **kwargs)
@@ -0,0 +1,211 @@
+# core/schema.py
+"""
+OpenAPI schema generated once per code version and served from memory.
+
+Generating the document walks every view and serializer, so
+``manage.py generate_schema`` writes it to OPENAPI_SCHEMA_FILE at deploy.
+Workers load that file when it was built from the code they run, or
+regenerate (and rewrite) it on first use when it is missing or stale. The
+rendered YAML and JSON are kept in memory, plain and gzipped, with an
+ETag; clients revalidate with If-None-Match and get a 304.
+"""
+import gzip
+import hashlib
+import json
+import logging
+import os
+import tempfile
+import threading
+from dataclasses import dataclass
+from importlib.metadata import PackageNotFoundError, version as package_version
+from pathlib import Path
+
+from django.conf import settings
+from django.http import HttpResponse, HttpResponseNotAllowed, HttpResponseNotModified
+from django.utils.http import parse_etags
+
+logger = logging.getLogger(__name__)
+
+# Project code the schema is generated from
+SOURCE_DIRS = ('config', 'core')
+SCHEMA_PACKAGES = ('djangorestframework', 'drf-spectacular', 'dj-rest-auth', 'djangorestframework-simplejwt')
+
+CONTENT_TYPES = {
+    'yaml': 'application/vnd.oai.openapi; charset=utf-8',
+    'json': 'application/vnd.oai.openapi+json; charset=utf-8',
+}
+
+
+def schema_path():
+    return Path(getattr(settings, 'OPENAPI_SCHEMA_FILE', settings.BASE_DIR / 'openapi-schema.json'))
+
+
+def code_version():
+    """
+    Identify the code the schema describes: SCHEMA_CODE_VERSION or the
+    deploy's commit when set, else a hash of the project sources and the
+    versions of the packages that shape the schema.
+    """
+    for name in ('SCHEMA_CODE_VERSION', 'RENDER_GIT_COMMIT'):
+        if os.environ.get(name):
+            return os.environ[name]
+
+    digest = hashlib.sha256()
+    base = Path(settings.BASE_DIR)
+    for directory in SOURCE_DIRS:
+        for path in sorted((base / directory).rglob('*.py')):
+            digest.update(str(path.relative_to(base)).encode())
+            digest.update(path.read_bytes())
+    for package in SCHEMA_PACKAGES:
+        try:
+            digest.update(f'{package}=={package_version(package)}'.encode())
+        except PackageNotFoundError:
+            pass
+    return digest.hexdigest()[:16]
+
+
+def generate_schema():
+    """Build the schema with drf-spectacular, as plain JSON-compatible data."""
+    from drf_spectacular.renderers import OpenApiJsonRenderer
+    from drf_spectacular.settings import spectacular_settings
+
+    generator = spectacular_settings.DEFAULT_GENERATOR_CLASS()
+    schema = generator.get_schema(request=None, public=True)
+    # Round-trip through the renderer to resolve lazy strings and the like
+    return json.loads(OpenApiJsonRenderer().render(schema))
+
+
+def read_schema(path):
+    """The stored {'version', 'schema'} document, or None if unreadable."""
+    try:
+        with open(path) as fh:
+            return json.load(fh)
+    except (OSError, ValueError):
+        return None
+
+
+def write_schema(path, version, schema):
+    """Write the schema file atomically so workers never read half a file."""
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    fd, tmp = tempfile.mkstemp(dir=path.parent, prefix='.openapi-')
+    try:
+        with os.fdopen(fd, 'w') as fh:
+            json.dump({'version': version, 'schema': schema}, fh)
+        os.replace(tmp, path)
+    except BaseException:
+        os.unlink(tmp)
+        raise
+
+
+@dataclass(frozen=True)
+class Representation:
+    content: bytes
+    gzipped: bytes
+    etag: str
+    content_type: str
+
+    @classmethod
+    def build(cls, content, content_type):
+        etag = '"%s"' % hashlib.sha256(content).hexdigest()[:32]
+        return cls(content, gzip.compress(content, mtime=0), etag, content_type)
+
+
+@dataclass(frozen=True)
+class SchemaDocument:
+    version: str
+    representations: dict
+
+    @classmethod
+    def build(cls, version, schema):
+        from drf_spectacular.renderers import OpenApiJsonRenderer, OpenApiYamlRenderer
+
+        return cls(version, {
+            'yaml': Representation.build(OpenApiYamlRenderer().render(schema), CONTENT_TYPES['yaml']),
+            'json': Representation.build(OpenApiJsonRenderer().render(schema), CONTENT_TYPES['json']),
+        })
+
+
+def load_schema_document(path=None):
+    path = path or schema_path()
+    version = code_version()
+    stored = read_schema(path)
+    if stored and stored.get('version') == version:
+        schema = stored['schema']
+    else:
+        logger.info('OpenAPI schema at %s is missing or stale, regenerating', path)
+        schema = generate_schema()
+        try:
+            write_schema(path, version, schema)
+        except OSError:
+            logger.warning('Could not write the OpenAPI schema to %s', path, exc_info=True)
+    return SchemaDocument.build(version, schema)
+
+
+_document = None
+_lock = threading.Lock()
+
+
+def get_schema_document():
+    """The process-wide schema document, loaded on first use."""
+    global _document
+    if _document is None:
+        with _lock:
+            if _document is None:
+                _document = load_schema_document()
+    return _document
+
+
+def negotiate_format(request):
+    requested = request.GET.get('format')
+    if requested in CONTENT_TYPES:
+        return requested
+    # Same default as drf-spectacular: YAML unless JSON is asked for
+    return 'json' if 'json' in request.headers.get('Accept', '') else 'yaml'
+
+
+def accepts_gzip(accept_encoding):
+    """
+    Whether an Accept-Encoding header allows gzip: listed (or x-gzip, or
+    covered by *) with a q-value above zero.
+    """
+    qualities = {}
+    for item in accept_encoding.split(','):
+        coding, *params = (part.strip() for part in item.split(';'))
+        if not coding:
+            continue
+        quality = 1.0
+        for param in params:
+            name, _, value = param.partition('=')
+            if name.strip().lower() == 'q':
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0.0
+        qualities[coding.lower()] = quality
+    for coding in ('gzip', 'x-gzip', '*'):
+        if coding in qualities:
+            return qualities[coding] > 0
+    return False
+
+
+def schema_view(request):
+    if request.method not in ('GET', 'HEAD'):
+        return HttpResponseNotAllowed(['GET', 'HEAD'])
+
+    representation = get_schema_document().representations[negotiate_format(request)]
+    headers = {
+        'ETag': representation.etag,
+        'Cache-Control': 'no-cache',
+        'Vary': 'Accept, Accept-Encoding',
+    }
+    # If-None-Match compares weakly: W/"x" matches "x"
+    if_none_match = {etag.removeprefix('W/') for etag in parse_etags(request.headers.get('If-None-Match', ''))}
+    if representation.etag in if_none_match or '*' in if_none_match:
+        return HttpResponseNotModified(headers=headers)
+
+    content = representation.content
+    if accepts_gzip(request.headers.get('Accept-Encoding', '')):
+        content = representation.gzipped
+        headers['Content-Encoding'] = 'gzip'
+    return HttpResponse(content, content_type=representation.content_type, headers=headers)
@@ -1,12 +1,31 @@
 from rest_framework import serializers
+from drf_spectacular.utils import extend_schema_field
 from dj_rest_auth.registration.serializers import RegisterSerializer
-from .models import User, Listing, ListingImage, Amenity
+from .models import User, Listing, ListingImage, ListingSearch, Amenity
 from allauth.account.adapter import get_adapter
 from allauth.account import app_settings as allauth_settings
 from dj_rest_auth.serializers import LoginSerializer
+from django.conf import settings
 from django.contrib.auth import authenticate
+from django.core.files.uploadedfile import UploadedFile
+from django.db import models
 from django.utils.translation import gettext_lazy as _
 from django.contrib.auth import get_user_model
+from rest_framework_simplejwt.serializers import TokenObtainPairSerializer
+from .authentication import add_token_claims
+from .cache import get_amenity_catalogue, get_amenity_ids_by_name
+from .metrics import TimedSerializerMixin, external_call
+
+
+class ClaimsTokenObtainPairSerializer(TokenObtainPairSerializer):
+    """
+    Issue tokens carrying the claims StatelessJWTAuthentication relies on.
+    Used by /api/token/ and, through REST_AUTH, by dj-rest-auth logins.
+    """
+
+    @classmethod
+    def get_token(cls, user):
+        return add_token_claims(super().get_token(user), user)
 
 
 class CustomLoginSerializer(LoginSerializer):
@@ -55,7 +74,7 @@ class CustomLoginSerializer(LoginSerializer):
         return self.get_auth_user_using_allauth(username, email, password)
 
 
-class UserSerializer(serializers.ModelSerializer):
+class UserSerializer(TimedSerializerMixin, serializers.ModelSerializer):
     class Meta:
         model = User
         fields = ['id', 'username', 'email', 'full_name', 'phone_number', 
@@ -129,7 +148,58 @@ class ListingImageSerializer(serializers.ModelSerializer):
         return obj.image.url if obj.image else None
 
 
-class ListingSerializer(serializers.ModelSerializer):
+def upload(model, field_name, value):
+    """
+    Upload a file bound for a CloudinaryField of ``model`` and return the
+    stored resource, which saves without another upload. Anything already
+    uploaded is returned as it is.
+    """
+    if not isinstance(value, UploadedFile):
+        return value
+    instance = model(**{field_name: value})
+    with external_call('cloudinary'):
+        model._meta.get_field(field_name).pre_save(instance, add=True)
+    return getattr(instance, field_name)
+
+
+def resolve_amenities(names):
+    """
+    Map amenity names to ids, creating unknown amenities. Known names are
+    resolved from the cached amenity catalogue without touching the database.
+    """
+    ids_by_name = get_amenity_ids_by_name()
+    amenity_ids = []
+    for name in names:
+        # Clean the name (strip whitespace)
+        cleaned_name = name.strip()
+        if not cleaned_name:  # Skip empty names
+            continue
+        amenity_id = ids_by_name.get(cleaned_name)
+        if amenity_id is None:
+            amenity, created = Amenity.objects.get_or_create(name=cleaned_name)
+            amenity_id = amenity.pk
+        amenity_ids.append(amenity_id)
+    return amenity_ids
+
+
+class SparseFieldsMixin:
+    """
+    Render only the fields in context['fields'] (the ?fields= names, set by
+    the view on reads) when there are any; unknown names are a 400.
+    """
+
+    def get_fields(self):
+        fields = super().get_fields()
+        requested = self.context.get('fields')
+        if not requested:
+            return fields
+        unknown = requested - fields.keys()
+        if unknown:
+            raise serializers.ValidationError({'fields': [f'Unknown fields: {", ".join(sorted(unknown))}.']})
+        return {name: field for name, field in fields.items() if name in requested}
+
+
+class ListingSerializer(SparseFieldsMixin, TimedSerializerMixin, serializers.ModelSerializer):
     images = ListingImageSerializer(many=True, read_only=True)
     cover_image_url = serializers.SerializerMethodField()
     location_display = serializers.CharField(source='get_location_display', read_only=True)
@@ -207,7 +277,21 @@ class ListingSerializer(serializers.ModelSerializer):
         
         return data
 
+    def upload_media(self, validated_data):
+        """
+        Send the video and images to Cloudinary. Views call this before
+        opening their transaction, so no write lock is held during uploads;
+        create() and update() call it again, which uploads nothing twice.
+        """
+        if validated_data.get('video') is not None:
+            validated_data['video'] = upload(Listing, 'video', validated_data['video'])
+        if validated_data.get('uploaded_images'):
+            validated_data['uploaded_images'] = [
+                upload(ListingImage, 'image', image) for image in validated_data['uploaded_images']
+            ]
+
     def create(self, validated_data):
+        self.upload_media(validated_data)
         uploaded_images = validated_data.pop('uploaded_images', [])
         amenity_names = validated_data.pop('amenity_names', [])
         request = self.context.get('request')
@@ -219,19 +303,7 @@ class ListingSerializer(serializers.ModelSerializer):
         listing = Listing.objects.create(**validated_data)
         
         # Process amenities - get or create by name
-        amenities = []
-        for name in amenity_names:
-            # Clean the name (strip whitespace, capitalize first letters)
-            cleaned_name = name.strip()
-            if cleaned_name:  # Skip empty names
-                # Get or create the amenity
-                amenity, created = Amenity.objects.get_or_create(
-                    name=cleaned_name,
-                    defaults={
-                        'name': cleaned_name
-                    }
-                )
-                amenities.append(amenity)
+        amenities = resolve_amenities(amenity_names)
         
         # Add amenities to the listing
         if amenities:
@@ -248,6 +320,7 @@ class ListingSerializer(serializers.ModelSerializer):
         return listing
 
     def update(self, instance, validated_data):
+        self.upload_media(validated_data)
         uploaded_images = validated_data.pop('uploaded_images', [])
         amenity_names = validated_data.pop('amenity_names', None)
         
@@ -258,16 +331,7 @@ class ListingSerializer(serializers.ModelSerializer):
         
         # Update amenities if provided
         if amenity_names is not None:
-            amenities = []
-            for name in amenity_names:
-                cleaned_name = name.strip()
-                if cleaned_name:
-                    amenity, created = Amenity.objects.get_or_create(
-                        name=cleaned_name,
-                        defaults={'name': cleaned_name}
-                    )
-                    amenities.append(amenity)
-            instance.amenities.set(amenities)
+            instance.amenities.set(resolve_amenities(amenity_names))
         
         # Add new images if provided
         if uploaded_images:
@@ -277,7 +341,75 @@ class ListingSerializer(serializers.ModelSerializer):
         return instance
 
 
-class ListingCreateUpdateSerializer(serializers.ModelSerializer):
+class ListingCardSerializer(SparseFieldsMixin, TimedSerializerMixin, serializers.ModelSerializer):
+    """
+    A listing as the grid shows it, read from the listing_search row alone.
+    Amenities come from the cached catalogue; the detail endpoint has the rest.
+    """
+    id = serializers.IntegerField(source='listing_id', read_only=True)
+    location_display = serializers.CharField(source='get_location_display', read_only=True)
+    amenities = serializers.SerializerMethodField()
+
+    class Meta:
+        model = ListingSearch
+        fields = [
+            'id', 'lodge_name', 'description', 'first_price', 'year_price', 'effective_price',
+            'location', 'location_display', 'room_type', 'total_rooms', 'is_available',
+            'agent', 'agent_name', 'agency', 'amenities', 'cover_image_url', 'image_count',
+            'created_at', 'updated_at',
+        ]
+        read_only_fields = fields
+
+    @extend_schema_field(AmenitySerializer(many=True))
+    def get_amenities(self, obj):
+        # Fetched once: the child serializer is shared by every row of a list.
+        # The async views load it ahead, off the event loop (core.async_views)
+        catalogue = getattr(self, '_catalogue', None)
+        if catalogue is None:
+            catalogue = self.context.get('amenity_catalogue')
+        if catalogue is None:
+            catalogue = get_amenity_catalogue()
+        self._catalogue = catalogue
+        ids = set(obj.amenity_id_list)
+        return [amenity for amenity in catalogue if amenity['id'] in ids]
+
+
+class ListingChangesSerializer(serializers.Serializer):
+    """A page of /api/listings/changes/ (core.changes)."""
+    changed = ListingCardSerializer(many=True, read_only=True)
+    deleted = serializers.ListField(
+        child=serializers.IntegerField(), read_only=True, help_text='Ids of listings deleted since the token'
+    )
+    next = serializers.CharField(read_only=True, help_text='Pass as ?since= on the next call')
+    more = serializers.BooleanField(read_only=True, help_text='Call again now: this page was full')
+
+
+class ListingBatchRequestSerializer(serializers.Serializer):
+    """The body of POST /api/listings/batch/ (GET's query string, split on commas)."""
+    ids = serializers.ListField(
+        child=serializers.IntegerField(min_value=1, max_value=models.BigIntegerField.MAX_BIGINT),
+        allow_empty=False,
+    )
+    fields = serializers.ListField(child=serializers.CharField(), required=False)
+
+    def validate_ids(self, ids):
+        limit = settings.LISTING_BATCH_MAX_IDS
+        if len(ids) > limit:
+            raise serializers.ValidationError(f'At most {limit} ids per request.')
+        return list(dict.fromkeys(ids))
+
+
+class ListingBatchSerializer(serializers.Serializer):
+    """A response of /api/listings/batch/."""
+    results = ListingSerializer(
+        many=True, read_only=True, help_text='One per requested id, in order; a not-found marker for missing ones',
+    )
+    missing = serializers.ListField(
+        child=serializers.IntegerField(), read_only=True, help_text='Requested ids with no listing',
+    )
+
+
+class ListingCreateUpdateSerializer(TimedSerializerMixin, serializers.ModelSerializer):
     uploaded_images = serializers.ListField(
         child=serializers.ImageField(max_length=None, allow_empty_file=False), 
         write_only=True, 
@@ -300,6 +432,9 @@ class ListingCreateUpdateSerializer(serializers.ModelSerializer):
             'uploaded_images'
         ]
         
+    def upload_media(self, validated_data):
+        ListingSerializer.upload_media(self, validated_data)
+
     def create(self, validated_data):
         return ListingSerializer.create(self, validated_data)
     
@@ -307,7 +442,7 @@ class ListingCreateUpdateSerializer(serializers.ModelSerializer):
         return ListingSerializer.update(self, instance, validated_data)
 
 
-class AgentProfileSerializer(serializers.ModelSerializer):
+class AgentProfileSerializer(TimedSerializerMixin, serializers.ModelSerializer):
     listings_count = serializers.SerializerMethodField()
     active_listings_count = serializers.SerializerMethodField()
     
@@ -319,8 +454,14 @@ class AgentProfileSerializer(serializers.ModelSerializer):
         ]
         read_only_fields = ['id', 'date_joined']
     
+    # Load agents with User.objects.with_listing_counts() to avoid two
+    # count queries per agent
     def get_listings_count(self, obj):
+        if hasattr(obj, 'listings_total'):
+            return obj.listings_total
         return obj.listings.count()
     
     def get_active_listings_count(self, obj):
+        if hasattr(obj, 'available_listings_total'):
+            return obj.available_listings_total
         return obj.listings.filter(is_available=True).count()
\ No newline at end of file
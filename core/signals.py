@@ -0,0 +1,140 @@
+# core/signals.py
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.db.backends.signals import connection_created
+from django.db.models import QuerySet
+from django.db.models.signals import m2m_changed, post_delete, post_save
+from django.dispatch import receiver
+from django.utils.module_loading import import_string
+from allauth.socialaccount.models import SocialApp
+
+from .authentication import forget_cached_user, invalidate_cached_user
+from .cache import tiered_cache
+from .feed import publish_on_commit
+from .metrics import install_query_recorder
+from .models import Amenity, Listing, ListingImage, ListingSearch
+from .oauth import social_apps
+from .outbox import record as record_listing_events
+from .readmodel import listings_changed, record_deletions, remove_amenity, rename_agent, rows_changed
+
+User = get_user_model()
+
+connection_created.connect(install_query_recorder, dispatch_uid='core.metrics.query_recorder')
+
+
+@receiver(post_save, sender=User)
+def refresh_cached_user(sender, instance, **kwargs):
+    """Keep the token-version and user caches in step with the users table."""
+    invalidate_cached_user(instance)
+
+
+@receiver(post_delete, sender=User)
+def drop_cached_user(sender, instance, **kwargs):
+    forget_cached_user(instance.pk)
+
+
+@receiver(post_save, sender=Listing)
+@receiver(post_delete, sender=Listing)
+def invalidate_listing_caches(sender, instance, **kwargs):
+    tiered_cache.invalidate_tags('listings')
+
+
+@receiver(post_save, sender=ListingImage)
+@receiver(post_delete, sender=ListingImage)
+def invalidate_listing_image_caches(sender, instance, **kwargs):
+    tiered_cache.invalidate_tags('listings')
+
+
+@receiver(post_save, sender=Amenity)
+@receiver(post_delete, sender=Amenity)
+def invalidate_amenity_caches(sender, instance, **kwargs):
+    tiered_cache.invalidate_tags('amenities', 'listings')
+
+
+@receiver(m2m_changed, sender=Listing.amenities.through)
+def invalidate_listing_amenity_caches(sender, action, **kwargs):
+    if action in ('post_add', 'post_remove', 'post_clear'):
+        tiered_cache.invalidate_tags('listings')
+
+
+@receiver(post_save, sender=SocialApp)
+@receiver(post_delete, sender=SocialApp)
+def drop_cached_social_apps(sender, **kwargs):
+    social_apps.clear()
+
+
+# -- listing_search read model (core.readmodel) --------------------------------
+# Refreshed in the writing transaction, so it commits or rolls back with it.
+
+def _deleted_directly(origin, model):
+    return isinstance(origin, model) or (isinstance(origin, QuerySet) and origin.model is model)
+
+
+@receiver(post_save, sender=Listing)
+def refresh_listing_search(sender, instance, raw=False, using=None, **kwargs):
+    if not raw:
+        listings_changed([instance.pk], using)
+
+
+@receiver(post_save, sender=ListingImage)
+def refresh_listing_search_images(sender, instance, raw=False, using=None, **kwargs):
+    if not raw:
+        listings_changed([instance.listing_id], using)
+
+
+@receiver(post_delete, sender=ListingImage)
+def refresh_listing_search_deleted_image(sender, instance, using=None, origin=None, **kwargs):
+    # When the listing (or its agent) is being deleted, its row goes with it;
+    # refreshing here would write a row for a listing about to disappear
+    if _deleted_directly(origin, ListingImage):
+        listings_changed([instance.listing_id], using)
+
+
+@receiver(m2m_changed, sender=Listing.amenities.through)
+def refresh_listing_search_amenities(sender, instance, action, reverse, pk_set, using=None, **kwargs):
+    if action == 'pre_clear' and reverse:
+        # amenity.listings.clear(): post_clear no longer knows the listings
+        instance._cleared_listing_ids = list(instance.listings.values_list('pk', flat=True))
+    elif action in ('post_add', 'post_remove', 'post_clear'):
+        if not reverse:
+            listings_changed([instance.pk], using)
+        elif action == 'post_clear':
+            listings_changed(getattr(instance, '_cleared_listing_ids', ()), using)
+        else:
+            listings_changed(pk_set, using)
+
+
+@receiver(post_delete, sender=Listing)
+def log_listing_deletion(sender, instance, using=None, **kwargs):
+    # The row itself goes with the listing (on_delete=CASCADE)
+    record_deletions([instance.pk], using)
+
+
+@receiver(post_delete, sender=Amenity)
+def remove_amenity_from_listing_search(sender, instance, using=None, **kwargs):
+    # Amenity names are rendered from the cached catalogue, so only a delete
+    # touches the rows
+    remove_amenity(instance.pk, using)
+
+
+@receiver(post_save, sender=User)
+def rename_agent_in_listing_search(sender, instance, raw=False, using=None, update_fields=None, **kwargs):
+    if not raw and instance.is_agent and (update_fields is None or 'full_name' in update_fields):
+        rename_agent(instance, using)
+
+
+# -- listing feed (core.feed) --------------------------------------------------
+
+def publish_listing_changes(sender, listing_ids, deleted_ids, using=None, **kwargs):
+    publish_on_commit(listing_ids, deleted_ids, using)
+
+
+# Only transports fed by the writers listen; the others find changes themselves
+if import_string(settings.LISTING_FEED['TRANSPORT']).publishes:
+    rows_changed.connect(publish_listing_changes, sender=ListingSearch, dispatch_uid='core.feed.publish')
+
+
+# -- listing outbox (core.outbox) ----------------------------------------------
+
+if settings.LISTING_OUTBOX['ENABLED']:
+    rows_changed.connect(record_listing_events, sender=ListingSearch, dispatch_uid='core.outbox.record')
@@ -0,0 +1,43 @@
+# core/sqlite.py
+"""
+SQLite tuning for DEBUG and single-box deployments.
+
+Imported by config/settings.py, so this module must not touch Django models.
+
+- WAL lets readers and one writer work concurrently instead of blocking.
+- synchronous=NORMAL is durable across application crashes in WAL mode and
+  skips an fsync per commit.
+- mmap_size/cache_size keep hot pages in memory; temp_store keeps sort and
+  temp tables in RAM.
+- transaction_mode=IMMEDIATE takes the write lock at BEGIN, so SQLite's busy
+  handler waits (and retries) for up to ``timeout`` seconds there instead of
+  failing with "database is locked" when a deferred read upgrades to a write.
+"""
+
+PRAGMAS = {
+    'journal_mode': 'WAL',
+    'synchronous': 'NORMAL',
+    'mmap_size': 128 * 1024 * 1024,
+    'cache_size': -20000,  # KiB, i.e. ~20 MB per connection
+    'temp_store': 'MEMORY',
+    'foreign_keys': 'ON',
+}
+
+
+def init_command(pragmas=None):
+    return ';'.join(f'PRAGMA {name}={value}' for name, value in (pragmas or PRAGMAS).items())
+
+
+def sqlite_options(timeout=20):
+    """OPTIONS for a Django sqlite3 DATABASES entry using the tuned profile."""
+    return {
+        'timeout': timeout,
+        'transaction_mode': 'IMMEDIATE',
+        'init_command': init_command(),
+    }
+
+
+def apply_pragmas(conn, pragmas=None):
+    """Apply the profile to a raw sqlite3 connection."""
+    for name, value in (pragmas or PRAGMAS).items():
+        conn.execute(f'PRAGMA {name}={value}')
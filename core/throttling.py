@@ -0,0 +1,244 @@
+# core/throttling.py
+"""
+Token-bucket throttles for DRF.
+
+DRF's SimpleRateThrottle keeps a list of request timestamps per client in the
+cache and rewrites it on every request. A token bucket needs two numbers per
+client (tokens left, last refill time), so every check is O(1) and the store
+can live in process memory, in a shared memory-mapped file, or in the cache.
+"""
+import fcntl
+import hashlib
+import mmap
+import os
+import struct
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.cache import caches
+from django.core.exceptions import ImproperlyConfigured
+from rest_framework import permissions
+from rest_framework.settings import api_settings
+from rest_framework.throttling import BaseThrottle
+
+DURATIONS = {'s': 1, 'm': 60, 'h': 3600, 'd': 86400}
+
+
+def parse_rate(rate):
+    """
+    Parse '<requests>/<period>' (e.g. '120/min', '5/10m') into the bucket
+    capacity and its refill rate in tokens per second.
+    """
+    num, period = rate.split('/')
+    num = int(num)
+    multiplier = 1
+    digits = ''.join(ch for ch in period if ch.isdigit())
+    if digits:
+        multiplier = int(digits)
+        period = period[len(digits):]
+    seconds = DURATIONS[period[0]] * multiplier
+    return num, num / seconds
+
+
+def refill(tokens, updated, capacity, refill_rate, now):
+    return min(capacity, tokens + (now - updated) * refill_rate)
+
+
+class LocalBucketStore:
+    """Per-process buckets, bounded to max_keys (least recently used go first)."""
+
+    def __init__(self, max_keys=100_000):
+        self.max_keys = max_keys
+        self._buckets = OrderedDict()
+        self._lock = threading.Lock()
+
+    def consume(self, key, capacity, refill_rate, cost=1):
+        now = time.monotonic()
+        with self._lock:
+            tokens, updated = self._buckets.pop(key, (capacity, now))
+            tokens = refill(tokens, updated, capacity, refill_rate, now)
+            allowed = tokens >= cost
+            if allowed:
+                tokens -= cost
+            self._buckets[key] = (tokens, now)
+            if len(self._buckets) > self.max_keys:
+                self._buckets.popitem(last=False)
+        return allowed, 0 if allowed else (cost - tokens) / refill_rate
+
+
+class SharedMemoryBucketStore:
+    """
+    Buckets in a memory-mapped file shared by every worker on the host.
+
+    The file is a fixed array of slots (key fingerprint, tokens, timestamp);
+    a key hashes to one slot and that slot's byte range is locked with
+    fcntl while it is updated. When two keys collide the newcomer takes the
+    slot over with a full bucket, so collisions can only ever let a request
+    through, never block one. Size the slot count well above the number of
+    concurrently active clients.
+    """
+
+    slot = struct.Struct('=Qdd')
+
+    def __init__(self, path, slots=65_536):
+        self.slots = slots
+        size = self.slot.size * slots
+        self._fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o600)
+        if os.fstat(self._fd).st_size < size:
+            os.ftruncate(self._fd, size)
+        self._map = mmap.mmap(self._fd, size)
+        self._lock = threading.Lock()
+
+    def _locate(self, key):
+        digest = hashlib.blake2b(key.encode(), digest_size=8).digest()
+        fingerprint = int.from_bytes(digest, 'little') or 1
+        return fingerprint, (fingerprint % self.slots) * self.slot.size
+
+    def consume(self, key, capacity, refill_rate, cost=1):
+        fingerprint, offset = self._locate(key)
+        # Wall clock: monotonic clocks are not comparable across processes.
+        now = time.time()
+        with self._lock:
+            fcntl.lockf(self._fd, fcntl.LOCK_EX, self.slot.size, offset)
+            try:
+                owner, tokens, updated = self.slot.unpack_from(self._map, offset)
+                if owner != fingerprint:
+                    tokens, updated = capacity, now
+                tokens = refill(tokens, updated, capacity, refill_rate, now)
+                allowed = tokens >= cost
+                if allowed:
+                    tokens -= cost
+                self.slot.pack_into(self._map, offset, fingerprint, tokens, now)
+            finally:
+                fcntl.lockf(self._fd, fcntl.LOCK_UN, self.slot.size, offset)
+        return allowed, 0 if allowed else (cost - tokens) / refill_rate
+
+
+class CacheBucketStore:
+    """
+    Buckets in a Django cache, for deployments spanning several hosts.
+    The read-modify-write is not atomic, so concurrent requests from one
+    client may occasionally both be admitted.
+    """
+
+    def __init__(self, alias='default'):
+        self.cache = caches[alias]
+
+    def consume(self, key, capacity, refill_rate, cost=1):
+        now = time.time()
+        tokens, updated = self.cache.get(f'throttle:{key}', (capacity, now))
+        tokens = refill(tokens, updated, capacity, refill_rate, now)
+        allowed = tokens >= cost
+        if allowed:
+            tokens -= cost
+        # Keep the entry just long enough for the bucket to refill completely.
+        self.cache.set(f'throttle:{key}', (tokens, now), int(capacity / refill_rate) + 1)
+        return allowed, 0 if allowed else (cost - tokens) / refill_rate
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_bucket_store():
+    """Build the store selected by THROTTLE_BUCKET_STORE once per process."""
+    global _store
+    if _store is None:
+        with _store_lock:
+            if _store is None:
+                _store = build_bucket_store(getattr(settings, 'THROTTLE_BUCKET_STORE', {}))
+    return _store
+
+
+def build_bucket_store(config):
+    backend = config.get('BACKEND', 'local')
+    if backend == 'local':
+        return LocalBucketStore(config.get('MAX_KEYS', 100_000))
+    if backend == 'shared':
+        return SharedMemoryBucketStore(config['PATH'], config.get('SLOTS', 65_536))
+    if backend == 'cache':
+        return CacheBucketStore(config.get('CACHE_ALIAS', 'default'))
+    raise ImproperlyConfigured(f"Unknown THROTTLE_BUCKET_STORE backend '{backend}'")
+
+
+class TokenBucketThrottle(BaseThrottle):
+    """
+    Base class: subclasses set ``scope`` (a key of DEFAULT_THROTTLE_RATES)
+    and implement get_cache_key(), returning None to skip throttling.
+    """
+
+    scope = None
+
+    def __init__(self):
+        self.wait_seconds = None
+
+    def get_rate(self):
+        try:
+            return api_settings.DEFAULT_THROTTLE_RATES[self.scope]
+        except KeyError:
+            raise ImproperlyConfigured(f"No default throttle rate set for '{self.scope}' scope")
+
+    def get_cache_key(self, request, view):
+        raise NotImplementedError('.get_cache_key() must be overridden')
+
+    def allow_request(self, request, view):
+        rate = self.get_rate()
+        if rate is None:
+            return True
+        key = self.get_cache_key(request, view)
+        if key is None:
+            return True
+        capacity, refill_rate = parse_rate(rate)
+        allowed, self.wait_seconds = get_bucket_store().consume(
+            f'{self.scope}:{key}', capacity, refill_rate
+        )
+        return allowed
+
+    def wait(self):
+        return self.wait_seconds
+
+
+class AnonListingReadThrottle(TokenBucketThrottle):
+    """Per-IP limit on anonymous listing reads (scraping protection)."""
+
+    scope = 'listing_read_anon'
+
+    def get_cache_key(self, request, view):
+        if request.method not in permissions.SAFE_METHODS or request.user.is_authenticated:
+            return None
+        return self.get_ident(request)
+
+
+class AnonListingBatchThrottle(AnonListingReadThrottle):
+    """The anonymous read limit, for POSTs too: a batch POST only reads."""
+
+    def get_cache_key(self, request, view):
+        if request.user.is_authenticated:
+            return None
+        return self.get_ident(request)
+
+
+class UserWriteThrottle(TokenBucketThrottle):
+    """Per-user limit on writes; anonymous writers are keyed by IP."""
+
+    scope = 'user_write'
+
+    def get_cache_key(self, request, view):
+        if request.method in permissions.SAFE_METHODS:
+            return None
+        if request.user.is_authenticated:
+            return f'user:{request.user.pk}'
+        return f'ip:{self.get_ident(request)}'
+
+
+class LoginThrottle(TokenBucketThrottle):
+    """Strict per-IP limit on credential endpoints (brute-force protection)."""
+
+    scope = 'login'
+
+    def get_cache_key(self, request, view):
+        if request.method != 'POST':
+            return None
+        return self.get_ident(request)
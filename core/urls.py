@@ -1,10 +1,27 @@
+from django.conf import settings
 from django.urls import path
-from .views import CustomRegisterView, ListingListCreateView, ListingDetailView
+from .feed import listing_stream
+from .views import (
+    CustomRegisterView, ListingBatchView, ListingChangesView, ListingDetailView, ListingListCreateView,
+)
+from .profiling import ProfileDetailView, ProfileDownloadView, ProfileListView
 
 app_name = 'core'
 
+if settings.ASYNC_LISTING_READS:
+    from .async_views import listing_detail, listing_list
+else:
+    listing_list = ListingListCreateView.as_view()
+    listing_detail = ListingDetailView.as_view()
+
 urlpatterns = [
     path('auth/register/', CustomRegisterView.as_view(), name='user-register'),
-    path('listings/', ListingListCreateView.as_view(), name='listing-list-create'),
-    path('listings/<int:pk>/', ListingDetailView.as_view(), name='listing-detail'),
-]
\ No newline at end of file
+    path('listings/', listing_list, name='listing-list-create'),
+    path('listings/batch/', ListingBatchView.as_view(), name='listing-batch'),
+    path('listings/changes/', ListingChangesView.as_view(), name='listing-changes'),
+    path('listings/stream/', listing_stream, name='listing-stream'),
+    path('listings/<int:pk>/', listing_detail, name='listing-detail'),
+    path('profiles/', ProfileListView.as_view(), name='profile-list'),
+    path('profiles/<str:capture_id>/', ProfileDetailView.as_view(), name='profile-detail'),
+    path('profiles/<str:capture_id>/download/', ProfileDownloadView.as_view(), name='profile-download'),
+]
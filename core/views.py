@@ -3,6 +3,9 @@ from rest_framework.response import Response
 from rest_framework.views import APIView
 from rest_framework_simplejwt.tokens import RefreshToken
 from drf_spectacular.utils import extend_schema, OpenApiParameter, OpenApiExample
+from django.conf import settings
+from django.db import transaction
+from django.utils.functional import cached_property
 from django.contrib.auth import authenticate
 from dj_rest_auth.registration.views import RegisterView
 from .models import User, Listing
@@ -17,12 +20,21 @@ from django.urls import path, include
 from allauth.socialaccount.providers.google.views import GoogleOAuth2Adapter
 from allauth.socialaccount.providers.oauth2.client import OAuth2Client
 from dj_rest_auth.registration.views import SocialLoginView
-from rest_framework import generics, permissions, filters
+from rest_framework import exceptions, generics, permissions, filters
 from django_filters.rest_framework import DjangoFilterBackend
 from drf_spectacular.utils import extend_schema
-from .models import Listing
-from .serializers import ListingSerializer, ListingCreateUpdateSerializer
+from . import changes, listingindex
+from .cache import get_amenity_ids_by_name
+from .models import Listing, ListingSearch
+from .pagination import CountingPagination
+from .readmodel import deferred_refresh
+from .serializers import (
+    ListingBatchRequestSerializer, ListingBatchSerializer, ListingCardSerializer, ListingChangesSerializer, ListingSerializer,
+    ListingCreateUpdateSerializer,
+)
 from .permissions import IsAgentOrReadOnly
+from .throttling import AnonListingBatchThrottle, AnonListingReadThrottle, UserWriteThrottle
+from .routers import ReplicaReadMixin
 
 class GoogleLogin(SocialLoginView):
     adapter_class = GoogleOAuth2Adapter
@@ -106,10 +118,41 @@ class CustomRegisterView(RegisterView):
 
 
 
-class ListingListCreateView(generics.ListCreateAPIView):
-    queryset = Listing.objects.all().order_by('-created_at')
-    serializer_class = ListingSerializer
+def _names(value):
+    return [name.strip() for name in value.split(',') if name.strip()]
+
+
+def requested_fields(request):
+    """The ?fields= names as a set; None for every field."""
+    return set(_names(request.query_params.get('fields', ''))) or None
+
+
+class SparseFieldsViewMixin:
+    """Pass ?fields= to the serializer (serializers.SparseFieldsMixin) on reads."""
+
+    def requested_fields(self):
+        return requested_fields(self.request)
+
+    def get_serializer_context(self):
+        context = super().get_serializer_context()
+        if self.request.method in permissions.SAFE_METHODS or getattr(self, 'post_is_read', False):
+            context['fields'] = self.requested_fields()
+        return context
+
+
+FIELDS_PARAMETER = OpenApiParameter(
+    'fields', str, description='Comma-separated fields to return, e.g. `id,lodge_name,first_price`',
+)
+
+
+class ListingListCreateView(ReplicaReadMixin, SparseFieldsViewMixin, generics.ListCreateAPIView):
+    # Reads come from the listing_search read model alone (core.readmodel)
+    queryset = ListingSearch.objects.order_by('-created_at')
+    serializer_class = ListingCardSerializer
     permission_classes = [IsAgentOrReadOnly]
+    stateless_user = True  # reads are served with a token-claims user
+    throttle_classes = [AnonListingReadThrottle, UserWriteThrottle]
+    pagination_class = CountingPagination  # only when ?page= or ?page_size= is given
     filter_backends = [DjangoFilterBackend, filters.SearchFilter, filters.OrderingFilter]
     
     # Add filtering options
@@ -123,15 +166,9 @@ class ListingListCreateView(generics.ListCreateAPIView):
         'total_rooms'
     ]
     
-    # Add search functionality
-    search_fields = [
-        'lodge_name',
-        'description',
-        'room_number',
-        'agency',
-        'contact_phone',
-        'contact_email'
-    ]
+    # Add search functionality: lodge_name, description, room_number,
+    # agency, contact_phone and contact_email, copied into one column
+    search_fields = ['search_text']
     
     # Add ordering options
     ordering_fields = [
@@ -139,7 +176,8 @@ class ListingListCreateView(generics.ListCreateAPIView):
         'year_price',
         'created_at',
         'updated_at',
-        'total_rooms'
+        'total_rooms',
+        'effective_price',
     ]
     ordering = ['-created_at']  # Default ordering
     
@@ -147,11 +185,11 @@ class ListingListCreateView(generics.ListCreateAPIView):
         """Use different serializer for POST requests"""
         if self.request.method == 'POST':
             return ListingCreateUpdateSerializer
-        return ListingSerializer
+        return ListingCardSerializer
 
     @extend_schema(
         summary="List all listings",
-        description="Retrieve a list of all property listings with filtering, search and ordering options.",
+        description="Retrieve a list of all property listings with filtering, search and ordering options. Each listing is a card; the detail endpoint returns images, agent details and the remaining fields.",
         parameters=[
             {
                 'name': 'location',
@@ -208,33 +246,58 @@ class ListingListCreateView(generics.ListCreateAPIView):
                 'required': False,
                 'description': 'Filter by amenities (comma-separated amenity names)',
                 'schema': {'type': 'string'}
-            }
+            },
+            FIELDS_PARAMETER,
         ],
-        responses={200: ListingSerializer(many=True)}
+        responses={200: ListingCardSerializer(many=True)}
     )
     def get(self, request, *args, **kwargs):
-        # Apply custom filtering for amenities
-        amenities_filter = request.query_params.get('amenities')
-        if amenities_filter:
-            amenities_list = [a.strip() for a in amenities_filter.split(',') if a.strip()]
-            if amenities_list:
-                # Filter listings that have all specified amenities
-                queryset = self.get_queryset()
-                for amenity_name in amenities_list:
-                    queryset = queryset.filter(amenities__name__iexact=amenity_name)
-                queryset = queryset.distinct()
-                
-                # Apply pagination to the filtered queryset
-                page = self.paginate_queryset(queryset)
-                if page is not None:
-                    serializer = self.get_serializer(page, many=True)
-                    return self.get_paginated_response(serializer.data)
-                
-                serializer = self.get_serializer(queryset, many=True)
-                return Response(serializer.data)
-        
         return super().get(request, *args, **kwargs)
 
+    def list(self, request, *args, **kwargs):
+        rows = self.indexed_rows()
+        if rows is None:
+            return super().list(request, *args, **kwargs)
+        page = self.paginate_queryset(rows)
+        if page is not None:
+            return self.get_paginated_response(self.get_serializer(page, many=True).data)
+        serializer = self.get_serializer(rows, many=True)
+        return Response(serializer.data)
+
+    def indexed_rows(self):
+        """
+        The rows to list, from this worker's in-memory index
+        (core.listingindex), or None when LISTING_INDEX is off.
+        """
+        index = listingindex.get_index()
+        if index is None:
+            return None
+        return listingindex.query_view(index, self)
+
+    def requested_amenity_ids(self):
+        """
+        Ids of the ?amenities= names, matched case-insensitively against the
+        cached catalogue; None when one of them is not an amenity.
+        """
+        amenities_filter = self.request.query_params.get('amenities', '')
+        amenities_list = [a.strip() for a in amenities_filter.split(',') if a.strip()]
+        if not amenities_list:
+            return []
+        ids_by_name = {name.lower(): pk for name, pk in get_amenity_ids_by_name().items()}
+        amenity_ids = [ids_by_name.get(amenity_name.lower()) for amenity_name in amenities_list]
+        return None if None in amenity_ids else amenity_ids
+
+    def filter_queryset(self, queryset):
+        queryset = super().filter_queryset(queryset)
+
+        # Apply custom filtering for amenities: listings that have all of them
+        amenity_ids = self.requested_amenity_ids()
+        if amenity_ids is None:
+            return queryset.none()
+        for amenity_id in amenity_ids:
+            queryset = queryset.filter(amenity_ids__contains=f',{amenity_id},')
+        return queryset
+
     @extend_schema(
         summary="Create a new listing",
         description="Create a new property listing. Only agents can create listings.",
@@ -246,12 +309,133 @@ class ListingListCreateView(generics.ListCreateAPIView):
     
     def perform_create(self, serializer):
         """Set the agent to the current user"""
-        serializer.save(agent=self.request.user)
+        # One transaction for the listing, its amenities and images, so
+        # SQLite takes its write lock once (BEGIN IMMEDIATE) per request,
+        # and one listing_search refresh at its end. Uploads go first: the
+        # lock is not held while Cloudinary takes its time
+        serializer.upload_media(serializer.validated_data)
+        with transaction.atomic(), deferred_refresh():
+            serializer.save(agent=self.request.user)
+
+
+class ListingChangesView(APIView):
+    # Always the primary: a lagging replica would let the cursor pass
+    # changes it has not received yet, and the client would never see them
+    permission_classes = [permissions.AllowAny]
+    stateless_user = True
+    throttle_classes = [AnonListingReadThrottle]
+
+    @extend_schema(
+        summary="Listing changes since a sync token",
+        description=(
+            "Listings created or changed, and ids of listings deleted, since the `since` token, "
+            "oldest first. Call without a token to download every listing. Keep calling with "
+            "`next` while `more` is true. A token older than the tombstone retention answers 410: "
+            "start over without one."
+        ),
+        parameters=[
+            OpenApiParameter('since', str, description='`next` from the previous call'),
+            OpenApiParameter('limit', int, description='Listings (and deletions) per page, at most 500'),
+        ],
+        responses={200: ListingChangesSerializer},
+    )
+    def get(self, request):
+        config = settings.LISTING_CHANGES
+        try:
+            limit = int(request.query_params.get('limit', config['PAGE_SIZE']))
+        except ValueError:
+            raise exceptions.ValidationError({'limit': ['A valid integer is required.']})
+        limit = max(1, min(limit, config['MAX_PAGE_SIZE']))
+        page = changes.changes_since(request.query_params.get('since'), limit)
+        return Response(ListingChangesSerializer(page).data)
 
 
-class ListingDetailView(generics.RetrieveUpdateDestroyAPIView):
+class ListingBatchView(ReplicaReadMixin, SparseFieldsViewMixin, generics.GenericAPIView):
+    """
+    Many listings by id in one request, for screens that show a known set
+    (favourites, comparisons): one listing query and a prefetch per related
+    set asked for, however many ids.
+    """
     queryset = Listing.objects.all()
+    serializer_class = ListingSerializer
+    permission_classes = [permissions.AllowAny]
+    stateless_user = True
+    throttle_classes = [AnonListingBatchThrottle]
+    # POST only carries the ids in its body
+    post_is_read = True
+
+    @cached_property
+    def batch_params(self):
+        """The validated ids and fields, from the query string or the JSON body."""
+        if self.request.method == 'POST':
+            data = self.request.data
+        else:
+            params = self.request.query_params
+            data = {'ids': _names(params.get('ids', ''))}
+            if 'fields' in params:
+                data['fields'] = _names(params['fields'])
+        serializer = ListingBatchRequestSerializer(data=data)
+        serializer.is_valid(raise_exception=True)
+        return serializer.validated_data
+
+    def requested_fields(self):
+        fields = self.batch_params.get('fields')
+        return set(fields) if fields else requested_fields(self.request)
+
+    def get_queryset(self):
+        # Only the related sets the requested fields render
+        fields = self.requested_fields()
+        queryset = super().get_queryset()
+        if fields is None or 'agent_detail' in fields:
+            queryset = queryset.select_related('agent')
+        if fields is None or 'amenities' in fields:
+            queryset = queryset.prefetch_related('amenities')
+        if fields is None or fields & {'images', 'cover_image_url'}:
+            queryset = queryset.prefetch_related('images')
+        return queryset
+
+    def batch(self):
+        ids = self.batch_params['ids']
+        found = self.get_queryset().in_bulk(ids)
+        serializer = self.get_serializer([found[pk] for pk in ids if pk in found], many=True)
+        rendered = iter(serializer.data)
+        return Response({
+            'results': [next(rendered) if pk in found else {'id': pk, 'detail': 'Not found.'} for pk in ids],
+            'missing': [pk for pk in ids if pk not in found],
+        })
+
+    @extend_schema(
+        summary="Retrieve many listings",
+        description=(
+            "The listings with the given ids, in the order asked for, as the detail endpoint returns them. "
+            "An id with no listing gets `{\"id\": <id>, \"detail\": \"Not found.\"}` in its place and is "
+            "listed in `missing`."
+        ),
+        parameters=[
+            OpenApiParameter('ids', str, description='Comma-separated listing ids, e.g. `1,5,9`'),
+            FIELDS_PARAMETER,
+        ],
+        responses={200: ListingBatchSerializer},
+    )
+    def get(self, request):
+        return self.batch()
+
+    @extend_schema(
+        summary="Retrieve many listings",
+        description="As GET, with `ids` (and optionally `fields`) as lists in the JSON body.",
+        parameters=[FIELDS_PARAMETER],
+        request=ListingBatchRequestSerializer,
+        responses={200: ListingBatchSerializer},
+    )
+    def post(self, request):
+        return self.batch()
+
+
+class ListingDetailView(ReplicaReadMixin, SparseFieldsViewMixin, generics.RetrieveUpdateDestroyAPIView):
+    queryset = Listing.objects.with_related()
     permission_classes = [IsAgentOrReadOnly]
+    stateless_user = True  # reads are served with a token-claims user
+    throttle_classes = [AnonListingReadThrottle, UserWriteThrottle]
     
     def get_serializer_class(self):
         """Use different serializer for PUT/PATCH requests"""
@@ -259,9 +443,25 @@ class ListingDetailView(generics.RetrieveUpdateDestroyAPIView):
             return ListingCreateUpdateSerializer
         return ListingSerializer
 
+    def get_queryset(self):
+        # A delete serializes nothing, and the cascade collects the images
+        # itself; prefetching them would load them twice
+        if self.request.method == 'DELETE':
+            return Listing.objects.all()
+        return super().get_queryset()
+
+    def perform_update(self, serializer):
+        # The listing, its amenities and new images each signal a change;
+        # deferred_refresh() rebuilds its listing_search row once. Uploads
+        # happen before the transaction, as in perform_create
+        serializer.upload_media(serializer.validated_data)
+        with transaction.atomic(), deferred_refresh():
+            serializer.save()
+
     @extend_schema(
         summary="Retrieve a listing",
         description="Retrieve details of a specific property listing.",
+        parameters=[FIELDS_PARAMETER],
         responses={200: ListingSerializer}
     )
     def get(self, request, *args, **kwargs):
@@ -292,39 +492,3 @@ class ListingDetailView(generics.RetrieveUpdateDestroyAPIView):
     )
     def delete(self, request, *args, **kwargs):
         return super().delete(request, *args, **kwargs)
-    serializer_class = ListingSerializer
-    permission_classes = [IsAgentOrReadOnly]
-
-    @extend_schema(
-        summary="Retrieve a listing",
-        description="Get details of a specific property listing.",
-        responses={200: ListingSerializer}
-    )
-    def get(self, request, *args, **kwargs):
-        return super().get(request, *args, **kwargs)
-
-    @extend_schema(
-        summary="Update a listing",
-        description="Update a property listing. Only the agent who created it can update.",
-        request=ListingSerializer,
-        responses={200: ListingSerializer}
-    )
-    def put(self, request, *args, **kwargs):
-        return super().put(request, *args, **kwargs)
-
-    @extend_schema(
-        summary="Partially update a listing",
-        description="Partially update a property listing. Only the agent who created it can update.",
-        request=ListingSerializer,
-        responses={200: ListingSerializer}
-    )
-    def patch(self, request, *args, **kwargs):
-        return super().patch(request, *args, **kwargs)
-
-    @extend_schema(
-        summary="Delete a listing",
-        description="Delete a property listing. Only the agent who created it can delete.",
-        responses={204: None}
-    )
-    def delete(self, request, *args, **kwargs):
-        return super().delete(request, *args, **kwargs)
\ No newline at end of file
@@ -0,0 +1,205 @@
+# core/warmup.py
+"""
+Worker warm-up and health checks.
+
+A fresh worker pays on its first requests for compiling the URL resolver,
+building serializer fields, connecting to the database, loading templates
+and filling the per-process caches. warm_up() does all of that up front; the
+shipped gunicorn configs call it from post_worker_init, before the worker
+starts accepting connections, so the load balancer only ever reaches warm
+workers. Under plain uvicorn the ASGI handler warms up on lifespan startup
+instead. /readyz/ reports whether this process warmed up without errors and
+can reach the database; it never warms the worker itself, so a probe cannot
+stall on it. /healthz/ only says the process is alive.
+
+A warm-up with failed steps leaves the worker unready and runs again after
+RETRY_SECONDS, until every step passes.
+"""
+import logging
+import os
+import threading
+import time
+
+from django.conf import settings
+from django.db import DatabaseError, connection, connections
+from django.http import JsonResponse
+
+logger = logging.getLogger(__name__)
+
+# Paths requested through the application during warm-up
+WARMUP_PATHS = ['/api/listings/']
+
+# As in the gunicorn configs: False skips the warm-up on lifespan startup
+WARMUP_ON_START = os.environ.get('WARMUP_ON_START', 'True') == 'True'
+
+RETRY_SECONDS = 5
+
+# warmed: a warm-up has finished; ready: one finished with no errors
+state = {'warmed': False, 'ready': False, 'steps': {}, 'errors': {}}
+_lock = threading.Lock()
+
+
+def _resolve_urls():
+    from django.urls import get_resolver, resolve, reverse
+
+    get_resolver().url_patterns
+    for path in WARMUP_PATHS:
+        resolve(path)
+    reverse('core:listing-list-create')
+
+
+def _build_serializers():
+    from .serializers import ListingCreateUpdateSerializer, ListingSerializer, UserSerializer
+
+    for serializer_class in (ListingSerializer, ListingCreateUpdateSerializer, UserSerializer):
+        serializer_class().fields
+
+
+def _open_database():
+    # Only checks the database answers: requests are served on other threads
+    # (gthread, the ASGI thread pool), each with its own connection, so this
+    # one is closed once the warm-up is done. With DB_POOL, opening it has
+    # created the pool, which keeps its min_size connections open.
+    with connection.cursor() as cursor:
+        cursor.execute('SELECT 1')
+
+
+def _close_connections():
+    # This thread never serves a request; a connection left open here would
+    # sit idle for the worker's lifetime, holding a pooled connection too.
+    for conn in connections.all(initialized_only=True):
+        if not conn.in_atomic_block:
+            conn.close()
+
+
+def _load_templates():
+    from django.template.loader import get_template
+
+    for name in (
+        'account/email/email_confirmation_subject.txt',
+        'account/email/email_confirmation_message.txt',
+        'account/email/email_confirmation_signup_message.html',
+    ):
+        get_template(name)
+
+
+def _fill_caches():
+    from .cache import get_amenity_catalogue
+
+    get_amenity_catalogue()
+
+
+def _load_listing_index():
+    from .listingindex import get_index
+
+    # Only when LISTING_INDEX is on
+    get_index()
+
+
+def _load_schema():
+    from .schema import get_schema_document
+
+    get_schema_document()
+
+
+STEPS = [
+    ('urls', _resolve_urls),
+    ('serializers', _build_serializers),
+    ('database', _open_database),
+    ('templates', _load_templates),
+    ('caches', _fill_caches),
+    ('listing_index', _load_listing_index),
+    ('schema', _load_schema),
+]
+
+
+def _render_pages(application):
+    from .benchmarking import wsgi_environ
+
+    # One page, as a client would ask for it: the unpaginated list would
+    # render every listing
+    page_size = settings.LISTING_PAGINATION['PAGE_SIZE']
+    for path in WARMUP_PATHS:
+        statuses = []
+        environ = wsgi_environ(f'{path}?page_size={page_size}')
+        response = application(environ, lambda status, headers: statuses.append(status))
+        try:
+            b''.join(response)
+        finally:
+            response.close()
+        if not statuses[0].startswith('200'):
+            raise RuntimeError(f'{path} answered {statuses[0]}')
+
+
+def warm_up(application=None, retry_seconds=RETRY_SECONDS):
+    """
+    Run every warm-up step and render WARMUP_PATHS through ``application``
+    (a WSGI app; a path-scoped handler is built if omitted). Does nothing
+    once a warm-up has passed. A failing step is logged and recorded but
+    does not stop the others; the worker stays unready and, unless
+    ``retry_seconds`` is None, tries again in the background.
+    """
+    with _lock:
+        if state['ready']:
+            return state
+        if application is None:
+            from .handlers import get_wsgi_application
+
+            application = get_wsgi_application()
+
+        state['errors'].clear()
+        steps = STEPS + [('pages', lambda: _render_pages(application))]
+        for name, step in steps:
+            started = time.perf_counter()
+            try:
+                step()
+            except Exception as exc:
+                logger.exception('Warm-up step %s failed', name)
+                state['errors'][name] = str(exc)
+            state['steps'][name] = round((time.perf_counter() - started) * 1e3, 1)
+        _close_connections()
+
+        state['warmed'] = True
+        state['ready'] = not state['errors']
+        if state['ready']:
+            logger.info('Worker warm in %.0f ms %s', sum(state['steps'].values()), state['steps'])
+        elif retry_seconds is not None:
+            logger.warning('Worker warm-up failed (%s); retrying in %ss', ', '.join(state['errors']), retry_seconds)
+            retry = threading.Timer(retry_seconds, warm_up, [application, retry_seconds])
+            retry.daemon = True
+            retry.start()
+        return state
+
+
+def healthz(request):
+    return JsonResponse({'status': 'ok'})
+
+
+def readyz(request):
+    try:
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT 1')
+        database = 'ok'
+    except DatabaseError:
+        logger.warning('Readiness check could not reach the database', exc_info=True)
+        database = 'unreachable'
+
+    ready = state['ready'] and database == 'ok'
+    if ready:
+        status = 'ready'
+    elif database == 'ok' and not state['warmed']:
+        status = 'warming'
+    else:
+        status = 'unavailable'
+    response = JsonResponse(
+        {
+            'status': status,
+            'database': database,
+            'warmup': state['steps'],
+            'warmup_errors': state['errors'],
+        },
+        status=200 if ready else 503,
+    )
+    if not ready:
+        response['Retry-After'] = '5'
+    return response
@@ -1,52 +1,64 @@
+"""
+Manual check of amenity validation: python test_amenities.py
+
+Amenities are Amenity rows linked through Listing.amenities; the API takes
+them as ``amenity_names`` and creates names it has not seen before.
+"""
 import os
 import django
-from rest_framework import serializers
 
 # Setup Django
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'config.settings')
 django.setup()
 
-from core.models import AMENITY_CHOICES
+from rest_framework.test import APIRequestFactory
+from django.contrib.auth import get_user_model
+
+from core.models import Amenity
 from core.serializers import ListingSerializer
 
-print("--- Testing Amenity Choices ---")
 
-# Mock request and user
-from rest_framework.request import Request
-from rest_framework.test import APIRequestFactory
-from django.contrib.auth import get_user_model
-User = get_user_model()
-factory = APIRequestFactory()
-request = factory.get('/')
-request.user = User.objects.first()
-
-print(f"Amenities Choices: {[c[0] for c in AMENITY_CHOICES]}")
-
-# Test Valid Data
-valid_data = {
-    "lodge_name": "Amenity Test Lodge",
-    "description": "Test Description",
-    "price": 50000,
-    "location": "IFITE_ANAMBRA",
-    "amenities": {"WIFI", "GYM"}, # Set of choices
-    "agent": request.user.id
-}
-# Note: MultipleChoiceField accepts set or list
-
-serializer = ListingSerializer(data=valid_data, context={'request': request})
-if serializer.is_valid():
-    print("VALID data passed validation.")
-    print(f"Validated amenities: {serializer.validated_data.get('amenities')}")
-else:
-    print(f"VALID data FAILED validation: {serializer.errors}")
-
-# Test Invalid Data
-invalid_data = valid_data.copy()
-invalid_data['amenities'] = {'INVALID_CHOICE', 'WIFI'}
-
-serializer = ListingSerializer(data=invalid_data, context={'request': request})
-if not serializer.is_valid():
-    print("INVALID data correctly failed validation.")
-    print(f"Errors: {serializer.errors.get('amenities')}")
-else:
-    print("INVALID data passed validation (Unexpected!)")
+def main():
+    print("--- Testing Amenity Names ---")
+
+    # Mock request and user
+    User = get_user_model()
+    factory = APIRequestFactory()
+    request = factory.get('/')
+    request.user = User.objects.filter(is_agent=True).first()
+    if request.user is None:
+        print("No agents found. Create an agent (or run manage.py seed_bench) first.")
+        return
+
+    print(f"Known amenities: {list(Amenity.objects.values_list('name', flat=True))}")
+
+    # Test Valid Data
+    valid_data = {
+        "lodge_name": "Amenity Test Lodge",
+        "description": "Test Description",
+        "first_price": 50000,
+        "location": "IFITE_ANAMBRA",
+        "amenity_names": ["WiFi", "Gym"],
+    }
+
+    serializer = ListingSerializer(data=valid_data, context={'request': request})
+    if serializer.is_valid():
+        print("VALID data passed validation.")
+        print(f"Validated amenity names: {serializer.validated_data.get('amenity_names')}")
+    else:
+        print(f"VALID data FAILED validation: {serializer.errors}")
+
+    # Test Invalid Data
+    invalid_data = valid_data.copy()
+    invalid_data['amenity_names'] = ['x' * 101, 'WiFi']
+
+    serializer = ListingSerializer(data=invalid_data, context={'request': request})
+    if not serializer.is_valid():
+        print("INVALID data correctly failed validation.")
+        print(f"Errors: {serializer.errors.get('amenity_names')}")
+    else:
+        print("INVALID data passed validation (Unexpected!)")
+
+
+if __name__ == '__main__':
+    main()